@@ -1,17 +1,32 @@
 import os
+from contextlib import asynccontextmanager
 from typing import Dict
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import routers
-from routers import analysis, pose, segmentation, video
+from routers import analysis, jobs, pose, segmentation, video
+from worker import JOB_WORKERS, WorkerPool
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Run the processing jobs in worker processes next to the API, unless they run on their own
+    worker_pool = WorkerPool() if JOB_WORKERS == "embedded" else None
+    if worker_pool is not None:
+        worker_pool.start()
+    yield
+    if worker_pool is not None:
+        worker_pool.stop()
+
 
 # Create FastAPI app
 app = FastAPI(
     title="Squash Game Phase Detection API",
     description="API for analyzing squash videos and detecting game phases",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -35,6 +50,7 @@ app.include_router(video.router)
 app.include_router(segmentation.router)
 app.include_router(pose.router)
 app.include_router(analysis.router)
+app.include_router(jobs.router)
 
 
 @app.get("/")
@@ -0,0 +1,50 @@
+"""
+Benchmark frame extraction throughput: single ffmpeg process vs keyframe-split workers.
+
+Usage:
+    python benchmark-extract-frames.py /data/uploads/<uuid>/<uuid>.mp4 --workers 2 4 8
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from utils.video import extract_frames_parallel, extract_frames_single, find_missing_frames, probe_keyframes
+
+
+def run(name, extract, total_frames):
+    frames_dir = tempfile.mkdtemp(prefix="benchmark-frames-")
+    try:
+        start_time = time.perf_counter()
+        ok = extract(frames_dir)
+        elapsed = time.perf_counter() - start_time
+        missing = len(find_missing_frames(frames_dir, total_frames))
+    finally:
+        shutil.rmtree(frames_dir)
+    print(f"{name:>12}: {elapsed:8.2f} s  {total_frames / elapsed:8.1f} frames/s  ok={ok}  missing={missing}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    _, _, total_frames = probe_keyframes(args.video_path)
+    print(f"{args.video_path}: {total_frames} frames, {os.cpu_count()} cores")
+
+    baseline = run("single", lambda d: extract_frames_single(args.video_path, d), total_frames)
+    for workers in args.workers:
+        elapsed = run(
+            f"{workers} workers",
+            lambda d: extract_frames_parallel(args.video_path, d, workers),
+            total_frames,
+        )
+        print(f"{'':>12}  speedup {baseline / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark the main view scan: single ffmpeg process vs keyframe-aligned shards.
+
+Every sharded scan is checked against the single process scan, which must hash the same
+frames to the same hashes.
+
+Usage:
+    python benchmark-mainview.py /data/uploads/<uuid>/<uuid>.mp4 --workers 2 4 8
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from utils.preprocess import MAINVIEW_PARAMS, scan_phashes_ffmpeg, scan_phashes_sharded
+
+
+def run(name, scan):
+    start_time = time.perf_counter()
+    frame_indices, hashes, frame_count = scan()
+    elapsed = time.perf_counter() - start_time
+    print(f"{name:>12}: {elapsed:8.2f} s  {frame_count / elapsed:8.1f} frames/s  hashed={len(hashes)}")
+    return elapsed, frame_indices, hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument("--every-n-frame", type=int, default=MAINVIEW_PARAMS["every_n_frame"])
+    args = parser.parse_args()
+
+    crop_ratio = MAINVIEW_PARAMS["crop_ratio"]
+    print(f"{args.video_path}: every {args.every_n_frame} frames, {os.cpu_count()} cores")
+
+    baseline, frame_indices, hashes = run(
+        "single", lambda: scan_phashes_ffmpeg(args.video_path, args.every_n_frame, crop_ratio)
+    )
+    for workers in args.workers:
+        elapsed, sharded_indices, sharded_hashes = run(
+            f"{workers} workers",
+            lambda: scan_phashes_sharded(args.video_path, args.every_n_frame, crop_ratio, workers),
+        )
+        identical = np.array_equal(frame_indices, sharded_indices) and np.array_equal(hashes, sharded_hashes)
+        print(f"{'':>12}  speedup {baseline / elapsed:.2f}x  identical={identical}")
+
+
+if __name__ == "__main__":
+    main()
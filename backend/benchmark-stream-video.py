@@ -0,0 +1,152 @@
+"""
+Benchmark video range streaming: the previous 8 KB generator vs `utils.streaming`.
+
+Both implementations are served by uvicorn in a child process, while concurrent viewers
+request random byte ranges of the video. Reports throughput and the server CPU time spent
+per GB sent (read from /proc, Linux only).
+
+Usage:
+    python benchmark-stream-video.py /data/uploads/<uuid>/<uuid>.mp4 --viewers 1 4 16
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import re
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from utils.streaming import range_file_response
+
+
+def create_baseline_app(video_path):
+    app = FastAPI()
+
+    # The implementation of /video/stream before utils.streaming
+    @app.get("/stream")
+    async def stream(request: Request):
+        file_size = os.path.getsize(video_path)
+        range_match = re.search(r"bytes=(\d+)-(\d*)", request.headers["range"])
+        start_byte = int(range_match.group(1))
+        end_byte = int(range_match.group(2)) if range_match.group(2) else file_size - 1
+        content_length = end_byte - start_byte + 1
+
+        def iterfile_range():
+            with open(video_path, "rb") as f:
+                f.seek(start_byte)
+                remaining = content_length
+                while remaining > 0:
+                    data = f.read(min(8192, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+        return StreamingResponse(
+            iterfile_range(),
+            status_code=206,
+            media_type="video/mp4",
+            headers={
+                "Content-Range": f"bytes {start_byte}-{end_byte}/{file_size}",
+                "Content-Length": str(content_length),
+            },
+        )
+
+    return app
+
+
+def create_app(video_path):
+    app = FastAPI()
+
+    @app.get("/stream")
+    async def stream(request: Request):
+        return range_file_response(request.headers, video_path, media_type="video/mp4")
+
+    return app
+
+
+def serve(name, video_path, port):
+    app = create_baseline_app(video_path) if name == "baseline" else create_app(video_path)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    # utime and stime are the 12th and 13th fields after the command name
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run_viewers(url, file_size, viewers, requests_per_viewer, range_size):
+    sent = [0] * viewers
+
+    def viewer(i):
+        rng = random.Random(i)
+        with httpx.Client(timeout=60) as client:
+            for _ in range(requests_per_viewer):
+                start = rng.randrange(0, max(1, file_size - range_size))
+                end = min(file_size, start + range_size) - 1
+                response = client.get(url, headers={"Range": f"bytes={start}-{end}"})
+                assert response.status_code == 206 and len(response.content) == end - start + 1
+                sent[i] += len(response.content)
+
+    threads = [threading.Thread(target=viewer, args=(i,)) for i in range(viewers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(sent)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("video_path")
+    parser.add_argument("--viewers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=20, help="Range requests per viewer")
+    parser.add_argument("--range-size", type=int, default=4 * 1024 * 1024, help="Bytes per range request")
+    args = parser.parse_args()
+
+    file_size = os.path.getsize(args.video_path)
+    print(f"{args.video_path}: {file_size / 1024**2:.1f} MB, {os.cpu_count()} cores")
+
+    for name in ["baseline", "streaming"]:
+        port = free_port()
+        server = multiprocessing.Process(target=serve, args=(name, args.video_path, port), daemon=True)
+        server.start()
+        url = f"http://127.0.0.1:{port}/stream"
+        for _ in range(100):
+            try:
+                httpx.get(url, headers={"Range": "bytes=0-0"})
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+
+        for viewers in args.viewers:
+            cpu_start = cpu_seconds(server.pid)
+            start_time = time.perf_counter()
+            sent = run_viewers(url, file_size, viewers, args.requests, args.range_size)
+            elapsed = time.perf_counter() - start_time
+            cpu = cpu_seconds(server.pid) - cpu_start
+            print(
+                f"{name:>10} {viewers:3d} viewers: {sent / elapsed / 1024**2:8.1f} MB/s"
+                f"  server CPU {cpu / (sent / 1024**3):6.2f} s/GB"
+            )
+        server.terminate()
+        server.join()
+
+
+if __name__ == "__main__":
+    main()
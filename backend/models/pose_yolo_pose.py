@@ -1,4 +1,6 @@
+import functools
 import os
+import shutil
 
 import cv2
 import matplotlib.pyplot as plt
@@ -7,22 +9,39 @@ import torch
 from PIL import Image
 from ultralytics import YOLO
 
+from utils.frames import FrameStore
 from utils.pose import save_keypoints_results
+from utils.progress import advance_progress, start_progress
+
+
+@functools.lru_cache(maxsize=1)
+def load_yolo_pose_model(checkpoint: str) -> YOLO:
+    """Load the model once per worker process, later jobs reuse it"""
+    return YOLO(checkpoint)
 
 
 def run_yolo_pose_estimation(video_dir: str):
-    yolo_pose_model = YOLO("/opt/app/checkpoints/yolo11m-pose.pt")  # load an official model
+    yolo_pose_model = load_yolo_pose_model("/opt/app/checkpoints/yolo11m-pose.pt")  # load an official model
 
     # Directories
-    frame_dir = os.path.join(video_dir, "frames")
     segmentation_dir = os.path.join(video_dir, "segmentation")
     segmentation_boxes_dir = os.path.join(segmentation_dir, "results", "boxes")
     pose_dir = os.path.join(video_dir, "pose")
+    # Start from a clean directory, the previous results may be hard links shared with a
+    # duplicate upload
+    shutil.rmtree(os.path.join(pose_dir, "results"), ignore_errors=True)
 
-    frame_names = [
-        frame for frame in os.listdir(frame_dir) if os.path.splitext(frame)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
-    ]
-    frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+    # Make sure the frames with a segmentation box exist, extracting only these if needed
+    frame_store = FrameStore(video_dir)
+    box_frame_indices = set()
+    num_box_files = 0
+    for player_id in ["1", "2"]:
+        for box_file in os.listdir(os.path.join(segmentation_boxes_dir, player_id)):
+            box_frame_indices.add(int(box_file.split(".")[0]))
+            num_box_files += 1
+    frame_store.ensure_frames(box_frame_indices)
+    # One crop per player and frame
+    start_progress("pose", num_box_files)
 
     player1_pose_dir = os.path.join(pose_dir, "results", "1")
     os.makedirs(player1_pose_dir, exist_ok=True)
@@ -30,12 +49,13 @@ def run_yolo_pose_estimation(video_dir: str):
     player1_box_dir = os.path.join(segmentation_boxes_dir, "1")
     for player1_box_file in os.listdir(player1_box_dir):
         player1_box = np.load(os.path.join(player1_box_dir, player1_box_file))
+        advance_progress()
         if np.all(player1_box == 0):
             continue
         player1_x, player1_y, player1_w, player1_h = player1_box
 
         player1_frame_name = os.path.splitext(player1_box_file)[0]
-        player1_frame = cv2.imread(os.path.join(frame_dir, player1_frame_name))
+        player1_frame = frame_store.read(int(player1_frame_name.split(".")[0]))
         player1_cropped_frame = player1_frame[player1_y : player1_y + player1_h, player1_x : player1_x + player1_w]
 
         player1_pose_results = yolo_pose_model.predict(player1_cropped_frame)[0]
@@ -48,12 +68,13 @@ def run_yolo_pose_estimation(video_dir: str):
     player2_box_dir = os.path.join(segmentation_boxes_dir, "2")
     for player2_box_file in os.listdir(player2_box_dir):
         player2_box = np.load(os.path.join(player2_box_dir, player2_box_file))
+        advance_progress()
         if np.all(player2_box == 0):
             continue
         player2_x, player2_y, player2_w, player2_h = player2_box
 
         player2_frame_name = os.path.splitext(player2_box_file)[0]
-        player2_frame = cv2.imread(os.path.join(frame_dir, player2_frame_name))
+        player2_frame = frame_store.read(int(player2_frame_name.split(".")[0]))
         player2_cropped_frame = player2_frame[player2_y : player2_y + player2_h, player2_x : player2_x + player2_w]
 
         player2_pose_results = yolo_pose_model.predict(player2_cropped_frame)[0]
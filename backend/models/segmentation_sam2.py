@@ -1,3 +1,4 @@
+import functools
 import gc
 import json
 import os
@@ -8,19 +9,31 @@ import numpy as np
 import torch
 
 from sam2.build_sam import build_sam2_video_predictor
+from sam2.utils.misc import AsyncVideoFrameLoader
+from utils.chunk_planner import SAM2_IMAGE_SIZE, SEGMENTATION_STRIDE, record_chunk_memory
+from utils.decoder import open_video_frame_source
+from utils.frames import FrameStore, frame_name, strided_frame_indices
+from utils.progress import PeakMemorySampler, advance_progress, start_progress
 from utils.segmentation import MarkerInput, get_bbox_from_mask, merge_masks_and_boxes, write_segmentation_result
 
+# Where SAM2 reads its input frames from: "jpeg" reads the extracted frames through the
+# resized frame cache, "video" decodes them straight from the video file
+SAM2_FRAME_SOURCE = os.environ.get("SAM2_FRAME_SOURCE", "jpeg")
+# Whether "jpeg" reads the frames through the persistent cache of frames resized to the model
+# resolution, or streams them through the bounded prefetching loader without writing a cache
+SAM2_FRAME_CACHE = os.environ.get("SAM2_FRAME_CACHE", "1") != "0"
+
 
 def run_sam2_segmentation(video_dir: str, marker_input: list[list[MarkerInput]]):
     start_time = time.time()
-    frames_dir = os.path.join(video_dir, "frames")
     segmentation_dir = os.path.join(video_dir, "segmentation")
+    # Start from a clean directory, the previous results may be hard links shared with a
+    # duplicate upload
+    shutil.rmtree(segmentation_dir, ignore_errors=True)
+    os.makedirs(segmentation_dir, exist_ok=True)
 
-    # scan all the JPEG frame names in this directory
-    frame_names = [
-        frame for frame in os.listdir(frames_dir) if os.path.splitext(frame)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
-    ]
-    frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+    # frames are materialized on demand when they were not all extracted at upload time
+    frame_store = FrameStore(video_dir)
 
     with open(os.path.join(video_dir, "metadata.json"), "r") as f_metadata:
         metadata = json.load(f_metadata)
@@ -35,40 +48,37 @@ def run_sam2_segmentation(video_dir: str, marker_input: list[list[MarkerInput]])
         "video_height": metadata["height"],
     }
 
+    # Every 5th frame of each chunk and the marker frames, read straight from the frame store
+    # (extracting only these frames from the video if needed)
+    chunks_frame_indices = [
+        sorted(
+            set(strided_frame_indices(chunk_frames, stride=SEGMENTATION_STRIDE))
+            | {marker["frame_idx"] for marker in marker_input[chunk_idx]}
+        )
+        for chunk_idx, chunk_frames in enumerate(chunks)
+    ]
+    start_progress("segmentation", sum(len(frame_indices) for frame_indices in chunks_frame_indices))
+
     # Process each chunk
-    for chunk_idx, chunk_frames in enumerate(chunks):
+    for chunk_idx, chunk_frame_indices in enumerate(chunks_frame_indices):
         # Create a new directory for each chunk
         chunk_dir = os.path.join(segmentation_dir, f"chunk_{chunk_idx}")
         os.makedirs(chunk_dir, exist_ok=True)
-        chunk_frames_dir = os.path.join(segmentation_dir, f"chunk_{chunk_idx}", "frames")
-        os.makedirs(chunk_frames_dir, exist_ok=True)
-
-        # Create a symlink to the frames directory for each chunk
-        for chunk_frame in chunk_frames:
-            start_frame, end_frame = chunk_frame
-            for frame_idx in range(start_frame, end_frame + 1, 5):
-                frame_name = frame_names[frame_idx]
-                src_path = os.path.join(frames_dir, frame_name)
-                dst_path = os.path.join(chunk_frames_dir, frame_name)
-                shutil.copyfile(src_path, dst_path)
-        gc.collect()
 
-        chunk_frame_names = [
-            frame
-            for frame in os.listdir(chunk_dir)
-            if os.path.splitext(frame)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
-        ]
         markers = marker_input[chunk_idx]
-        markers_name_set = {marker["frame_idx"] for marker in markers}
-
-        for i in markers_name_set:
-            target_name = f"{i:06d}.jpg"
-            if target_name not in chunk_frame_names:
-                src_path = os.path.join(frames_dir, target_name)
-                dst_path = os.path.join(chunk_frames_dir, target_name)
-                shutil.copyfile(src_path, dst_path)
         gc.collect()
-        run_sam2_segmentation_chunk(chunk_dir, markers, config)
+        # Measure the peak memory of the chunk to calibrate the chunk planner
+        with PeakMemorySampler() as memory:
+            run_sam2_segmentation_chunk(chunk_dir, frame_store, chunk_frame_indices, markers, config)
+        num_objects = len({marker["player_id"] for marker in markers})
+        record_chunk_memory(
+            len(chunk_frame_indices),
+            num_objects,
+            metadata["width"],
+            metadata["height"],
+            SAM2_IMAGE_SIZE,
+            memory.peak_bytes,
+        )
 
     # merge all the masks and boxes
     merge_masks_and_boxes(segmentation_dir)
@@ -78,7 +88,18 @@ def run_sam2_segmentation(video_dir: str, marker_input: list[list[MarkerInput]])
     print(f"Total time taken: {time.time() - start_time:.2f} seconds")
 
 
-def run_sam2_segmentation_chunk(chunk_dir: str, markers: list[dict], configs: dict):
+@functools.lru_cache(maxsize=1)
+def load_sam2_predictor(model_cfg: str, sam2_checkpoint: str, device: str):
+    """
+    Build the video predictor once per worker process, later chunks and jobs reuse it (the
+    state of a video lives in its `inference_state`)
+    """
+    return build_sam2_video_predictor(model_cfg, sam2_checkpoint, device=torch.device(device))
+
+
+def run_sam2_segmentation_chunk(
+    chunk_dir: str, frame_store: FrameStore, frame_indices: list[int], markers: list[dict], configs: dict
+):
     # select the device for computation
     if torch.cuda.is_available():
         device = torch.device("cuda")
@@ -95,57 +116,83 @@ def run_sam2_segmentation_chunk(chunk_dir: str, markers: list[dict], configs: di
     video_width = configs["video_width"]
     video_height = configs["video_height"]
 
-    predictor = build_sam2_video_predictor(model_cfg, sam2_checkpoint, device=device)
+    predictor = load_sam2_predictor(model_cfg, sam2_checkpoint, device.type)
 
-    frames_dir = os.path.join(chunk_dir, "frames")
-    # scan all the JPEG frame names in this directory
-    frame_names = [
-        frame for frame in os.listdir(frames_dir) if os.path.splitext(frame)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
-    ]
-    frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+    frame_names = [frame_name(frame_idx) for frame_idx in frame_indices]
 
     if torch.cuda.is_available():
         print(f"GPU memory allocated before init: {torch.cuda.memory_allocated() / 1024**2:.2f} MB")
         print(f"GPU memory reserved before init: {torch.cuda.memory_reserved() / 1024**2:.2f} MB")
 
-    inference_state = predictor.init_state(
-        video_path=frames_dir,
-        offload_video_to_cpu=True,  # all False by default
-        offload_state_to_cpu=True,  # all False by default
-        async_loading_frames=True,  # all False by default
-    )
-    # https://github.com/facebookresearch/sam2/issues/264
-
-    predictor.reset_state(inference_state)
-
-    for marker in markers:
-        frame_idx = frame_names.index(f"{marker['frame_idx']:06d}.jpg")
-        player_id = marker["player_id"]
-        # points = marker["points"]
-        # labels = marker["labels"]
-        points = (np.array(marker["points"], dtype=np.float32) * np.array([video_width, video_height])).astype(np.int32)
-        labels = np.array(marker["labels"], dtype=np.int32)
-
-        _, out_obj_ids, out_mask_logits = predictor.add_new_points_or_box(
-            inference_state=inference_state,
-            frame_idx=frame_idx,
-            obj_id=player_id,
-            points=points,
-            labels=labels,
+    if SAM2_FRAME_SOURCE == "video":
+        # Decode the frames straight from the video, without extracting them as JPEGs
+        video_source = open_video_frame_source(frame_store, frame_indices, predictor.image_size)
+        init_state_kwargs = {"video_path": video_source}
+    else:
+        video_source = None
+        init_state_kwargs = {
+            "video_path": frame_store.frame_sources(frame_indices),
+            # Without the cache, frames are decoded by a pool of threads ahead of propagation
+            # and only a window of them is kept in memory
+            "async_loading_frames": True,  # all False by default
+        }
+        if SAM2_FRAME_CACHE:
+            # Frames resized to the model resolution are cached per video, so later chunks and
+            # re-runs with new markers skip JPEG decoding
+            init_state_kwargs["frame_cache_dir"] = os.path.join(frame_store.video_dir, "sam2_cache")
+            init_state_kwargs["frame_keys"] = frame_indices
+
+    inference_state = None
+    try:
+        inference_state = predictor.init_state(
+            offload_video_to_cpu=True,  # all False by default
+            offload_state_to_cpu=True,  # all False by default
+            **init_state_kwargs,
         )
-    gc.collect()
+        # https://github.com/facebookresearch/sam2/issues/264
+
+        predictor.reset_state(inference_state)
+
+        for marker in markers:
+            frame_idx = frame_names.index(f"{marker['frame_idx']:06d}.jpg")
+            player_id = marker["player_id"]
+            # points = marker["points"]
+            # labels = marker["labels"]
+            points = (np.array(marker["points"], dtype=np.float32) * np.array([video_width, video_height])).astype(
+                np.int32
+            )
+            labels = np.array(marker["labels"], dtype=np.int32)
+
+            _, out_obj_ids, out_mask_logits = predictor.add_new_points_or_box(
+                inference_state=inference_state,
+                frame_idx=frame_idx,
+                obj_id=player_id,
+                points=points,
+                labels=labels,
+            )
+        gc.collect()
 
-    # run propagation throughout the video and collect the results in a dict
-    video_segments = {}  # video_segments contains the per-frame segmentation results
-    for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state, reverse=True):
-        video_segments[out_frame_idx] = {
-            out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy() for i, out_obj_id in enumerate(out_obj_ids)
-        }
-    gc.collect()
-    for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state, reverse=False):
-        video_segments[out_frame_idx] = {
-            out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy() for i, out_obj_id in enumerate(out_obj_ids)
-        }
+        # run propagation throughout the video and collect the results in a dict
+        video_segments = {}  # video_segments contains the per-frame segmentation results
+        for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state, reverse=True):
+            video_segments[out_frame_idx] = {
+                out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy() for i, out_obj_id in enumerate(out_obj_ids)
+            }
+            advance_progress()
+        gc.collect()
+        # Both directions start from the first marker frame, which is counted once
+        for out_frame_idx, out_obj_ids, out_mask_logits in predictor.propagate_in_video(inference_state, reverse=False):
+            if out_frame_idx not in video_segments:
+                advance_progress()
+            video_segments[out_frame_idx] = {
+                out_obj_id: (out_mask_logits[i] > 0.0).cpu().numpy() for i, out_obj_id in enumerate(out_obj_ids)
+            }
+    finally:
+        # Stop the decoding threads (and ffmpeg process) on errors and cancellations too
+        if video_source is not None:
+            video_source.close()
+        if inference_state is not None and isinstance(inference_state["images"], AsyncVideoFrameLoader):
+            inference_state["images"].close()
     gc.collect()
 
     os.makedirs(os.path.join(chunk_dir, "masks", "1"), exist_ok=True)
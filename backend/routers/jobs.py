@@ -0,0 +1,105 @@
+import os
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from utils.jobs import (
+    JOB_EVENTS_HEADERS,
+    JOB_STAGES,
+    JOB_STATUSES,
+    cancel_job,
+    get_job,
+    job_events,
+    list_jobs,
+    set_job_priority,
+)
+from utils.repository import video_exists
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"],
+    responses={404: {"description": "Not found"}},
+)
+
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "/data/uploads")
+
+
+class JobPriorityRequest(BaseModel):
+    priority: int
+
+
+@router.get("")
+async def get_jobs(
+    video_uuid: Optional[str] = None,
+    stage: Optional[List[str]] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    List processing jobs, the running and queued ones first in the order they run, then the
+    most recent others
+    """
+    if stage and not set(stage) <= set(JOB_STAGES):
+        raise HTTPException(status_code=400, detail=f"Unknown stage, expected one of {JOB_STAGES}")
+    if status and not set(status) <= set(JOB_STATUSES):
+        raise HTTPException(status_code=400, detail=f"Unknown status, expected one of {JOB_STATUSES}")
+
+    jobs = await run_in_threadpool(list_jobs, UPLOAD_FOLDER, video_uuid, stage, status, limit)
+    return {"jobs": jobs}
+
+
+@router.get("/events/{video_uuid}")
+async def get_job_events(video_uuid: str, request: Request, stage: Optional[List[str]] = Query(None)):
+    """
+    Follow the latest job of every stage (or of `stage`) of a video as server-sent events:
+    `job` carries the job with its `progress` (step, frames done of total, fps, ETA and peak
+    memory) whenever it changes, `status` a readable summary, and `complete` and `failed` the
+    outcome of a job
+    """
+    if stage and not set(stage) <= set(JOB_STAGES):
+        raise HTTPException(status_code=400, detail=f"Unknown stage, expected one of {JOB_STAGES}")
+    if not await video_exists(os.path.join(UPLOAD_FOLDER, video_uuid)):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    return StreamingResponse(
+        job_events(UPLOAD_FOLDER, video_uuid, stage, request.is_disconnected),
+        media_type="text/event-stream",
+        headers=JOB_EVENTS_HEADERS,
+    )
+
+
+@router.get("/{job_id}")
+async def get_job_by_id(job_id: int):
+    """
+    Get a processing job
+    """
+    job = await run_in_threadpool(get_job, UPLOAD_FOLDER, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.patch("/{job_id}")
+async def update_job_priority(job_id: int, request: JobPriorityRequest):
+    """
+    Change the priority of a job, queued jobs with a higher priority run first
+    """
+    job = await run_in_threadpool(set_job_priority, UPLOAD_FOLDER, job_id, request.priority)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.delete("/{job_id}")
+async def cancel_job_by_id(job_id: int):
+    """
+    Cancel a job: a queued job is dropped, a running job is interrupted by its worker within
+    a few seconds (`cancel_requested` until then)
+    """
+    job = await run_in_threadpool(cancel_job, UPLOAD_FOLDER, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,11 +1,12 @@
-import json
 import os
 from typing import Any, Dict
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-from models.pose_yolo_pose import run_yolo_pose_estimation
+from utils.jobs import enqueue_job, latest_job, stage_status
+from utils.repository import POSE_FILENAME, has_artifact, read_artifact, video_exists
 
 router = APIRouter(
     prefix="/pose",
@@ -15,8 +16,6 @@ router = APIRouter(
 
 UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "/data/uploads")
 
-processing_videos = {}
-
 # class DetectPosesRequest(BaseModel):
 #     session_id: str
 
@@ -30,36 +29,19 @@ async def get_models():
 
 
 @router.post("/yolo_pose_v11/{video_uuid}")
-async def run_yolo_pose_v11(video_uuid: str, background_tasks: BackgroundTasks):
+async def run_yolo_pose_v11(video_uuid: str, priority: int = 0):
     """
-    Run YOLO pose detection on a video
+    Queue YOLO pose detection on a video, jobs with a higher priority run first
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    if video_uuid in processing_videos:
-        return {"status": "Processing already in progress", "video_uuid": video_uuid}
-
-    processing_videos[video_uuid] = "starting"
-
-    async def process_with_status_updates():
-        try:
-            processing_videos[video_uuid] = "processing"
-
-            run_yolo_pose_estimation(video_dir)
-
-            if video_uuid in processing_videos:
-                del processing_videos[video_uuid]
+    job = await run_in_threadpool(enqueue_job, UPLOAD_FOLDER, "pose", video_uuid, priority=priority)
+    if not job["created"]:
+        return {"status": "Processing already in progress", "video_uuid": video_uuid, "job_id": job["id"]}
 
-        except Exception as e:
-            if video_uuid in processing_videos:
-                processing_videos[video_uuid] = f"error: {str(e)}"
-            print(f"Error processing video {video_uuid}: {str(e)}")
-
-    background_tasks.add_task(process_with_status_updates)
-
-    return {"status": "started", "video_uuid": video_uuid}
+    return {"status": "started", "video_uuid": video_uuid, "job_id": job["id"]}
 
 
 @router.get("/yolo_pose_v11/{video_uuid}")
@@ -69,16 +51,13 @@ async def get_yolo_pose_v11(video_uuid: str):
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    pose_file_path = os.path.join(video_dir, "pose.json")
-    if not os.path.exists(pose_file_path):
+    data = await read_artifact(video_dir, POSE_FILENAME)
+    if data is None:
         raise HTTPException(status_code=404, detail="Pose detection result not found")
 
-    with open(pose_file_path, "r") as f:
-        data = json.load(f)
-
     return data
 
 
@@ -89,22 +68,18 @@ async def get_yolo_pose_v11_status(video_uuid: str):
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    is_processing = video_uuid in processing_videos
-    pose_file_path = os.path.join(video_dir, "pose.json")
-    has_pose = os.path.exists(pose_file_path)
-
-    status = "idle"
-    if is_processing:
-        status = processing_videos[video_uuid]
-    elif has_pose:
-        status = "completed"
+    job = await run_in_threadpool(latest_job, UPLOAD_FOLDER, "pose", video_uuid)
+    has_pose = await has_artifact(video_dir, POSE_FILENAME)
+    status = stage_status(job, has_pose)
 
     return {
         "video_uuid": video_uuid,
-        "is_processing": is_processing,
+        "is_processing": status["is_processing"],
         "has_pose": has_pose,
-        "status": status,
+        "status": status["status"],
+        "job_id": status["job_id"],
+        "progress": status["progress"],
     }
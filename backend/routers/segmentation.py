@@ -1,12 +1,13 @@
-import json
 import logging
 import os
 from typing import Any, Dict, List
 
-from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi import APIRouter, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-from models.segmentation_sam2 import run_sam2_segmentation
+from utils.jobs import enqueue_job, latest_job, stage_status
+from utils.repository import SEGMENTATION_FILENAME, has_artifact, read_artifact, video_exists
 from utils.segmentation import SegmentationRequest
 
 # Configure logging
@@ -21,8 +22,6 @@ router = APIRouter(
 
 UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "/data/uploads")
 
-processing_videos = {}
-
 
 @router.get("/models")
 async def get_models():
@@ -33,39 +32,24 @@ async def get_models():
 
 
 @router.post("/sam2/{video_uuid}")
-async def run_sam2_model(video_uuid: str, request: SegmentationRequest, background_tasks: BackgroundTasks):
+async def run_sam2_model(video_uuid: str, request: SegmentationRequest, priority: int = 0):
     """
-    Run SAM2 segmentation on the video by UUID
+    Queue SAM2 segmentation of the video by UUID, jobs with a higher priority run first
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    if not os.path.exists(os.path.join(video_dir, "frames")):
+    if not await run_in_threadpool(os.path.exists, os.path.join(video_dir, "frames")):
         raise HTTPException(status_code=404, detail="Video frames not found")
 
-    if video_uuid in processing_videos:
-        return {"status": "Processing already in progress", "video_uuid": video_uuid}
-
-    processing_videos[video_uuid] = "starting"
-
-    async def process_with_status_updates():
-        try:
-            processing_videos[video_uuid] = "processing"
-
-            await run_sam2_segmentation(video_dir, request.marker_input["marker_input"])
-
-            if video_uuid in processing_videos:
-                del processing_videos[video_uuid]
+    job = await run_in_threadpool(
+        enqueue_job, UPLOAD_FOLDER, "segmentation", video_uuid, {"marker_input": request.marker_input}, priority
+    )
+    if not job["created"]:
+        return {"status": "Processing already in progress", "video_uuid": video_uuid, "job_id": job["id"]}
 
-        except Exception as e:
-            if video_uuid in processing_videos:
-                processing_videos[video_uuid] = f"error: {str(e)}"
-            print(f"Error processing video {video_uuid}: {str(e)}")
-
-    background_tasks.add_task(process_with_status_updates)
-
-    return {"status": "started", "video_uuid": video_uuid}
+    return {"status": "started", "video_uuid": video_uuid, "job_id": job["id"]}
 
 
 @router.get("/sam2/{video_uuid}")
@@ -75,16 +59,13 @@ async def get_sam2_model_result(video_uuid: str):
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    segmentation_file_path = os.path.join(video_dir, "segmentation.json")
-    if not os.path.exists(segmentation_file_path):
+    data = await read_artifact(video_dir, SEGMENTATION_FILENAME)
+    if data is None:
         raise HTTPException(status_code=404, detail="Segmentation not found")
 
-    with open(segmentation_file_path, "r") as f:
-        data = json.load(f)
-
     return data
 
 
@@ -95,22 +76,18 @@ async def get_sam2_model_status(video_uuid: str):
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    is_processing = video_uuid in processing_videos
-    segmentation_file_path = os.path.join(video_dir, "segmentation.json")
-    has_segmentation = os.path.exists(segmentation_file_path)
-
-    status = "idle"
-    if is_processing:
-        status = processing_videos[video_uuid]
-    elif has_segmentation:
-        status = "completed"
+    job = await run_in_threadpool(latest_job, UPLOAD_FOLDER, "segmentation", video_uuid)
+    has_segmentation = await has_artifact(video_dir, SEGMENTATION_FILENAME)
+    status = stage_status(job, has_segmentation)
 
     return {
         "video_uuid": video_uuid,
-        "is_processing": is_processing,
+        "is_processing": status["is_processing"],
         "has_segmentation": has_segmentation,
-        "status": status,
+        "status": status["status"],
+        "job_id": status["job_id"],
+        "progress": status["progress"],
     }
@@ -1,15 +1,58 @@
 import json
 import os
-import re
 import shutil
+import subprocess
 import uuid
 from pathlib import Path
+from typing import List, Optional
 
-from fastapi import APIRouter, BackgroundTasks, File, HTTPException, Request, UploadFile
+from fastapi import APIRouter, File, Header, HTTPException, Query, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 
-from utils.preprocess import generate_mainview_timestamp
-from utils.video import extract_frames, get_video_info
+from utils.catalog import SORT_FIELDS, STAGES, list_videos, remove_video, update_video
+from utils.dedup import register_content, unregister_video
+from utils.frame_cache import get_frame_jpeg
+from utils.jobs import (
+    ACTIVE_STATUSES,
+    JOB_EVENTS_HEADERS,
+    cancel_video_jobs,
+    enqueue_job,
+    job_events,
+    latest_job,
+    stage_status,
+)
+from utils.preprocess import MainViewRequest
+from utils.proxy import HLS_CONTENT_TYPES, get_hls_dir, get_proxy_path, has_proxy
+from utils.repository import (
+    MAINVIEW_FILENAME,
+    METADATA_FILENAME,
+    has_artifact,
+    is_canonical_uuid,
+    read_artifact,
+    read_metadata,
+    video_exists,
+)
+from utils.streaming import etag_matches, range_file_response
+from utils.thumbnails import (
+    THUMBNAIL_INDEX_FILENAME,
+    THUMBNAIL_VTT_FILENAME,
+    delete_thumbnails,
+    get_thumbnails_dir,
+    has_thumbnails,
+)
+from utils.upload import (
+    UploadChecksumError,
+    UploadOffsetError,
+    UploadSessionRequest,
+    append_chunk,
+    create_session,
+    delete_session,
+    finalize_session,
+    read_session,
+    save_upload_file,
+)
+from utils.video import get_video_info
 
 router = APIRouter(
     prefix="/video",
@@ -20,39 +63,52 @@ router = APIRouter(
 UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "/data/uploads")
 VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".flv", ".wmv", ".webm"}
 
-# in-memory storage (database in production - future improvement)
-processing_videos = {}
-
 
 # MARK: router "/upload"
 @router.get("/upload")
-async def list_uploads():
+async def list_uploads(
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    sort: str = Query("created"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    stage: Optional[List[str]] = Query(None),
+    min_duration: Optional[float] = Query(None, ge=0),
+    max_duration: Optional[float] = Query(None, ge=0),
+    created_after: Optional[float] = None,
+    created_before: Optional[float] = None,
+):
     """
-    List all video files in the upload folder
+    List uploaded videos from the catalog, newest first by default
+
+    `stage` (repeatable) filters by the last completed processing stage, one of
+    uploaded, frames, mainview, segmentation or pose.
     """
-    files = []
+    if sort not in SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(SORT_FIELDS)}")
+    if stage and not set(stage) <= set(STAGES):
+        raise HTTPException(status_code=400, detail=f"stage must be one of {STAGES}")
+
     try:
-        for filename in os.listdir(UPLOAD_FOLDER):
-            full_path = os.path.join(UPLOAD_FOLDER, filename)
-            if os.path.isdir(full_path):
-                metadata_path = os.path.join(full_path, "metadata.json")
-                print(metadata_path)
-                with open(metadata_path, "r", encoding="UTF-8") as f:
-                    metadata = json.load(f)
-                    video_file_path = os.path.join(full_path, metadata["filename"])
-                    data = {
-                        **metadata,
-                        "size": os.path.getsize(video_file_path),
-                        "created": os.path.getctime(video_file_path),
-                    }
-                    files.append(data)
-        return {"files": files}
+        total, files = await run_in_threadpool(
+            list_videos,
+            UPLOAD_FOLDER,
+            offset=offset,
+            limit=limit,
+            sort=sort,
+            descending=order == "desc",
+            stages=stage,
+            min_duration=min_duration,
+            max_duration=max_duration,
+            created_after=created_after,
+            created_before=created_before,
+        )
+        return {"files": files, "total": total, "offset": offset, "limit": limit}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing uploads: {str(e)}")
 
 
 @router.post("/upload")
-async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
+async def upload_video(file: UploadFile = File(...)):
     """
     Upload a video file for processing
     """
@@ -60,29 +116,134 @@ async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = Fil
     if not file.content_type.startswith("video/"):
         raise HTTPException(status_code=400, detail="File must be a video")
 
-    original_video_filename = file.filename
     video_file_id = str(uuid.uuid4())
-    video_file_extension = Path(file.filename).suffix
+    video_file_path = get_video_file_path(video_file_id, file.filename)
+    os.makedirs(os.path.dirname(video_file_path), exist_ok=True)
+
+    # Save the uploaded file without blocking the event loop
+    content_hash = await save_upload_file(file, video_file_path)
+
+    return await register_uploaded_video(video_file_id, video_file_path, file.filename, file.content_type, content_hash)
+
+
+# MARK: router "/upload/sessions"
+@router.post("/upload/sessions", status_code=201)
+async def create_upload_session(request: UploadSessionRequest):
+    """
+    Start a resumable, chunked upload
+    """
+    if not request.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    if request.size <= 0:
+        raise HTTPException(status_code=400, detail="Upload size must be positive")
+
+    return await run_in_threadpool(create_session, UPLOAD_FOLDER, request.filename, request.size, request.content_type)
+
+
+@router.get("/upload/sessions/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """
+    Get the state of a resumable upload, including the last acknowledged byte offset
+    """
+    try:
+        return await run_in_threadpool(read_session, UPLOAD_FOLDER, upload_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+
+@router.put("/upload/sessions/{upload_id}")
+async def append_upload_chunk(
+    request: Request,
+    upload_id: str,
+    upload_offset: int = Header(...),
+    upload_checksum: Optional[str] = Header(None),
+):
+    """
+    Append a chunk to a resumable upload
+
+    The raw chunk is sent as the request body. `Upload-Offset` must equal the last
+    acknowledged offset; `Upload-Checksum` optionally carries the hex SHA-256 of the chunk.
+    """
+    try:
+        session = await append_chunk(UPLOAD_FOLDER, upload_id, upload_offset, request.stream(), upload_checksum)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except UploadOffsetError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Offset mismatch: expected {e.expected_offset}",
+            headers={"Upload-Offset": str(e.expected_offset)},
+        )
+    except UploadChecksumError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
 
-    # Create subdirectory for this upload
-    video_file_dir = os.path.join(UPLOAD_FOLDER, video_file_id)
-    os.makedirs(video_file_dir, exist_ok=True)
+    return {"upload_id": upload_id, "offset": session["offset"], "size": session["size"]}
 
+
+@router.post("/upload/sessions/{upload_id}/finalize")
+async def finalize_upload_session(upload_id: str):
+    """
+    Complete a resumable upload and register the video for processing
+    """
+    try:
+        session = await run_in_threadpool(read_session, UPLOAD_FOLDER, upload_id)
+        video_file_path = get_video_file_path(upload_id, session["filename"])
+        session = await run_in_threadpool(finalize_session, UPLOAD_FOLDER, upload_id, video_file_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return await register_uploaded_video(
+        upload_id,
+        video_file_path,
+        session["filename"],
+        session["content_type"],
+        session["content_hash"],
+    )
+
+
+@router.delete("/upload/sessions/{upload_id}")
+async def abort_upload_session(upload_id: str):
+    """
+    Abort a resumable upload and discard the received data
+    """
+    try:
+        await run_in_threadpool(delete_session, UPLOAD_FOLDER, upload_id)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+
+
+def get_video_file_path(video_file_id: str, original_filename: str) -> str:
+    video_file_extension = Path(original_filename).suffix
     video_filename = f"{video_file_id}{video_file_extension}"
-    video_file_path = os.path.join(video_file_dir, video_filename)
+    return os.path.join(UPLOAD_FOLDER, video_file_id, video_filename)
+
 
-    # Save the uploaded file
-    with open(video_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+async def register_uploaded_video(
+    video_file_id: str,
+    video_file_path: str,
+    original_video_filename: str,
+    content_type: str,
+    content_hash: str,
+):
+    """
+    Write the metadata of a stored upload and queue its preparation (frame extraction, then
+    proxy and thumbnails)
+    """
+    video_file_dir = os.path.dirname(video_file_path)
 
-    video_info = get_video_info(video_file_path)
+    # Probe the video off the event loop
+    video_info = await run_in_threadpool(get_video_info, video_file_path)
     # Save the metadata
     video_metadata_path = os.path.join(video_file_dir, "metadata.json")
     metadata = {
         "UUID": video_file_id,
         "original_filename": original_video_filename,
-        "filename": video_filename,
-        "content_type": file.content_type,
+        "filename": os.path.basename(video_file_path),
+        "content_type": content_type,
         # video info
         "width": video_info["width"],
         "height": video_info["height"],
@@ -90,16 +251,22 @@ async def upload_video(background_tasks: BackgroundTasks, file: UploadFile = Fil
         "total_frames": video_info["total_frames"],
         "duration_seconds": video_info["duration_seconds"],
         "codec": video_info["codec"],
+        "content_hash": content_hash,
     }
-    with open(video_metadata_path, "w", encoding="UTF-8") as f:
-        json.dump(
-            metadata,
-            f,
-            indent=2,
-        )
 
-    # Add frame extraction and main view timestamp generation as background tasks
-    background_tasks.add_task(extract_frames, video_file_path, video_file_dir)
+    def write_metadata():
+        with open(video_metadata_path, "w", encoding="UTF-8") as f:
+            json.dump(
+                metadata,
+                f,
+                indent=2,
+            )
+
+    await run_in_threadpool(write_metadata)
+    await run_in_threadpool(register_content, UPLOAD_FOLDER, content_hash, video_file_id)
+    await run_in_threadpool(update_video, UPLOAD_FOLDER, video_file_id)
+
+    await run_in_threadpool(enqueue_job, UPLOAD_FOLDER, "prepare", video_file_id)
 
     return metadata
 
@@ -111,24 +278,21 @@ async def get_upload_metadata(video_uuid: str):
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    metadata_path = os.path.join(video_dir, "metadata.json")
-    if not os.path.exists(metadata_path):
+    metadata = await read_metadata(video_dir)
+    if metadata is None:
         raise HTTPException(status_code=404, detail="Video metadata not found")
 
-    with open(metadata_path, "r", encoding="UTF-8") as f:
-        metadata = json.load(f)
-        video_file_path = os.path.join(video_dir, metadata["filename"])
-        data = {
-            **metadata,
-            "path": video_file_path,
-            "size": os.path.getsize(video_file_path),
-            "created": os.path.getctime(video_file_path),
-        }
-
-    return data
+    video_file_path = os.path.join(video_dir, metadata["filename"])
+    video_stat = await run_in_threadpool(os.stat, video_file_path)
+    return {
+        **metadata,
+        "path": video_file_path,
+        "size": video_stat.st_size,
+        "created": video_stat.st_ctime,
+    }
 
 
 @router.delete("/upload/{video_uuid}")
@@ -136,9 +300,16 @@ async def delete_upload(video_uuid: str):
     """
     Delete a video file by UUID
     """
+    # Only canonical UUIDs, anything else could point outside the upload and thumbnail folders
+    if not is_canonical_uuid(video_uuid):
+        raise HTTPException(status_code=404, detail="Video not found")
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
-    if os.path.exists(video_dir):
-        shutil.rmtree(video_dir)
+    if await video_exists(video_dir):
+        await run_in_threadpool(cancel_video_jobs, UPLOAD_FOLDER, video_uuid)
+        await run_in_threadpool(unregister_video, UPLOAD_FOLDER, video_uuid)
+        await run_in_threadpool(remove_video, UPLOAD_FOLDER, video_uuid)
+        await run_in_threadpool(shutil.rmtree, video_dir)
+        await run_in_threadpool(delete_thumbnails, video_uuid)
 
 
 # MARK: router "/stream"
@@ -151,20 +322,17 @@ async def stream_video(request: Request, video_uuid: str):
         # Find the video in the uploads folder
         video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-        if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+        if not await video_exists(video_dir):
             raise HTTPException(status_code=404, detail="Video not found")
 
         # Read metadata to get the filename
-        metadata_path = os.path.join(video_dir, "metadata.json")
-        if not os.path.exists(metadata_path):
+        metadata = await read_metadata(video_dir)
+        if metadata is None:
             raise HTTPException(status_code=404, detail="Video metadata not found")
-
-        with open(metadata_path, "r", encoding="UTF-8") as f:
-            metadata = json.load(f)
-            video_filename = metadata["filename"]
+        video_filename = metadata["filename"]
 
         video_path = os.path.join(video_dir, video_filename)
-        if not os.path.exists(video_path):
+        if not await run_in_threadpool(os.path.exists, video_path):
             raise HTTPException(status_code=404, detail="Video file not found")
 
         # Determine content type based on file extension
@@ -183,128 +351,170 @@ async def stream_video(request: Request, video_uuid: str):
         elif ext == ".wmv":
             content_type = "video/x-ms-wmv"
 
-        # Get file size
-        file_size = os.path.getsize(video_path)
+        # Ranges, conditional requests and the body transfer are handled by the response
+        return await run_in_threadpool(
+            range_file_response,
+            request.headers,
+            video_path,
+            media_type=content_type,
+            headers={"Content-Disposition": f"inline; filename={video_filename}"},
+        )
 
-        # Parse range header
-        range_header = request.headers.get("range")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error streaming video: {str(e)}")
 
-        # If no range header, return entire file
-        if range_header is None:
 
-            def iterfile():
-                with open(video_path, "rb") as f:
-                    yield from f
+# MARK: router "/proxy"
+@router.get("/proxy/{video_uuid}")
+async def stream_proxy_video(request: Request, video_uuid: str):
+    """
+    Stream the low-resolution proxy of a video, or the original video while the proxy is
+    not available. The `X-Video-Rendition` header tells which one is served.
+    """
+    video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
+    if not await run_in_threadpool(has_proxy, video_dir):
+        response = await stream_video(request, video_uuid)
+        response.headers["X-Video-Rendition"] = "original"
+        return response
+
+    return await run_in_threadpool(
+        range_file_response,
+        request.headers,
+        get_proxy_path(video_dir),
+        media_type="video/mp4",
+        headers={"X-Video-Rendition": "proxy"},
+    )
+
+
+@router.get("/hls/{video_uuid}/{filename}")
+async def get_hls_file(request: Request, video_uuid: str, filename: str):
+    """
+    Get the HLS playlist (`index.m3u8`) or a segment of the proxy of a video
+    """
+    content_type = HLS_CONTENT_TYPES.get(os.path.splitext(filename)[1])
+    if content_type is None or os.path.basename(filename) != filename:
+        raise HTTPException(status_code=404, detail="HLS file not found")
 
-            return StreamingResponse(
-                iterfile(),
-                media_type=content_type,
-                headers={
-                    "Content-Disposition": f"inline; filename={video_filename}",
-                    "Accept-Ranges": "bytes",
-                    "Content-Length": str(file_size),
-                },
-            )
+    video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
+    if not await video_exists(video_dir):
+        raise HTTPException(status_code=404, detail="Video not found")
 
-        # Parse range
-        range_match = re.search(r"bytes=(\d+)-(\d*)", range_header)
-        if not range_match:
-            raise HTTPException(status_code=416, detail="Range Not Satisfiable")
-
-        start_byte = int(range_match.group(1))
-        end_byte_str = range_match.group(2)
-        end_byte = int(end_byte_str) if end_byte_str else file_size - 1
-
-        # Validate range
-        if start_byte > end_byte or start_byte >= file_size or end_byte >= file_size:
-            raise HTTPException(status_code=416, detail="Range Not Satisfiable")
-
-        content_length = end_byte - start_byte + 1
-
-        # Create a generator to stream the requested range
-        def iterfile_range():
-            with open(video_path, "rb") as f:
-                f.seek(start_byte)
-                remaining = content_length
-                while remaining > 0:
-                    chunk_size = min(8192, remaining)  # Read in 8kb chunks
-                    data = f.read(chunk_size)
-                    if not data:
-                        break
-                    remaining -= len(data)
-                    yield data
-
-        return StreamingResponse(
-            content=iterfile_range(),
-            status_code=206,
-            media_type=content_type,
-            headers={
-                "Content-Range": f"bytes {start_byte}-{end_byte}/{file_size}",
-                "Accept-Ranges": "bytes",
-                "Content-Length": str(content_length),
-                "Content-Disposition": f"inline; filename={video_filename}",
-            },
-        )
+    hls_file_path = os.path.join(get_hls_dir(video_dir), filename)
+    if not await run_in_threadpool(has_proxy, video_dir) or not await run_in_threadpool(os.path.exists, hls_file_path):
+        raise HTTPException(status_code=404, detail="HLS file not found")
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error streaming video: {str(e)}")
+    return await run_in_threadpool(range_file_response, request.headers, hls_file_path, media_type=content_type)
+
+
+# MARK: router "/frame"
+@router.get("/frame/{video_uuid}/{frame_idx}")
+async def get_frame(
+    request: Request,
+    video_uuid: str,
+    frame_idx: int,
+    width: Optional[int] = Query(None, ge=16, le=4096),
+    quality: Optional[int] = Query(None, ge=10, le=100),
+):
+    """
+    Get a single frame of a video as JPEG, optionally scaled down to `width` pixels and
+    re-encoded with `quality`. Without either, the extracted JPEG is returned as is.
+    """
+    video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
+    if not await video_exists(video_dir) or not await has_artifact(video_dir, METADATA_FILENAME):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    try:
+        data, etag = await run_in_threadpool(get_frame_jpeg, video_dir, frame_idx, width, quality)
+    except IndexError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+        raise HTTPException(status_code=500, detail=f"Error reading frame: {str(e)}")
+
+    # A frame of an upload never changes, the URL identifies the image
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None and etag_matches(if_none_match, etag, weak=True):
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+
+# MARK: router "/thumbnails"
+@router.get("/thumbnails/{video_uuid}/{filename}")
+async def get_thumbnail_file(request: Request, video_uuid: str, filename: str):
+    """
+    Get the timeline thumbnail index (`thumbnails.vtt`, `thumbnails.json`) or a sprite sheet
+    of a video. Missing thumbnails are queued for generation.
+    """
+    if os.path.basename(filename) != filename or not filename.endswith((".vtt", ".json", ".jpg")):
+        raise HTTPException(status_code=404, detail="Thumbnail file not found")
+
+    video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
+    if not await video_exists(video_dir):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    if not await run_in_threadpool(has_thumbnails, video_uuid):
+        # Preparing the upload generates them, otherwise they are queued once until the job finishes
+        prepare_job = await run_in_threadpool(latest_job, UPLOAD_FOLDER, "prepare", video_uuid)
+        if prepare_job is None or prepare_job["status"] not in ACTIVE_STATUSES:
+            await run_in_threadpool(enqueue_job, UPLOAD_FOLDER, "thumbnails", video_uuid)
+        raise HTTPException(status_code=404, detail="Thumbnails are being generated")
+
+    thumbnail_file_path = os.path.join(get_thumbnails_dir(video_uuid), filename)
+    if not await run_in_threadpool(os.path.exists, thumbnail_file_path):
+        raise HTTPException(status_code=404, detail="Thumbnail file not found")
+
+    if filename in (THUMBNAIL_INDEX_FILENAME, THUMBNAIL_VTT_FILENAME):
+        # The index is replaced when the thumbnails are regenerated
+        media_type = "text/vtt" if filename == THUMBNAIL_VTT_FILENAME else "application/json"
+        headers = {"Cache-Control": "no-cache"}
+    else:
+        # Sprite names change with every generation
+        media_type = "image/jpeg"
+        headers = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+    return await run_in_threadpool(
+        range_file_response, request.headers, thumbnail_file_path, media_type=media_type, headers=headers
+    )
 
 
 # MARK: router "/mainview"
 @router.post("/mainview/{video_uuid}")
-async def generate_main_view(video_uuid: str, background_tasks: BackgroundTasks):
+async def generate_main_view(video_uuid: str, request: Optional[MainViewRequest] = None, priority: int = 0):
     """
-    Generate main view timestamps for a video
+    Queue main view detection for a video, optionally with user-labelled frames of the main
+    views (e.g. the `frame` of some of the `views` of an earlier result). Jobs with a higher
+    priority run first.
     """
     # Find the video in the uploads folder
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    # Check if already processing this video
-    if video_uuid in processing_videos:
-        return {"status": "Processing already in progress", "video_uuid": video_uuid}
-
     # Read metadata to get the filename
-    metadata_path = os.path.join(video_dir, "metadata.json")
-    if not os.path.exists(metadata_path):
+    metadata = await read_metadata(video_dir)
+    if metadata is None:
         raise HTTPException(status_code=404, detail="Video metadata not found")
-
-    with open(metadata_path, "r", encoding="UTF-8") as f:
-        metadata = json.load(f)
-        video_filename = metadata["filename"]
+    video_filename = metadata["filename"]
 
     video_path = os.path.join(video_dir, video_filename)
-    if not os.path.exists(video_path):
+    if not await run_in_threadpool(os.path.exists, video_path):
         raise HTTPException(status_code=404, detail="Video file not found")
 
-    # Mark as processing
-    processing_videos[video_uuid] = "starting"
-
-    # Define a wrapper function to update status and clean up after processing
-    async def process_with_status_updates():
-        try:
-            # Update status
-            processing_videos[video_uuid] = "processing"
-
-            # Add main view timestamp generation as a background task
-            await generate_mainview_timestamp(video_path, video_dir)
-
-            # Processing complete, remove from processing dict
-            if video_uuid in processing_videos:
-                del processing_videos[video_uuid]
+    reference_frames = request.reference_frames if request is not None else None
+    if reference_frames and not all(0 <= frame_idx < metadata["total_frames"] for frame_idx in reference_frames):
+        raise HTTPException(status_code=400, detail="Reference frames must be within the video")
 
-        except Exception as e:
-            # On error, update status and log error
-            if video_uuid in processing_videos:
-                processing_videos[video_uuid] = f"error: {str(e)}"
-            print(f"Error processing video {video_uuid}: {str(e)}")
-
-    # Add the wrapped task to background tasks
-    background_tasks.add_task(process_with_status_updates)
+    job = await run_in_threadpool(
+        enqueue_job, UPLOAD_FOLDER, "mainview", video_uuid, {"reference_frames": reference_frames}, priority
+    )
+    # Check if already processing this video
+    if not job["created"]:
+        return {"status": "Processing already in progress", "video_uuid": video_uuid, "job_id": job["id"]}
 
-    return {"status": "started", "video_uuid": video_uuid}
+    return {"status": "started", "video_uuid": video_uuid, "job_id": job["id"]}
 
 
 @router.get("/mainview/{video_uuid}")
@@ -314,17 +524,13 @@ async def get_main_view_timestamps(video_uuid: str):
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    mainview_file_path = os.path.join(video_dir, "mainview_timestamp.json")
-    if not os.path.exists(mainview_file_path):
+    data = await read_artifact(video_dir, MAINVIEW_FILENAME)
+    if data is None:
         raise HTTPException(status_code=404, detail="Main view timestamps not found")
 
-    # Read and parse the JSON file
-    with open(mainview_file_path, "r") as f:
-        data = json.load(f)
-
     return data
 
 
@@ -335,25 +541,38 @@ async def get_mainview_processing_status(video_uuid: str):
     """
     video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
 
-    if not os.path.exists(video_dir) or not os.path.isdir(video_dir):
+    if not await video_exists(video_dir):
         raise HTTPException(status_code=404, detail="Video not found")
 
-    # Check if the video is currently being processed
-    is_processing = video_uuid in processing_videos
+    # Check if the video is queued or being processed
+    job = await run_in_threadpool(latest_job, UPLOAD_FOLDER, "mainview", video_uuid)
 
     # Check if mainview timestamps exist
-    mainview_file_path = os.path.join(video_dir, "mainview_timestamp.json")
-    has_mainview = os.path.exists(mainview_file_path)
-
-    status = "idle"
-    if is_processing:
-        status = processing_videos[video_uuid]
-    elif has_mainview:
-        status = "completed"
+    has_mainview = await has_artifact(video_dir, MAINVIEW_FILENAME)
+    status = stage_status(job, has_mainview)
 
     return {
         "video_uuid": video_uuid,
-        "is_processing": is_processing,
+        "is_processing": status["is_processing"],
         "has_mainview": has_mainview,
-        "status": status,
+        "status": status["status"],
+        "job_id": status["job_id"],
+        "progress": status["progress"],
     }
+
+
+@router.get("/mainview/{video_uuid}/events")
+async def get_mainview_events(video_uuid: str, request: Request):
+    """
+    Server-sent events of the main view detection job of a video, see `GET /jobs/events/{video_uuid}`
+    """
+    video_dir = os.path.join(UPLOAD_FOLDER, video_uuid)
+
+    if not await video_exists(video_dir):
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    return StreamingResponse(
+        job_events(UPLOAD_FOLDER, video_uuid, ["mainview"], request.is_disconnected),
+        media_type="text/event-stream",
+        headers=JOB_EVENTS_HEADERS,
+    )
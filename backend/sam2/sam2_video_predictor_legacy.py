@@ -11,7 +11,14 @@ import torch
 from tqdm import tqdm
 
 from sam2.modeling.sam2_base import NO_OBJ_SCORE, SAM2Base
-from sam2.utils.misc import concat_points, fill_holes_in_mask_scores, load_video_frames
+from sam2.utils.misc import (
+    IMG_MEAN,
+    IMG_STD,
+    concat_points,
+    fill_holes_in_mask_scores,
+    load_video_frames,
+    normalize_video_frame,
+)
 
 
 class SAM2VideoPredictor(SAM2Base):
@@ -46,6 +53,13 @@ class SAM2VideoPredictor(SAM2Base):
         offload_video_to_cpu=False,
         offload_state_to_cpu=False,
         async_loading_frames=False,
+        frame_cache_dir=None,
+        frame_keys=None,
+        keep_aspect_ratio=False,
+        frame_loading_workers=4,
+        frame_prefetch_size=16,
+        frame_indices=None,
+        frame_stride=1,
     ):
         """Initialize an inference state."""
         compute_device = self.device  # device of the model
@@ -55,9 +69,19 @@ class SAM2VideoPredictor(SAM2Base):
             offload_video_to_cpu=offload_video_to_cpu,
             async_loading_frames=async_loading_frames,
             compute_device=compute_device,
+            frame_cache_dir=frame_cache_dir,
+            frame_keys=frame_keys,
+            keep_aspect_ratio=keep_aspect_ratio,
+            frame_loading_workers=frame_loading_workers,
+            frame_prefetch_size=frame_prefetch_size,
+            frame_indices=frame_indices,
+            frame_stride=frame_stride,
         )
         inference_state = {}
+        # the frames are stored as uint8 and normalized one at a time in `_get_image_feature`
         inference_state["images"] = images
+        inference_state["img_mean"] = torch.tensor(IMG_MEAN, dtype=torch.float32, device=compute_device)[:, None, None]
+        inference_state["img_std"] = torch.tensor(IMG_STD, dtype=torch.float32, device=compute_device)[:, None, None]
         inference_state["num_frames"] = len(images)
         # whether to offload the video frames to CPU memory
         # turning on this option saves the GPU memory with only a very small overhead
@@ -686,6 +710,10 @@ class SAM2VideoPredictor(SAM2Base):
             end_frame_idx = min(start_frame_idx + max_frame_num_to_track, num_frames - 1)
             processing_order = range(start_frame_idx, end_frame_idx + 1)
 
+        # let frame loaders that decode ahead follow the direction of propagation
+        if hasattr(inference_state["images"], "prefetch"):
+            inference_state["images"].prefetch(start_frame_idx, reverse)
+
         for frame_idx in tqdm(processing_order, desc="propagate in video"):
             # We skip those frames already in consolidated outputs (these are frames
             # that received input clicks or mask). Note that we cannot directly run
@@ -859,7 +887,10 @@ class SAM2VideoPredictor(SAM2Base):
         if backbone_out is None:
             # Cache miss -- we will run inference on a single image
             device = inference_state["device"]
-            image = inference_state["images"][frame_idx].to(device).float().unsqueeze(0)
+            image = inference_state["images"][frame_idx].to(device, non_blocking=True)
+            image = normalize_video_frame(
+                image, self.image_size, inference_state["img_mean"], inference_state["img_std"]
+            ).unsqueeze(0)
             backbone_out = self.forward_image(image)
             # Cache the most recent frame's feature (for repeated interactions with
             # a frame; we can use an LRU cache for more frames in the future).
@@ -4,9 +4,13 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import fcntl
+import json
 import os
 import warnings
-from threading import Thread
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
 
 import numpy as np
 import torch
@@ -89,21 +93,191 @@ def mask_to_box(masks: torch.Tensor):
     return bbox_coords
 
 
-def _load_img_as_tensor(img_path, image_size):
-    img_pil = Image.open(img_path)
-    img_np = np.array(img_pil.convert("RGB").resize((image_size, image_size)))
-    if img_np.dtype == np.uint8:  # np.uint8 is expected for JPEG images
-        img_np = img_np / 255.0
+# ImageNet statistics the SAM2 image encoder expects its inputs to be normalized with
+IMG_MEAN = (0.485, 0.456, 0.406)
+IMG_STD = (0.229, 0.224, 0.225)
+
+
+def get_frame_size(video_height, video_width, image_size, keep_aspect_ratio=False):
+    """
+    Size (height, width) frames are stored at: image_size x image_size, or with
+    `keep_aspect_ratio` the original aspect ratio with the longer side at most image_size.
+    """
+    if not keep_aspect_ratio:
+        return image_size, image_size
+    scale = min(1.0, image_size / max(video_height, video_width))
+    return max(1, round(video_height * scale)), max(1, round(video_width * scale))
+
+
+def normalize_video_frame(img, image_size, img_mean, img_std):
+    """
+    Turn a stored (3, H, W) uint8 frame into a (3, image_size, image_size) float32 model input,
+    resizing frames stored at their original aspect ratio and normalizing by mean and std.
+    """
+    if img.dtype == torch.uint8:
+        img = img.float() / 255.0
     else:
-        raise RuntimeError(f"Unknown image dtype: {img_np.dtype} on {img_path}")
-    img = torch.from_numpy(img_np).permute(2, 0, 1)
+        img = img.float()
+    if tuple(img.shape[-2:]) != (image_size, image_size):
+        img = torch.nn.functional.interpolate(
+            img[None], size=(image_size, image_size), mode="bicubic", align_corners=False, antialias=True
+        )[0].clamp_(0.0, 1.0)
+    return (img - img_mean) / img_std
+
+
+def _open_img(img_path):
+    if hasattr(img_path, "seek"):
+        # file-like JPEG sources may be read more than once
+        img_path.seek(0)
+    return Image.open(img_path)
+
+
+def _load_img_as_uint8(img_path, image_size, keep_aspect_ratio=False, draft=False):
+    img_pil = _open_img(img_path)
     video_width, video_height = img_pil.size  # the original video size
-    return img, video_height, video_width
+    height, width = get_frame_size(video_height, video_width, image_size, keep_aspect_ratio)
+    if draft:
+        # let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while decoding, as long as
+        # the decoded image stays at least as large as the frame size
+        img_pil.draft("RGB", (width, height))
+    img_np = np.array(img_pil.convert("RGB").resize((width, height)))
+    if img_np.dtype != np.uint8:  # np.uint8 is expected for JPEG images
+        raise RuntimeError(f"Unknown image dtype: {img_np.dtype} on {img_path}")
+    return img_np.transpose(2, 0, 1), video_height, video_width
+
+
+class ResizedFrameCache:
+    """
+    A persistent cache of video frames already resized to the model resolution.
+
+    Frames are stored as uint8 rows of shape (3, height, width) in a flat file
+    (`frames_<image_size>.u8`) that is memory-mapped for reading, and `frames_<image_size>.json`
+    maps each frame key to its row. Frames missing from the cache are decoded once and appended,
+    so later sessions on the same video skip JPEG decoding and resizing entirely.
+    """
+
+    def __init__(self, cache_dir, image_size, keep_aspect_ratio=False):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.image_size = image_size
+        self.keep_aspect_ratio = keep_aspect_ratio
+        name = f"frames_{image_size}_aspect" if keep_aspect_ratio else f"frames_{image_size}"
+        self.data_path = os.path.join(cache_dir, f"{name}.u8")
+        self.index_path = os.path.join(cache_dir, f"{name}.json")
+        self.lock_path = os.path.join(cache_dir, f"{name}.lock")
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {"keys": [], "frame_shape": None, "video_height": None, "video_width": None}
+        with open(self.index_path, "r") as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _append(self, index, keys, img_paths):
+        if index["frame_shape"] is None:
+            video_width, video_height = _open_img(img_paths[0]).size
+            height, width = get_frame_size(video_height, video_width, self.image_size, self.keep_aspect_ratio)
+            index["frame_shape"] = [3, height, width]
+        frame_bytes = int(np.prod(index["frame_shape"]))
+        with open(self.data_path, "ab") as f:
+            # drop rows written by an interrupted append that never made it into the index
+            f.truncate(len(index["keys"]) * frame_bytes)
+            with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+                frames = executor.map(
+                    lambda p: _load_img_as_uint8(p, self.image_size, self.keep_aspect_ratio), img_paths
+                )
+                for key, (img_np, video_height, video_width) in zip(
+                    keys, tqdm(frames, total=len(keys), desc="frame caching (JPEG)")
+                ):
+                    if list(img_np.shape) != index["frame_shape"]:
+                        raise RuntimeError(f"frame {key} has shape {img_np.shape}, expected {index['frame_shape']}")
+                    f.write(np.ascontiguousarray(img_np).tobytes())
+                    index["keys"].append(key)
+                    index["video_height"] = video_height
+                    index["video_width"] = video_width
+        self._write_index(index)
+
+    def load(self, frame_keys, img_paths):
+        """
+        Get the cached frames for `frame_keys`, decoding and caching missing ones from `img_paths`.
+
+        Returns the memory-mapped frames, the row of each requested frame, and the original
+        video height and width.
+        """
+        frame_keys = [str(key) for key in frame_keys]
+        with open(self.lock_path, "a") as lock_file:
+            # the same video may be cached by several sessions at once
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                index = self._read_index()
+                rows = {key: row for row, key in enumerate(index["keys"])}
+                missing = {}
+                for key, img_path in zip(frame_keys, img_paths):
+                    if key not in rows and key not in missing:
+                        missing[key] = img_path
+                if missing:
+                    self._append(index, list(missing.keys()), list(missing.values()))
+                    rows = {key: row for row, key in enumerate(index["keys"])}
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        frames = np.memmap(self.data_path, dtype=np.uint8, mode="r", shape=(len(index["keys"]), *index["frame_shape"]))
+        frame_rows = np.array([rows[key] for key in frame_keys], dtype=np.int64)
+        return frames, frame_rows, index["video_height"], index["video_width"]
+
+
+class VideoFrameSource:
+    """
+    A random-access source of video frames, such as a decoder reading the frames straight
+    from a video container, that can be passed to `init_state` as `video_path`.
+
+    Indexing returns the frame as a (3, image_size, image_size) uint8 tensor in RGB order;
+    sources are expected to buffer the frames they decode ahead.
+    """
+
+    image_size = None
+    video_height = None
+    video_width = None
+
+    def __getitem__(self, index):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+
+class Uint8VideoFrames:
+    """
+    A list of uint8 video frames selected by row from a memory map, a tensor, or a
+    `VideoFrameSource`. Frames are normalized per frame in `_get_image_feature`.
+    """
+
+    def __init__(self, frames, frame_rows):
+        self.frames = frames
+        self.frame_rows = frame_rows
+
+    def __getitem__(self, index):
+        img = self.frames[self.frame_rows[index]]
+        if isinstance(img, np.ndarray):
+            # copy the row out of the read-only memory map
+            img = torch.from_numpy(np.array(img))
+        return img
+
+    def __len__(self):
+        return len(self.frame_rows)
 
 
 class AsyncVideoFrameLoader:
     """
-    A list of video frames to be load asynchronously without blocking session start.
+    A list of video frames loaded by a pool of worker threads without blocking session start.
+
+    Frames are decoded ahead of the last accessed frame, `prefetch_size` frames in the
+    direction frames are being accessed (forward or reverse), and only the `max_cached_frames`
+    most recently used frames are kept in memory.
     """
 
     def __init__(
@@ -111,120 +285,212 @@ class AsyncVideoFrameLoader:
         img_paths,
         image_size,
         offload_video_to_cpu,
-        img_mean,
-        img_std,
         compute_device,
+        keep_aspect_ratio=False,
+        num_workers=4,
+        prefetch_size=16,
+        max_cached_frames=None,
     ):
         self.img_paths = img_paths
         self.image_size = image_size
         self.offload_video_to_cpu = offload_video_to_cpu
-        self.img_mean = img_mean
-        self.img_std = img_std
-        # items in `self.images` will be loaded asynchronously
-        self.images = [None] * len(img_paths)
-        # catch and raise any exceptions in the async loading thread
-        self.exception = None
+        self.keep_aspect_ratio = keep_aspect_ratio
+        self.compute_device = compute_device
+        self.prefetch_size = prefetch_size
+        # keep the prefetch window on both sides of the current frame by default
+        self.max_cached_frames = max_cached_frames or 2 * prefetch_size + 1
+        # decoded frames in least recently used order, and the frames being decoded
+        self.images = OrderedDict()
+        self.pending = {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, num_workers), thread_name_prefix="frame-loader")
+        self.last_index = None
+        self.reverse = False
         # video_height and video_width be filled when loading the first image
         self.video_height = None
         self.video_width = None
-        self.compute_device = compute_device
 
         # load the first frame to fill video_height and video_width and also
         # to cache it (since it's most likely where the user will click)
         self.__getitem__(0)
 
-        # load the rest of frames asynchronously without blocking the session start
-        def _load_frames():
-            try:
-                for n in tqdm(range(len(self.images)), desc="frame loading (JPEG)"):
-                    self.__getitem__(n)
-            except Exception as e:
-                self.exception = e
+    def _load_frame(self, index):
+        # JPEG frames are decoded at a reduced size when still larger than needed
+        img_np, video_height, video_width = _load_img_as_uint8(
+            self.img_paths[index], self.image_size, self.keep_aspect_ratio, draft=True
+        )
+        # frames are kept as uint8 and normalized when they are fed to the model
+        img = torch.from_numpy(img_np.copy())
+        if not self.offload_video_to_cpu:
+            img = img.to(self.compute_device, non_blocking=True)
+        with self.lock:
+            self.video_height = video_height
+            self.video_width = video_width
+            self.pending.pop(index, None)
+            self.images[index] = img
+            while len(self.images) > self.max_cached_frames:
+                self.images.popitem(last=False)
+        return img
 
-        self.thread = Thread(target=_load_frames, daemon=True)
-        self.thread.start()
+    def _submit(self, index):
+        # called with the lock held
+        future = self.pending.get(index)
+        if future is None:
+            future = self.executor.submit(self._load_frame, index)
+            self.pending[index] = future
+        return future
+
+    def prefetch(self, start_index, reverse=False):
+        """Start decoding the frames from `start_index` on, in the given direction"""
+        self.reverse = reverse
+        step = -1 if reverse else 1
+        window = [start_index + n * step for n in range(self.prefetch_size + 1)]
+        window = [index for index in window if 0 <= index < len(self.img_paths)]
+        with self.lock:
+            # drop queued frames that fell out of the window, e.g. after a change of direction
+            for index, future in list(self.pending.items()):
+                if index not in window and index != self.last_index and future.cancel():
+                    del self.pending[index]
+            for index in window:
+                if index not in self.images:
+                    self._submit(index)
 
     def __getitem__(self, index):
-        if self.exception is not None:
-            raise RuntimeError("Failure in frame loading thread") from self.exception
-
-        img = self.images[index]
-        if img is not None:
-            return img
-
-        img, video_height, video_width = _load_img_as_tensor(self.img_paths[index], self.image_size)
-        self.video_height = video_height
-        self.video_width = video_width
-        # normalize by mean and std
-        img -= self.img_mean
-        img /= self.img_std
-        if not self.offload_video_to_cpu:
-            img = img.to(self.compute_device, non_blocking=True)
-        self.images[index] = img
+        if index < 0:
+            index += len(self)
+        if self.last_index is not None and index != self.last_index:
+            self.reverse = index < self.last_index
+        self.last_index = index
+
+        with self.lock:
+            img = self.images.get(index)
+            if img is not None:
+                self.images.move_to_end(index)
+            else:
+                future = self._submit(index)
+        if img is None:
+            try:
+                img = future.result()
+            except Exception as e:
+                raise RuntimeError("Failure in frame loading thread") from e
+        self.prefetch(index + (-1 if self.reverse else 1), self.reverse)
         return img
 
     def __len__(self):
-        return len(self.images)
+        return len(self.img_paths)
+
+    def close(self):
+        """Stop the worker threads, dropping the queued and decoded frames"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        with self.lock:
+            self.pending.clear()
+            self.images.clear()
 
 
 def load_video_frames(
     video_path,
     image_size,
     offload_video_to_cpu,
-    img_mean=(0.485, 0.456, 0.406),
-    img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
     compute_device=torch.device("cuda"),
+    frame_cache_dir=None,
+    frame_keys=None,
+    keep_aspect_ratio=False,
+    frame_loading_workers=4,
+    frame_prefetch_size=16,
+    frame_indices=None,
+    frame_stride=1,
 ):
     """
     Load the video frames from video_path. The frames are resized to image_size as in
     the model and are loaded to GPU if offload_video_to_cpu=False. This is used by the demo.
+
+    Frames are returned as uint8 (3, H, W) tensors and are normalized with
+    `normalize_video_frame` when they are fed to the model. With `keep_aspect_ratio`, JPEG
+    frames keep their original aspect ratio (with the longer side at most image_size) and are
+    resized to image_size x image_size at that point too.
+
+    JPEG frames can be cached at the model resolution in `frame_cache_dir` (see
+    `ResizedFrameCache`), keyed by `frame_keys` or by their file names.
+
+    From video files, only the frames in `frame_indices` (or every `frame_stride`-th frame)
+    are loaded, and `async_loading_frames` streams them in batches as they are accessed.
     """
+    if isinstance(video_path, VideoFrameSource):
+        return load_video_frames_from_frame_source(video_path=video_path, image_size=image_size)
     is_bytes = isinstance(video_path, bytes)
     is_str = isinstance(video_path, str)
+    is_frame_list = isinstance(video_path, (list, tuple))
     is_mp4_path = is_str and os.path.splitext(video_path)[-1] in [".mp4", ".MP4"]
     if is_bytes or is_mp4_path:
         return load_video_frames_from_video_file(
             video_path=video_path,
             image_size=image_size,
             offload_video_to_cpu=offload_video_to_cpu,
-            img_mean=img_mean,
-            img_std=img_std,
             compute_device=compute_device,
+            frame_indices=frame_indices,
+            frame_stride=frame_stride,
+            stream_frames=async_loading_frames,
         )
-    elif is_str and os.path.isdir(video_path):
+    elif is_frame_list or (is_str and os.path.isdir(video_path)):
         return load_video_frames_from_jpg_images(
             video_path=video_path,
             image_size=image_size,
             offload_video_to_cpu=offload_video_to_cpu,
-            img_mean=img_mean,
-            img_std=img_std,
             async_loading_frames=async_loading_frames,
             compute_device=compute_device,
+            frame_cache_dir=frame_cache_dir,
+            frame_keys=frame_keys,
+            keep_aspect_ratio=keep_aspect_ratio,
+            frame_loading_workers=frame_loading_workers,
+            frame_prefetch_size=frame_prefetch_size,
         )
     else:
-        raise NotImplementedError("Only MP4 video and JPEG folder are supported at this moment")
+        raise NotImplementedError("Only MP4 video, JPEG folder and frame sources are supported at this moment")
 
 
 def load_video_frames_from_jpg_images(
     video_path,
     image_size,
     offload_video_to_cpu,
-    img_mean=(0.485, 0.456, 0.406),
-    img_std=(0.229, 0.224, 0.225),
     async_loading_frames=False,
     compute_device=torch.device("cuda"),
+    frame_cache_dir=None,
+    frame_keys=None,
+    keep_aspect_ratio=False,
+    frame_loading_workers=4,
+    frame_prefetch_size=16,
 ):
     """
-    Load the video frames from a directory of JPEG files ("<frame_index>.jpg" format).
+    Load the video frames from a directory of JPEG files ("<frame_index>.jpg" format), or
+    from a list of JPEG frames in frame order (file paths or file-like objects).
+
+    The frames are resized to image_size x image_size (or to the original aspect ratio with
+    `keep_aspect_ratio`), kept as uint8, and are loaded to GPU if `offload_video_to_cpu` is
+    `False` and to CPU if `offload_video_to_cpu` is `True`.
 
-    The frames are resized to image_size x image_size and are loaded to GPU if
-    `offload_video_to_cpu` is `False` and to CPU if `offload_video_to_cpu` is `True`.
+    You can load frames asynchronously by setting `async_loading_frames` to `True`. They
+    are then decoded by `frame_loading_workers` threads, `frame_prefetch_size` frames ahead
+    of the frame being read (see `AsyncVideoFrameLoader`).
 
-    You can load a frame asynchronously by setting `async_loading_frames` to `True`.
+    With `frame_cache_dir`, frames are read from a persistent uint8 cache at the model
+    resolution instead (decoding only the frames not cached yet); `async_loading_frames` is
+    then ignored. `frame_keys` names each frame in the cache and defaults to the file names
+    of the frames.
     """
-    if isinstance(video_path, str) and os.path.isdir(video_path):
+    if isinstance(video_path, (list, tuple)):
+        img_paths = list(video_path)
+        if len(img_paths) == 0:
+            raise RuntimeError("no images given in the frame list")
+    elif isinstance(video_path, str) and os.path.isdir(video_path):
         jpg_folder = video_path
+        frame_names = [
+            p for p in os.listdir(jpg_folder) if os.path.splitext(p)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]
+        ]
+        frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+        if len(frame_names) == 0:
+            raise RuntimeError(f"no images found in {jpg_folder}")
+        img_paths = [os.path.join(jpg_folder, frame_name) for frame_name in frame_names]
     else:
         raise NotImplementedError(
             "Only JPEG frames are supported at this moment. For video files, you may use "
@@ -236,68 +502,139 @@ def load_video_frames_from_jpg_images(
             "ffmpeg to start the JPEG file from 00000.jpg."
         )
 
-    frame_names = [p for p in os.listdir(jpg_folder) if os.path.splitext(p)[-1] in [".jpg", ".jpeg", ".JPG", ".JPEG"]]
-    frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
-    num_frames = len(frame_names)
-    if num_frames == 0:
-        raise RuntimeError(f"no images found in {jpg_folder}")
-    img_paths = [os.path.join(jpg_folder, frame_name) for frame_name in frame_names]
-    img_mean = torch.tensor(img_mean, dtype=torch.float32)[:, None, None]
-    img_std = torch.tensor(img_std, dtype=torch.float32)[:, None, None]
+    num_frames = len(img_paths)
+
+    if frame_cache_dir is not None:
+        if frame_keys is None:
+            if not all(isinstance(p, str) for p in img_paths):
+                raise ValueError("frame_keys are required to cache frames that are not files")
+            frame_keys = [os.path.splitext(os.path.basename(p))[0] for p in img_paths]
+        if len(frame_keys) != num_frames:
+            raise ValueError(f"got {len(frame_keys)} frame keys for {num_frames} frames")
+        frame_cache = ResizedFrameCache(frame_cache_dir, image_size, keep_aspect_ratio)
+        frames, frame_rows, video_height, video_width = frame_cache.load(frame_keys, img_paths)
+        if not offload_video_to_cpu:
+            frames = torch.from_numpy(np.array(frames[frame_rows])).to(compute_device)
+            frame_rows = np.arange(num_frames)
+        return Uint8VideoFrames(frames, frame_rows), video_height, video_width
 
     if async_loading_frames:
         lazy_images = AsyncVideoFrameLoader(
             img_paths,
             image_size,
             offload_video_to_cpu,
-            img_mean,
-            img_std,
             compute_device,
+            keep_aspect_ratio,
+            num_workers=frame_loading_workers,
+            prefetch_size=frame_prefetch_size,
         )
         return lazy_images, lazy_images.video_height, lazy_images.video_width
 
-    images = torch.zeros(num_frames, 3, image_size, image_size, dtype=torch.float32)
+    # uint8 frames take a quarter of the memory of normalized float32 frames
+    images = None
     for n, img_path in enumerate(tqdm(img_paths, desc="frame loading (JPEG)")):
-        images[n], video_height, video_width = _load_img_as_tensor(img_path, image_size)
+        img_np, video_height, video_width = _load_img_as_uint8(img_path, image_size, keep_aspect_ratio)
+        if images is None:
+            images = torch.zeros(num_frames, *img_np.shape, dtype=torch.uint8)
+        images[n] = torch.from_numpy(img_np.copy())
     if not offload_video_to_cpu:
         images = images.to(compute_device)
-        img_mean = img_mean.to(compute_device)
-        img_std = img_std.to(compute_device)
-    # normalize by mean and std
-    images -= img_mean
-    images /= img_std
     return images, video_height, video_width
 
 
+def load_video_frames_from_frame_source(video_path, image_size):
+    """
+    Load the video frames from a `VideoFrameSource`. Frames are decoded by the source when
+    they are accessed.
+    """
+    if video_path.image_size != image_size:
+        raise ValueError(f"frame source has image size {video_path.image_size}, the model expects {image_size}")
+    images = Uint8VideoFrames(video_path, np.arange(len(video_path)))
+    return images, video_path.video_height, video_path.video_width
+
+
+class DecordVideoFrames:
+    """
+    A list of video frames decoded from a video file with decord, in batches of `batch_size`
+    frames when they are first accessed. Only the `max_cached_batches` most recently used
+    batches are kept, so memory stays bounded regardless of the length of the video.
+    """
+
+    def __init__(self, video_reader, frame_indices, batch_size=16, max_cached_batches=4):
+        self.video_reader = video_reader
+        self.frame_indices = list(frame_indices)
+        self.batch_size = batch_size
+        self.max_cached_batches = max_cached_batches
+        self.batches = OrderedDict()
+        # the video reader is not thread-safe
+        self.lock = Lock()
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        batch_idx, offset = divmod(index, self.batch_size)
+        with self.lock:
+            batch = self.batches.get(batch_idx)
+            if batch is None:
+                start = batch_idx * self.batch_size
+                batch = _decode_video_frames(self.video_reader, self.frame_indices[start : start + self.batch_size])
+                self.batches[batch_idx] = batch
+                while len(self.batches) > self.max_cached_batches:
+                    self.batches.popitem(last=False)
+            else:
+                self.batches.move_to_end(batch_idx)
+        return batch[offset]
+
+    def __len__(self):
+        return len(self.frame_indices)
+
+
+def _decode_video_frames(video_reader, frame_indices, out=None):
+    # Decode frames with decord into a (N, 3, H, W) uint8 tensor, in place when `out` is given
+    frames = video_reader.get_batch(list(frame_indices)).permute(0, 3, 1, 2)
+    if out is None:
+        return frames.contiguous()
+    out.copy_(frames)
+    return out
+
+
 def load_video_frames_from_video_file(
     video_path,
     image_size,
     offload_video_to_cpu,
-    img_mean=(0.485, 0.456, 0.406),
-    img_std=(0.229, 0.224, 0.225),
     compute_device=torch.device("cuda"),
+    frame_indices=None,
+    frame_stride=1,
+    stream_frames=False,
+    batch_size=16,
 ):
-    """Load the video frames from a video file."""
+    """
+    Load the video frames from a video file.
+
+    Only the frames in `frame_indices` (or every `frame_stride`-th frame) are loaded. They
+    are decoded in batches straight into one preallocated uint8 tensor, or with
+    `stream_frames` lazily as they are accessed (see `DecordVideoFrames`).
+    """
     import decord
 
-    img_mean = torch.tensor(img_mean, dtype=torch.float32)[:, None, None]
-    img_std = torch.tensor(img_std, dtype=torch.float32)[:, None, None]
     # Get the original video height and width
     decord.bridge.set_bridge("torch")
     video_height, video_width, _ = decord.VideoReader(video_path).next().shape
-    # Iterate over all frames in the video
-    images = []
-    for frame in decord.VideoReader(video_path, width=image_size, height=image_size):
-        images.append(frame.permute(2, 0, 1))
-
-    images = torch.stack(images, dim=0).float() / 255.0
+    video_reader = decord.VideoReader(video_path, width=image_size, height=image_size)
+    if frame_indices is None:
+        frame_indices = range(0, len(video_reader), frame_stride)
+    frame_indices = list(frame_indices)
+
+    if stream_frames:
+        return DecordVideoFrames(video_reader, frame_indices, batch_size), video_height, video_width
+
+    # frames are kept as uint8 and normalized when they are fed to the model
+    images = torch.empty(len(frame_indices), 3, image_size, image_size, dtype=torch.uint8)
+    for start in tqdm(range(0, len(frame_indices), batch_size), desc="frame loading (video)"):
+        end = min(start + batch_size, len(frame_indices))
+        _decode_video_frames(video_reader, frame_indices[start:end], out=images[start:end])
     if not offload_video_to_cpu:
         images = images.to(compute_device)
-        img_mean = img_mean.to(compute_device)
-        img_std = img_std.to(compute_device)
-    # normalize by mean and std
-    images -= img_mean
-    images /= img_std
     return images, video_height, video_width
 
 
@@ -0,0 +1,159 @@
+"""
+Property tests of the chunk planner on randomized segments, budgets, strides and models
+"""
+
+import json
+import math
+import random
+
+import pytest
+
+from utils.chunk_planner import (
+    RESERVED_FRAMES,
+    MemoryModel,
+    _sampled_frames,
+    _split_segment,
+    plan_chunks,
+    validate_plan,
+)
+
+SEEDS = range(200)
+
+
+def random_segments(rng: random.Random, max_segments: int = 12, max_length: int = 3000):
+    # Sorted, disjoint inclusive ranges, single frames and adjacent segments included
+    segments = []
+    frame_idx = rng.randint(0, 100)
+    for _ in range(rng.randint(1, max_segments)):
+        length = rng.choice([1, 2, rng.randint(1, 50), rng.randint(1, max_length)])
+        segments.append((frame_idx, frame_idx + length - 1))
+        frame_idx += length + rng.choice([0, 1, rng.randint(1, 500)])
+    return segments
+
+
+def random_model(rng: random.Random) -> MemoryModel:
+    if rng.random() < 0.3:
+        return MemoryModel()
+    return MemoryModel(
+        rng.uniform(0, 4e9), rng.choice([0, rng.uniform(0.1, 6)]), rng.uniform(0.1, 2), rng.choice([0, 1])
+    )
+
+
+def random_plan_inputs(rng: random.Random):
+    segments = random_segments(rng)
+    stride = rng.randint(1, 10)
+    width, height = rng.choice([(640, 360), (1280, 720), (1920, 1080), (3840, 2160)])
+    objects = rng.randint(1, 4)
+    model = random_model(rng)
+    # Budgets from a few frames per chunk up to the whole video in one chunk
+    budget_frames = rng.choice([1, rng.randint(1, 20), rng.randint(1, 2000)]) + RESERVED_FRAMES
+    memory_budget = model.predict(budget_frames, objects, width, height) * rng.uniform(1, 1.1)
+    return segments, stride, width, height, objects, model, memory_budget
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_plan_covers_segments_within_budget(seed):
+    rng = random.Random(seed)
+    segments, stride, width, height, objects, model, memory_budget = random_plan_inputs(rng)
+    chunks = plan_chunks(segments, width, height, memory_budget, objects, stride, model=model)
+    max_frames = max(1, model.max_frames(memory_budget, objects, width, height) - RESERVED_FRAMES)
+
+    # Checked independently of `plan_chunks`, which validates its own plans
+    validate_plan(segments, chunks, stride, max_frames)
+    for chunk in chunks:
+        chunk_frames = sum(_sampled_frames(*frame_range, stride) for frame_range in chunk)
+        assert chunk_frames <= max_frames
+        if max_frames > 1:
+            assert model.predict(chunk_frames + RESERVED_FRAMES, objects, width, height) <= memory_budget
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_plan_keeps_segments_whole_unless_too_large(seed):
+    rng = random.Random(seed)
+    segments, stride, width, height, objects, model, memory_budget = random_plan_inputs(rng)
+    chunks = plan_chunks(segments, width, height, memory_budget, objects, stride, model=model)
+    max_frames = max(1, model.max_frames(memory_budget, objects, width, height) - RESERVED_FRAMES)
+    ranges = [frame_range for chunk in chunks for frame_range in chunk]
+
+    for start_frame, end_frame in segments:
+        pieces = [(start, end) for start, end in ranges if start_frame <= start and end <= end_frame]
+        num_sampled = _sampled_frames(start_frame, end_frame, stride)
+        assert len(pieces) == math.ceil(num_sampled / max_frames)
+        # Pieces start on the stride of the segment, so the same frames are sampled
+        assert all((start - start_frame) % stride == 0 for start, _ in pieces)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_split_segment_balances_pieces(seed):
+    rng = random.Random(seed)
+    start_frame = rng.randint(0, 1000)
+    end_frame = start_frame + rng.randint(0, 5000)
+    stride = rng.randint(1, 10)
+    max_frames = rng.randint(1, 300)
+
+    pieces = _split_segment(start_frame, end_frame, stride, max_frames)
+    sizes = [_sampled_frames(*piece, stride) for piece in pieces]
+    assert pieces[0][0] == start_frame and pieces[-1][1] == end_frame
+    assert all(a[1] + 1 == b[0] for a, b in zip(pieces, pieces[1:]))
+    assert max(sizes) <= max_frames and max(sizes) - min(sizes) <= 1
+    assert sum(sizes) == _sampled_frames(start_frame, end_frame, stride)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_max_frames_is_the_largest_fit(seed):
+    rng = random.Random(seed)
+    model = random_model(rng)
+    objects = rng.randint(1, 4)
+    width, height = rng.randint(64, 4096), rng.randint(64, 4096)
+    memory_budget = rng.uniform(0, 1e11)
+
+    max_frames = model.max_frames(memory_budget, objects, width, height)
+    assert isinstance(max_frames, int) and max_frames >= 0
+    assert model.predict(max_frames + 1, objects, width, height) > memory_budget
+    if max_frames > 0:
+        assert model.predict(max_frames, objects, width, height) <= memory_budget * (1 + 1e-9)
+
+
+@pytest.mark.parametrize("coefficients", [(1e9, 0, 0, 0), (0, 0, 0, 0), (1e9, -1, 1, 1), (-1, 3, 0.75, 1)])
+def test_degenerate_models_are_rejected(coefficients):
+    with pytest.raises(ValueError):
+        MemoryModel(*coefficients)
+
+
+def test_load_ignores_degenerate_models(tmp_path):
+    path = tmp_path / "model.json"
+    path.write_text(json.dumps(dict(zip(MemoryModel.FIELDS, [1e9, 0, 0, 0]))))
+    assert MemoryModel.load(str(path)).to_dict() == MemoryModel().to_dict()
+
+
+def test_max_frames_rejects_models_without_per_frame_memory():
+    # Memory of the objects only, nothing grows with the frames of a chunk without objects
+    model = MemoryModel(1e9, 0, 0.75, 1)
+    with pytest.raises(ValueError):
+        model.max_frames(1e10, 0, 1920, 1080)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_fit_recovers_the_model_of_the_records(seed):
+    rng = random.Random(seed)
+    true_model = MemoryModel(rng.uniform(5e8, 3e9), rng.uniform(1, 6), rng.uniform(0.1, 2), rng.uniform(0.5, 2))
+    records = []
+    for _ in range(40):
+        frames, objects = rng.randint(1, 2000), rng.randint(1, 4)
+        width, height = rng.choice([(640, 360), (1280, 720), (1920, 1080)])
+        peak_bytes = true_model.predict(frames, objects, width, height)
+        records.append(
+            dict(frames=frames, objects=objects, width=width, height=height, image_size=1024, peak_bytes=peak_bytes)
+        )
+
+    fitted = MemoryModel.fit(records)
+    for record in records:
+        predicted = fitted.predict(record["frames"], record["objects"], record["width"], record["height"])
+        assert predicted == pytest.approx(record["peak_bytes"], rel=1e-3)
+
+
+def test_fit_rejects_records_without_growth():
+    # Chunks of a single size cannot tell the per-frame memory from the base memory
+    records = [dict(frames=0, objects=2, width=1920, height=1080, image_size=1024, peak_bytes=2e9)] * 5
+    with pytest.raises(ValueError):
+        MemoryModel.fit(records)
@@ -0,0 +1,42 @@
+"""
+Reuse of the frames of duplicate uploads
+"""
+
+import json
+
+from utils.dedup import link_duplicate_artifacts, register_content
+from utils.video import FRAMES_COMPLETE_MARKER, write_frames_marker
+
+SOURCE_UUID = "00000000-0000-4000-8000-000000000001"
+VIDEO_UUID = "00000000-0000-4000-8000-000000000002"
+
+
+def make_upload(upload_folder, video_uuid):
+    video_dir = upload_folder / video_uuid
+    (video_dir / "frames").mkdir(parents=True)
+    metadata = dict(UUID=video_uuid, filename="video.mp4", content_hash="hash")
+    (video_dir / "metadata.json").write_text(json.dumps(metadata))
+    (video_dir / "video.mp4").write_bytes(b"video")
+    register_content(str(upload_folder), "hash", video_uuid)
+    return video_dir
+
+
+def test_frames_are_reused_when_extracted_with_the_same_options(tmp_path):
+    source_dir = make_upload(tmp_path, SOURCE_UUID)
+    (source_dir / "frames" / "000000.jpg").write_bytes(b"frame")
+    write_frames_marker(str(source_dir / "frames"))
+    video_dir = make_upload(tmp_path, VIDEO_UUID)
+
+    assert link_duplicate_artifacts(str(tmp_path), str(video_dir))["frames"]
+    assert (video_dir / "frames" / "000000.jpg").read_bytes() == b"frame"
+
+
+def test_frames_of_older_extractions_are_not_reused(tmp_path):
+    # Markers written before the output options were recorded are empty
+    source_dir = make_upload(tmp_path, SOURCE_UUID)
+    (source_dir / "frames" / "000000.jpg").write_bytes(b"frame")
+    (source_dir / "frames" / FRAMES_COMPLETE_MARKER).write_text("")
+    video_dir = make_upload(tmp_path, VIDEO_UUID)
+
+    assert not link_duplicate_artifacts(str(tmp_path), str(video_dir))["frames"]
+    assert not (video_dir / "frames" / "000000.jpg").exists()
@@ -0,0 +1,29 @@
+"""
+Keyframe tables shared by the frame stores of a video
+"""
+
+import os
+
+import utils.frames as frames
+
+
+def test_keyframes_are_probed_once_per_video_file(tmp_path, monkeypatch):
+    probes = []
+
+    def probe_keyframes(video_path):
+        probes.append(video_path)
+        return [0.0, 2.0], [0, 60], 90
+
+    monkeypatch.setattr(frames, "probe_keyframes", probe_keyframes)
+    video_path = tmp_path / "video.mp4"
+    video_path.write_bytes(b"video")
+
+    assert frames.get_keyframes(str(video_path)) == ([0.0, 2.0], [0, 60])
+    assert frames.get_keyframes(str(video_path)) == ([0.0, 2.0], [0, 60])
+    assert len(probes) == 1
+
+    # A replaced upload at the same path is probed again
+    video_path.write_bytes(b"another video")
+    os.utime(video_path, ns=(0, 0))
+    frames.get_keyframes(str(video_path))
+    assert len(probes) == 2
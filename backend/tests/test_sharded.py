@@ -0,0 +1,79 @@
+"""
+Cancellation of sharded ffmpeg runs, which wait on child processes started from other threads
+"""
+
+import signal
+import subprocess
+import threading
+import time
+
+import pytest
+
+from utils.video import ProcessGroup, run_sharded
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def interrupt_main_thread():
+    # Same interruption as the heartbeat of a cancelled job: a SIGINT to the main thread
+    def raise_interrupted(signum, frame):
+        raise Interrupted()
+
+    previous = signal.signal(signal.SIGINT, raise_interrupted)
+    main_thread_id = threading.main_thread().ident
+    timers = []
+
+    def interrupt(delay: float):
+        timer = threading.Timer(delay, signal.pthread_kill, (main_thread_id, signal.SIGINT))
+        timers.append(timer)
+        timer.start()
+
+    yield interrupt
+    for timer in timers:
+        timer.cancel()
+    signal.signal(signal.SIGINT, previous)
+
+
+def test_interrupt_kills_the_shards(interrupt_main_thread):
+    groups = []
+
+    def sleep(shard: int, processes: ProcessGroup):
+        groups.append(processes)
+        return processes.popen(["sleep", "10"]).wait()
+
+    interrupt_main_thread(0.5)
+    started = time.monotonic()
+    with pytest.raises(Interrupted):
+        run_sharded(sleep, range(4))
+    assert time.monotonic() - started < 2
+
+    processes = groups[0].processes
+    assert len(processes) == 4
+    for process in processes:
+        assert process.wait(timeout=2) != 0
+    with pytest.raises(RuntimeError):
+        groups[0].popen(["true"])
+
+
+def test_failed_shard_kills_the_others():
+    def run(shard: int, processes: ProcessGroup):
+        if shard == 0:
+            processes.popen(["sleep", "0.2"]).wait()
+            raise subprocess.CalledProcessError(1, "ffmpeg")
+        return processes.popen(["sleep", "10"]).wait()
+
+    started = time.monotonic()
+    with pytest.raises(subprocess.CalledProcessError):
+        run_sharded(run, range(3))
+    assert time.monotonic() - started < 2
+
+
+def test_results_keep_the_order_of_the_shards():
+    def run(shard: int, processes: ProcessGroup):
+        processes.popen(["sleep", str(0.1 * (3 - shard))]).wait()
+        return shard
+
+    assert run_sharded(run, range(4)) == [0, 1, 2, 3]
@@ -0,0 +1,261 @@
+"""
+Catalog Utilities
+
+Utility functions for the catalog of uploaded videos.
+
+The catalog (`<UPLOAD_FOLDER>/.catalog.sqlite3`) holds one row per upload with its metadata,
+file size, creation time and processing stage, so listing uploads is a single indexed query
+instead of reading every `metadata.json` and stating every video file. Rows are updated
+when a video is uploaded, finishes a processing stage or is deleted. The catalog is only an
+index of the upload directories and can be rebuilt from them at any time, under a file lock
+(`.catalog.lock`) shared by the server and the workers:
+
+    python -m utils.catalog /data/uploads
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import sqlite3
+from contextlib import closing, contextmanager
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from utils.framepack import has_frame_pack
+from utils.video import FRAMES_COMPLETE_MARKER
+
+CATALOG_FILENAME = ".catalog.sqlite3"
+CATALOG_LOCK_FILENAME = ".catalog.lock"
+
+# Processing stages in pipeline order, a video is at the last stage it completed
+STAGES = ["uploaded", "frames", "mainview", "segmentation", "pose"]
+SORT_FIELDS = {"created", "duration_seconds", "size", "original_filename", "total_frames"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    uuid TEXT PRIMARY KEY,
+    original_filename TEXT,
+    duration_seconds REAL,
+    total_frames INTEGER,
+    size INTEGER,
+    created REAL,
+    stage TEXT,
+    metadata TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_created ON videos (created);
+CREATE INDEX IF NOT EXISTS videos_stage ON videos (stage, created);
+CREATE INDEX IF NOT EXISTS videos_duration ON videos (duration_seconds);
+"""
+
+
+def _catalog_path(upload_folder: str) -> str:
+    return os.path.join(upload_folder, CATALOG_FILENAME)
+
+
+def _connect(upload_folder: str, path: Optional[str] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or _catalog_path(upload_folder), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+@contextmanager
+def _build_lock(upload_folder: str):
+    # Serializes building the catalog across threads and worker processes, the lock is
+    # released when the file is closed
+    with open(os.path.join(upload_folder, CATALOG_LOCK_FILENAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def _ensure_catalog(upload_folder: str):
+    # Build the catalog from the upload directories the first time it is used. The catalog
+    # file only appears once it is complete, so it is enough to check that it exists
+    if os.path.exists(_catalog_path(upload_folder)):
+        return
+    with _build_lock(upload_folder):
+        if not os.path.exists(_catalog_path(upload_folder)):
+            _rebuild_catalog(upload_folder)
+
+
+def get_stage(video_dir: str) -> str:
+    """Last processing stage completed by a video"""
+    if os.path.exists(os.path.join(video_dir, "pose.json")):
+        return "pose"
+    if os.path.exists(os.path.join(video_dir, "segmentation.json")):
+        return "segmentation"
+    if os.path.exists(os.path.join(video_dir, "mainview_timestamp.json")):
+        return "mainview"
+    if os.path.exists(os.path.join(video_dir, "frames", FRAMES_COMPLETE_MARKER)) or has_frame_pack(video_dir):
+        return "frames"
+    return "uploaded"
+
+
+def read_video_entry(video_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Read the catalog entry of an upload directory
+
+    Returns:
+        Metadata with the size, creation time and stage of the video, or None if the
+        directory holds no complete upload
+    """
+    metadata_path = os.path.join(video_dir, "metadata.json")
+    try:
+        with open(metadata_path, "r", encoding="UTF-8") as f:
+            metadata = json.load(f)
+        video_stat = os.stat(os.path.join(video_dir, metadata["filename"]))
+    except (OSError, ValueError, KeyError):
+        return None
+    return {
+        **metadata,
+        "size": video_stat.st_size,
+        "created": video_stat.st_ctime,
+        "stage": get_stage(video_dir),
+    }
+
+
+def _upsert(conn: sqlite3.Connection, entry: Dict[str, Any]):
+    conn.execute(
+        "INSERT OR REPLACE INTO videos"
+        " (uuid, original_filename, duration_seconds, total_frames, size, created, stage, metadata)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            entry["UUID"],
+            entry.get("original_filename"),
+            entry.get("duration_seconds"),
+            entry.get("total_frames"),
+            entry["size"],
+            entry["created"],
+            entry["stage"],
+            json.dumps(entry),
+        ),
+    )
+
+
+def update_video(upload_folder: str, video_uuid: str):
+    """Re-read an upload directory into the catalog, removing it if it is gone"""
+    _ensure_catalog(upload_folder)
+    entry = read_video_entry(os.path.join(upload_folder, video_uuid))
+    with closing(_connect(upload_folder)) as conn, conn:
+        if entry is None:
+            conn.execute("DELETE FROM videos WHERE uuid = ?", (video_uuid,))
+        else:
+            _upsert(conn, entry)
+
+
+def remove_video(upload_folder: str, video_uuid: str):
+    """Remove a video from the catalog"""
+    _ensure_catalog(upload_folder)
+    with closing(_connect(upload_folder)) as conn, conn:
+        conn.execute("DELETE FROM videos WHERE uuid = ?", (video_uuid,))
+
+
+def rebuild_catalog(upload_folder: str) -> int:
+    """
+    Rescan the upload folder and replace the content of the catalog
+
+    Returns:
+        Number of videos in the catalog
+    """
+    with _build_lock(upload_folder):
+        return _rebuild_catalog(upload_folder)
+
+
+def _rebuild_catalog(upload_folder: str) -> int:
+    entries = []
+    for filename in os.listdir(upload_folder):
+        # Skip internal folders such as incomplete upload sessions
+        video_dir = os.path.join(upload_folder, filename)
+        if filename.startswith(".") or not os.path.isdir(video_dir):
+            continue
+        entry = read_video_entry(video_dir)
+        if entry is not None:
+            entries.append(entry)
+
+    catalog_path = _catalog_path(upload_folder)
+    if os.path.exists(catalog_path):
+        # Replaced in a single transaction, readers see either the old or the new content
+        with closing(_connect(upload_folder)) as conn, conn:
+            conn.execute("DELETE FROM videos")
+            for entry in entries:
+                _upsert(conn, entry)
+        return len(entries)
+
+    # A new catalog is filled under a temporary name and renamed, so it is never read half built
+    build_path = f"{catalog_path}.build"
+    for path in [build_path, f"{build_path}-wal", f"{build_path}-shm"]:
+        if os.path.exists(path):
+            os.remove(path)
+    with closing(_connect(upload_folder, build_path)) as conn, conn:
+        for entry in entries:
+            _upsert(conn, entry)
+    os.replace(build_path, catalog_path)
+    return len(entries)
+
+
+def list_videos(
+    upload_folder: str,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    sort: str = "created",
+    descending: bool = True,
+    stages: Optional[Sequence[str]] = None,
+    min_duration: Optional[float] = None,
+    max_duration: Optional[float] = None,
+    created_after: Optional[float] = None,
+    created_before: Optional[float] = None,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Query the catalog
+
+    Args:
+        upload_folder: Upload folder of the catalog
+        offset: Number of matching videos to skip
+        limit: Maximum number of videos to return, all if None
+        sort: Field to sort by, one of `SORT_FIELDS`
+        descending: Sort in descending order
+        stages: Only include videos at one of these processing stages
+        min_duration: Minimum duration in seconds
+        max_duration: Maximum duration in seconds
+        created_after: Minimum creation time (Unix timestamp)
+        created_before: Maximum creation time (Unix timestamp)
+
+    Returns:
+        Total number of matching videos and the requested page of them
+    """
+    if sort not in SORT_FIELDS:
+        raise ValueError(f"Cannot sort by {sort}, expected one of {sorted(SORT_FIELDS)}")
+
+    conditions, params = [], []
+    if stages:
+        conditions.append(f"stage IN ({', '.join('?' for _ in stages)})")
+        params.extend(stages)
+    for column, operator, value in [
+        ("duration_seconds", ">=", min_duration),
+        ("duration_seconds", "<=", max_duration),
+        ("created", ">=", created_after),
+        ("created", "<=", created_before),
+    ]:
+        if value is not None:
+            conditions.append(f"{column} {operator} ?")
+            params.append(value)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    _ensure_catalog(upload_folder)
+    with closing(_connect(upload_folder)) as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM videos{where}", params).fetchone()[0]
+        # The UUID breaks ties, so pages are stable
+        rows = conn.execute(
+            f"SELECT metadata FROM videos{where} ORDER BY {sort} {'DESC' if descending else 'ASC'}, uuid"
+            " LIMIT ? OFFSET ?",
+            [*params, -1 if limit is None else limit, offset],
+        ).fetchall()
+    return total, [json.loads(row["metadata"]) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the catalog of uploaded videos from the upload directories")
+    parser.add_argument("upload_folder", nargs="?", default=os.environ.get("UPLOAD_FOLDER", "/data/uploads"))
+    args = parser.parse_args()
+    print(f"Catalogued {rebuild_catalog(args.upload_folder)} videos in {_catalog_path(args.upload_folder)}")
@@ -0,0 +1,308 @@
+"""
+Chunk Planner Utilities
+
+Planning of the chunks SAM2 segments a video in.
+
+SAM2 keeps every input frame of a chunk and the per-frame state of every tracked object in
+memory until the chunk is done, and the masks collected from it are held at the video
+resolution. The peak memory of a chunk therefore grows with the number of sampled frames,
+the number of objects and both resolutions. `plan_chunks` packs the main view segments into
+chunks whose peak memory, predicted by a `MemoryModel`, fits a budget, keeping segments
+whole unless a segment alone exceeds the budget (markers are placed per chunk, and SAM2
+only tracks within a chunk).
+
+The default model is an estimate derived from the tensor sizes SAM2 keeps per frame, it has
+not been calibrated against measured runs and no measurements ship with the repository. Every
+segmentation run appends the measured peak memory of its chunks to `SAM2_MEMORY_LOG`, and
+
+    python -m utils.chunk_planner /data/sam2_memory.jsonl
+
+fits the model to these records and writes it to `SAM2_MEMORY_MODEL`, which later plans use.
+"""
+
+import argparse
+import json
+import math
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.optimize
+
+# Segmentation samples every 5th frame of a chunk
+SEGMENTATION_STRIDE = 5
+# Input resolution of the SAM2 model (`image_size` of the model config)
+SAM2_IMAGE_SIZE = 1024
+# Number of objects (players) tracked per chunk
+SAM2_OBJECTS = 2
+# Frames a chunk may hold besides its sampled frames (marker frames off the stride)
+RESERVED_FRAMES = 10
+# Peak memory allowed per chunk in bytes, 0 for half of the physical memory
+SAM2_MEMORY_BUDGET = int(os.environ.get("SAM2_MEMORY_BUDGET", 0))
+# Measured peak memory of segmented chunks, one JSON record per line
+SAM2_MEMORY_LOG = os.environ.get("SAM2_MEMORY_LOG", "/data/sam2_memory.jsonl")
+# Calibrated memory model, see `MemoryModel.fit`
+SAM2_MEMORY_MODEL = os.environ.get("SAM2_MEMORY_MODEL", "/data/sam2_memory_model.json")
+
+
+def default_memory_budget() -> int:
+    if SAM2_MEMORY_BUDGET > 0:
+        return SAM2_MEMORY_BUDGET
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+
+
+class MemoryModel:
+    """
+    Linear model of the peak memory of a chunk
+
+        peak = base + frames * (frame_pixel * image_size^2
+                                 + objects * (object_pixel * image_size^2 + object_video_pixel * width * height))
+
+    The defaults count the uint8 RGB input frames (3 bytes per model pixel), the offloaded
+    per-object state of a frame (memory features of 64 bfloat16 channels at 1/16 and a
+    float32 mask at 1/4 of the model resolution, 0.75 bytes per model pixel) and the boolean
+    mask per object kept at the video resolution, on top of the model and runtime.
+
+    Raises:
+        ValueError: If a coefficient is negative or memory does not grow with the frames, such
+            a model would put any number of frames into a chunk
+    """
+
+    FIELDS = ["base_bytes", "frame_pixel_bytes", "object_pixel_bytes", "object_video_pixel_bytes"]
+
+    def __init__(
+        self,
+        base_bytes: float = 1.5e9,
+        frame_pixel_bytes: float = 3.0,
+        object_pixel_bytes: float = 0.75,
+        object_video_pixel_bytes: float = 1.0,
+    ):
+        self.base_bytes = base_bytes
+        self.frame_pixel_bytes = frame_pixel_bytes
+        self.object_pixel_bytes = object_pixel_bytes
+        self.object_video_pixel_bytes = object_video_pixel_bytes
+        if min(self.coefficients()) < 0 or max(self.coefficients()[1:]) <= 0:
+            raise ValueError(f"Degenerate memory model {self.to_dict()}, the per-frame memory must be positive")
+
+    @staticmethod
+    def features(frames: int, objects: int, width: int, height: int, image_size: int) -> List[float]:
+        model_pixels = image_size * image_size
+        return [1.0, frames * model_pixels, frames * objects * model_pixels, frames * objects * width * height]
+
+    def coefficients(self) -> List[float]:
+        return [getattr(self, field) for field in self.FIELDS]
+
+    def predict(self, frames: int, objects: int, width: int, height: int, image_size: int = SAM2_IMAGE_SIZE) -> float:
+        """Predicted peak memory in bytes of a chunk of `frames` frames"""
+        return float(np.dot(self.coefficients(), self.features(frames, objects, width, height, image_size)))
+
+    def max_frames(
+        self, memory_budget: float, objects: int, width: int, height: int, image_size: int = SAM2_IMAGE_SIZE
+    ) -> int:
+        """Largest number of frames whose predicted peak memory fits the budget"""
+        frame_bytes = self.predict(1, objects, width, height, image_size) - self.base_bytes
+        if frame_bytes <= 0:
+            raise ValueError(f"Memory model {self.to_dict()} predicts no memory per frame for {objects} objects")
+        return max(0, int((memory_budget - self.base_bytes) // frame_bytes))
+
+    def to_dict(self) -> Dict[str, float]:
+        return dict(zip(self.FIELDS, self.coefficients()))
+
+    @classmethod
+    def load(cls, path: str = SAM2_MEMORY_MODEL) -> "MemoryModel":
+        """Load a calibrated model, the default model if there is none or it is degenerate"""
+        try:
+            with open(path, "r", encoding="UTF-8") as f:
+                coefficients = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        try:
+            return cls(**{field: coefficients[field] for field in cls.FIELDS if field in coefficients})
+        except ValueError as e:
+            print(f"Ignoring the memory model in {path}: {e}")
+            return cls()
+
+    @classmethod
+    def fit(cls, records: Sequence[Dict[str, Any]]) -> "MemoryModel":
+        """
+        Fit the model to measured chunks with non-negative least squares, relative to the
+        peak so that small and large chunks weigh alike
+
+        Args:
+            records: Measured chunks with `frames`, `objects`, `width`, `height`, `image_size`
+                and `peak_bytes`, see `record_chunk_memory`
+
+        Raises:
+            ValueError: If there are no records, or they do not show memory growing with the
+                frames (e.g. all chunks have the same size)
+        """
+        if not records:
+            raise ValueError("No memory records to fit")
+        features = np.array(
+            [cls.features(r["frames"], r["objects"], r["width"], r["height"], r["image_size"]) for r in records]
+        )
+        peaks = np.array([r["peak_bytes"] for r in records], dtype=np.float64)
+        coefficients, _ = scipy.optimize.nnls(features / peaks[:, None], np.ones(len(records)))
+        return cls(*coefficients.tolist())
+
+
+def _sampled_frames(start_frame: int, end_frame: int, stride: int) -> int:
+    # Number of frames of an inclusive range segmentation samples, see `strided_frame_indices`
+    return len(range(start_frame, end_frame + 1, stride))
+
+
+def _split_segment(start_frame: int, end_frame: int, stride: int, max_frames: int) -> List[Tuple[int, int]]:
+    # Split a segment into the fewest pieces of at most `max_frames` sampled frames, of similar
+    # length and starting on the stride of the segment, so the same frames are sampled
+    num_sampled = _sampled_frames(start_frame, end_frame, stride)
+    num_pieces = math.ceil(num_sampled / max_frames)
+    starts = [start_frame + (piece * num_sampled // num_pieces) * stride for piece in range(num_pieces)]
+    ends = [start - 1 for start in starts[1:]] + [end_frame]
+    return list(zip(starts, ends))
+
+
+def plan_chunks(
+    segments: Sequence[Tuple[int, int]],
+    width: int,
+    height: int,
+    memory_budget: Optional[float] = None,
+    objects: int = SAM2_OBJECTS,
+    stride: int = SEGMENTATION_STRIDE,
+    image_size: int = SAM2_IMAGE_SIZE,
+    model: Optional[MemoryModel] = None,
+) -> List[List[Tuple[int, int]]]:
+    """
+    Pack segments into chunks whose predicted peak memory fits a budget
+
+    Segments are taken in order and added whole to the current chunk while it has room,
+    otherwise they start a new chunk. Only a segment that alone exceeds the budget is split,
+    into pieces of similar length.
+
+    Args:
+        segments: Inclusive (start frame, end frame) ranges in order
+        width: Width of the video
+        height: Height of the video
+        memory_budget: Peak memory allowed per chunk in bytes, see `default_memory_budget`
+        objects: Number of tracked objects
+        stride: Segmentation samples every `stride`-th frame of a range
+        image_size: Input resolution of the SAM2 model
+        model: Memory model, the calibrated model (or the default one) if None
+
+    Returns:
+        Chunks as lists of inclusive (start frame, end frame) ranges
+    """
+    if model is None:
+        model = MemoryModel.load()
+    if memory_budget is None:
+        memory_budget = default_memory_budget()
+    max_frames = model.max_frames(memory_budget, objects, width, height, image_size) - RESERVED_FRAMES
+    if max_frames < 1:
+        print(f"Memory budget of {memory_budget / 1e9:.1f} GB is too small for SAM2, planning single-frame chunks")
+        max_frames = 1
+
+    chunks = []
+    current_chunk = []
+    current_frames = 0
+    for start_frame, end_frame in segments:
+        for piece in _split_segment(start_frame, end_frame, stride, max_frames):
+            piece_frames = _sampled_frames(*piece, stride)
+            if current_chunk and current_frames + piece_frames > max_frames:
+                chunks.append(current_chunk)
+                current_chunk, current_frames = [], 0
+            current_chunk.append(piece)
+            current_frames += piece_frames
+    if current_chunk:
+        chunks.append(current_chunk)
+
+    validate_plan(segments, chunks, stride, max_frames)
+    return chunks
+
+
+def validate_plan(
+    segments: Sequence[Tuple[int, int]], chunks: Sequence[Sequence[Tuple[int, int]]], stride: int, max_frames: int
+):
+    """
+    Check that chunks cover exactly the frames of the segments in order, sample the same
+    frames and hold at most `max_frames` sampled frames each
+
+    Raises:
+        ValueError: If the plan breaks one of these properties
+    """
+    ranges = [tuple(frame_range) for chunk in chunks for frame_range in chunk]
+    if any(not chunk for chunk in chunks):
+        raise ValueError("Empty chunk")
+    if any(start > end for start, end in ranges) or any(a[1] >= b[0] for a, b in zip(ranges, ranges[1:])):
+        raise ValueError("Chunk ranges are empty, overlap or are out of order")
+
+    def frame_sets(frame_ranges, stride):
+        covered, sampled = set(), set()
+        for start_frame, end_frame in frame_ranges:
+            covered.update(range(start_frame, end_frame + 1))
+            sampled.update(range(start_frame, end_frame + 1, stride))
+        return covered, sampled
+
+    if frame_sets(ranges, stride) != frame_sets(segments, stride):
+        raise ValueError("Chunks do not cover or sample the same frames as the segments")
+    for chunk in chunks:
+        if sum(_sampled_frames(*frame_range, stride) for frame_range in chunk) > max_frames:
+            raise ValueError(f"Chunk {chunk} holds more than {max_frames} sampled frames")
+
+
+def predict_chunk_memory(
+    chunks: Sequence[Sequence[Tuple[int, int]]],
+    width: int,
+    height: int,
+    objects: int = SAM2_OBJECTS,
+    stride: int = SEGMENTATION_STRIDE,
+    image_size: int = SAM2_IMAGE_SIZE,
+    model: Optional[MemoryModel] = None,
+) -> List[int]:
+    """Predicted peak memory in bytes of every chunk"""
+    if model is None:
+        model = MemoryModel.load()
+    return [
+        int(model.predict(sum(_sampled_frames(*r, stride) for r in chunk), objects, width, height, image_size))
+        for chunk in chunks
+    ]
+
+
+def record_chunk_memory(frames: int, objects: int, width: int, height: int, image_size: int, peak_bytes: int):
+    """Append the measured peak memory of a segmented chunk to `SAM2_MEMORY_LOG`"""
+    record = {
+        "frames": frames,
+        "objects": objects,
+        "width": width,
+        "height": height,
+        "image_size": image_size,
+        "peak_bytes": peak_bytes,
+    }
+    try:
+        os.makedirs(os.path.dirname(SAM2_MEMORY_LOG) or ".", exist_ok=True)
+        with open(SAM2_MEMORY_LOG, "a", encoding="UTF-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        print(f"Could not record chunk memory: {e}")
+
+
+def read_memory_records(path: str = SAM2_MEMORY_LOG) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="UTF-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the SAM2 chunk memory model to measured segmentation runs")
+    parser.add_argument("records", nargs="?", default=SAM2_MEMORY_LOG)
+    parser.add_argument("--output", default=SAM2_MEMORY_MODEL)
+    args = parser.parse_args()
+
+    records = read_memory_records(args.records)
+    model = MemoryModel.fit(records)
+    for record in records:
+        predicted = model.predict(
+            record["frames"], record["objects"], record["width"], record["height"], record["image_size"]
+        )
+        error = predicted / record["peak_bytes"] - 1
+        print(f"{record['frames']:>6} frames  {record['peak_bytes'] / 1e9:7.2f} GB  predicted {error:+.1%}")
+    with open(args.output, "w", encoding="UTF-8") as f:
+        json.dump(model.to_dict(), f, indent=2)
+    print(f"Fitted {len(records)} records: {model.to_dict()} -> {args.output}")
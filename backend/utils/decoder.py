@@ -0,0 +1,183 @@
+"""
+Decoder Utilities
+
+Random-access decoding of video frames straight from the uploaded container.
+
+`VideoDecoderFrameSource` serves a fixed list of frame indices (e.g. every 5th frame of a
+main view chunk) at the SAM2 input resolution. Frames are decoded by ffmpeg from the
+nearest keyframe before them and piped as raw RGB, so no JPEG is written or decoded. A
+background thread decodes up to `FRAME_DECODE_AHEAD` frames ahead of the last requested
+frame; a request outside that window restarts decoding at the requested frame, or at the
+block of frames before it when frames are requested in reverse order.
+"""
+
+import bisect
+import os
+import subprocess
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import torch
+
+from sam2.utils.misc import VideoFrameSource
+from utils.frames import FrameStore, group_frame_runs
+
+# Number of frames decoded ahead of the last requested frame
+FRAME_DECODE_AHEAD = int(os.environ.get("FRAME_DECODE_AHEAD", 32))
+
+
+class VideoDecoderFrameSource(VideoFrameSource):
+    """
+    Frames of a video decoded on demand, resized to image_size x image_size
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        frame_indices: Sequence[int],
+        image_size: int,
+        keyframes: Tuple[List[float], List[int]],
+        video_height: int,
+        video_width: int,
+        buffer_size: int = FRAME_DECODE_AHEAD,
+    ):
+        self.video_path = video_path
+        self.frame_indices = list(frame_indices)
+        if self.frame_indices != sorted(set(self.frame_indices)):
+            raise ValueError("frame_indices must be sorted and unique")
+        self.image_size = image_size
+        self.video_height = video_height
+        self.video_width = video_width
+        self.buffer_size = max(1, buffer_size)
+
+        keyframes = sorted(set(zip(keyframes[1], keyframes[0])))
+        if not keyframes or keyframes[0][0] != 0:
+            # The first frame is not a keyframe we know of, decoding must start at the beginning
+            keyframes = [(0, 0.0)] + keyframes
+        self._keyframe_indices = [keyframe_idx for keyframe_idx, _ in keyframes]
+        self._keyframe_times = [keyframe_time for _, keyframe_time in keyframes]
+
+        # Decoded frames by position in frame_indices, shared with the decoding thread
+        self._frames: Dict[int, torch.Tensor] = {}
+        self._cond = threading.Condition()
+        self._consumed = 0
+        self._generation = 0
+        self._next = 0
+        self._end = 0
+        self._exception: Optional[BaseException] = None
+        with self._cond:
+            self._restart(0, len(self.frame_indices))
+
+    def __len__(self):
+        return len(self.frame_indices)
+
+    def __getitem__(self, index) -> torch.Tensor:
+        index = int(index)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"frame {index} out of range")
+
+        with self._cond:
+            backwards = index < self._consumed
+            self._consumed = index
+            self._cond.notify_all()
+            while index not in self._frames:
+                if self._exception is not None:
+                    raise RuntimeError("Failure in video decoding thread") from self._exception
+                if not (self._next <= index < self._end and index - self._next <= self.buffer_size):
+                    if backwards:
+                        self._restart(max(0, index - self.buffer_size + 1), index + 1)
+                    else:
+                        self._restart(index, len(self))
+                self._cond.wait()
+            return self._frames[index]
+
+    def close(self):
+        """Stop the decoding thread and drop the buffered frames"""
+        with self._cond:
+            self._generation += 1
+            self._next = self._end = 0
+            self._frames.clear()
+            self._cond.notify_all()
+
+    def _restart(self, start: int, end: int):
+        # Called with the lock held; the running decoder exits once it sees the new generation
+        self._generation += 1
+        self._next = start
+        self._end = end
+        thread = threading.Thread(target=self._decode, args=(self._generation, start, end), daemon=True)
+        thread.start()
+
+    def _store(self, position: int, frame: torch.Tensor):
+        self._frames[position] = frame
+        # Drop the frames furthest from the reader beyond twice the decode-ahead window
+        while len(self._frames) > 2 * self.buffer_size + 1:
+            del self._frames[max(self._frames, key=lambda p: abs(p - self._consumed))]
+
+    def _open_run(self, start_frame: int, stride: int, count: int) -> subprocess.Popen:
+        k = bisect.bisect_right(self._keyframe_indices, start_frame) - 1
+        keyframe_idx, keyframe_time = self._keyframe_indices[k], self._keyframe_times[k]
+        # Output frames are numbered from the keyframe, since the accurate seek drops every
+        # frame before it; see `utils.video.extract_frames_parallel`
+        offset = start_frame - keyframe_idx
+        size = self.image_size
+        return subprocess.Popen(
+            [
+                "ffmpeg", "-v", "error", "-ss", f"{max(0.0, keyframe_time - 0.001):.6f}", "-i", self.video_path,
+                "-map", "0:v:0", "-vf", f"select=gte(n\\,{offset})*not(mod(n-{offset}\\,{stride})),scale={size}:{size}",
+                "-frames:v", str(count), "-vsync", "passthrough", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )  # fmt: skip
+
+    def _decode(self, generation: int, start: int, end: int):
+        frame_bytes = 3 * self.image_size * self.image_size
+        position = start
+        try:
+            for start_frame, stride, count in group_frame_runs(self.frame_indices[start:end]):
+                process = self._open_run(start_frame, stride, count)
+                try:
+                    for _ in range(count):
+                        data = process.stdout.read(frame_bytes)
+                        if len(data) < frame_bytes:
+                            raise RuntimeError(
+                                f"Could not decode frame {self.frame_indices[position]} of {self.video_path}"
+                            )
+                        frame = np.frombuffer(data, dtype=np.uint8).reshape(self.image_size, self.image_size, 3)
+                        frame = torch.from_numpy(frame.transpose(2, 0, 1).copy())
+                        with self._cond:
+                            if self._generation != generation:
+                                return
+                            self._store(position, frame)
+                            position += 1
+                            self._next = position
+                            self._cond.notify_all()
+                            while self._generation == generation and self._next - self._consumed > self.buffer_size:
+                                self._cond.wait()
+                            if self._generation != generation:
+                                return
+                finally:
+                    process.kill()
+                    process.wait()
+        except Exception as e:
+            with self._cond:
+                if self._generation == generation:
+                    self._exception = e
+                    self._cond.notify_all()
+
+
+def open_video_frame_source(
+    frame_store: FrameStore, frame_indices: Sequence[int], image_size: int
+) -> VideoDecoderFrameSource:
+    """Serve frames of an uploaded video from its container, without extracting them"""
+    return VideoDecoderFrameSource(
+        frame_store.video_path,
+        frame_indices,
+        image_size,
+        keyframes=frame_store.keyframes(),
+        video_height=frame_store.height,
+        video_width=frame_store.width,
+    )
@@ -0,0 +1,265 @@
+"""
+Deduplication Utilities
+
+Utility functions for reusing the derived artifacts of videos with identical content.
+
+Uploads are identified by the SHA-256 of their content. The content index
+(`<UPLOAD_FOLDER>/.content_index.json`) maps every content hash to the UUIDs of the
+uploads holding that content, so a re-upload of the same footage can hard-link the
+proxy rendition, frames, main view timestamps, segmentation and pose results of an earlier upload instead
+of recomputing them.
+"""
+
+import json
+import os
+import shutil
+import threading
+from typing import Callable, Dict, List, Optional
+
+from utils import framepack
+from utils.preprocess import MAINVIEW_PARAMS
+from utils.proxy import PROXY_FOLDER_NAME, has_proxy
+from utils.video import has_current_frames
+
+INDEX_FILENAME = ".content_index.json"
+
+_index_lock = threading.Lock()
+
+
+def _index_path(upload_folder: str) -> str:
+    return os.path.join(upload_folder, INDEX_FILENAME)
+
+
+def _read_index(upload_folder: str) -> Dict[str, List[str]]:
+    index_path = _index_path(upload_folder)
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, "r", encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def _write_index(upload_folder: str, index: Dict[str, List[str]]):
+    index_path = _index_path(upload_folder)
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="UTF-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, index_path)
+
+
+def register_content(upload_folder: str, content_hash: str, video_uuid: str):
+    """Add a video to the content index"""
+    with _index_lock:
+        index = _read_index(upload_folder)
+        video_uuids = index.setdefault(content_hash, [])
+        if video_uuid not in video_uuids:
+            video_uuids.append(video_uuid)
+        _write_index(upload_folder, index)
+
+
+def unregister_video(upload_folder: str, video_uuid: str):
+    """Remove a video from the content index"""
+    with _index_lock:
+        index = _read_index(upload_folder)
+        for content_hash in list(index.keys()):
+            if video_uuid in index[content_hash]:
+                index[content_hash].remove(video_uuid)
+            if not index[content_hash]:
+                del index[content_hash]
+        _write_index(upload_folder, index)
+
+
+def find_duplicates(upload_folder: str, content_hash: str, exclude_uuid: Optional[str] = None) -> List[str]:
+    """
+    Find the UUIDs of existing uploads with the given content hash
+
+    Returns:
+        List of video UUIDs whose upload directory still exists, oldest first
+    """
+    with _index_lock:
+        video_uuids = _read_index(upload_folder).get(content_hash, [])
+    return [
+        video_uuid
+        for video_uuid in video_uuids
+        if video_uuid != exclude_uuid and os.path.isdir(os.path.join(upload_folder, video_uuid))
+    ]
+
+
+def _find_source(upload_folder: str, video_dir: str, predicate: Callable[[str], bool]) -> Optional[str]:
+    # Find the directory of a duplicate of `video_dir` whose artifacts satisfy `predicate`
+    metadata_path = os.path.join(video_dir, "metadata.json")
+    if not os.path.exists(metadata_path):
+        return None
+    with open(metadata_path, "r", encoding="UTF-8") as f:
+        metadata = json.load(f)
+    content_hash = metadata.get("content_hash")
+    if content_hash is None:
+        return None
+
+    for video_uuid in find_duplicates(upload_folder, content_hash, exclude_uuid=metadata["UUID"]):
+        source_dir = os.path.join(upload_folder, video_uuid)
+        if predicate(source_dir):
+            return source_dir
+    return None
+
+
+def _read_json(path: str):
+    with open(path, "r", encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def _link_file(src_path: str, dst_path: str):
+    # Link next to the destination first, so an existing file is swapped atomically
+    tmp_path = f"{dst_path}.link"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        # Resolve symlinks, `os.link` would otherwise link the symlink itself
+        os.link(os.path.realpath(src_path), tmp_path)
+    except OSError:
+        # Hard links are not possible across filesystems, fall back to a copy
+        shutil.copyfile(src_path, tmp_path)
+    os.replace(tmp_path, dst_path)
+
+
+def _link_tree(src_dir: str, dst_dir: str):
+    # Replace dst_dir with a tree of hard links to the files of src_dir. Symlinks are
+    # resolved, since the symlinks of merged results point into the source directory.
+    if os.path.exists(dst_dir):
+        shutil.rmtree(dst_dir)
+    shutil.copytree(src_dir, dst_dir, symlinks=False, copy_function=_link_file)
+
+
+def has_complete_frames(video_dir: str) -> bool:
+    # Frames extracted with other output options may be numbered differently
+    return has_current_frames(os.path.join(video_dir, "frames"))
+
+
+def has_current_mainview(video_dir: str) -> bool:
+    mainview_file_path = os.path.join(video_dir, "mainview_timestamp.json")
+    if not os.path.exists(mainview_file_path):
+        return False
+    return _read_json(mainview_file_path).get("params") == MAINVIEW_PARAMS
+
+
+def _segmentation_marker_input(video_dir: str):
+    segmentation_file_path = os.path.join(video_dir, "segmentation.json")
+    if not os.path.exists(segmentation_file_path):
+        return None
+    return _read_json(segmentation_file_path).get("marker_input")
+
+
+def link_frames(source_dir: str, video_dir: str):
+    _link_tree(os.path.join(source_dir, "frames"), os.path.join(video_dir, "frames"))
+    if framepack.has_frame_pack(source_dir):
+        for filename in [framepack.PACK_FILENAME, framepack.INDEX_FILENAME]:
+            _link_file(os.path.join(source_dir, filename), os.path.join(video_dir, filename))
+
+
+def link_proxy(source_dir: str, video_dir: str):
+    _link_tree(os.path.join(source_dir, PROXY_FOLDER_NAME), os.path.join(video_dir, PROXY_FOLDER_NAME))
+
+
+# The small JSON artifacts are copied rather than linked, since they are rewritten in place
+# when a stage is re-run. The result trees are only ever replaced as a whole.
+def link_mainview(source_dir: str, video_dir: str):
+    shutil.copyfile(
+        os.path.join(source_dir, "mainview_timestamp.json"),
+        os.path.join(video_dir, "mainview_timestamp.json"),
+    )
+
+
+def link_segmentation(source_dir: str, video_dir: str):
+    _link_tree(os.path.join(source_dir, "segmentation"), os.path.join(video_dir, "segmentation"))
+    shutil.copyfile(os.path.join(source_dir, "segmentation.json"), os.path.join(video_dir, "segmentation.json"))
+
+
+def link_pose(source_dir: str, video_dir: str):
+    _link_tree(os.path.join(source_dir, "pose"), os.path.join(video_dir, "pose"))
+    shutil.copyfile(os.path.join(source_dir, "pose.json"), os.path.join(video_dir, "pose.json"))
+
+
+def link_duplicate_artifacts(upload_folder: str, video_dir: str) -> Dict[str, bool]:
+    """
+    Reuse every completed artifact of a duplicate upload
+
+    Returns:
+        Dictionary mapping artifact name to whether it was reused
+    """
+    reused = {"video": False, "proxy": False, "frames": False, "mainview": False, "segmentation": False, "pose": False}
+
+    # Share the video file itself, so duplicates do not take extra disk space
+    source_dir = _find_source(upload_folder, video_dir, lambda d: True)
+    if source_dir is not None:
+        source_metadata = _read_json(os.path.join(source_dir, "metadata.json"))
+        metadata = _read_json(os.path.join(video_dir, "metadata.json"))
+        source_video_path = os.path.join(source_dir, source_metadata["filename"])
+        if os.path.exists(source_video_path):
+            _link_file(source_video_path, os.path.join(video_dir, metadata["filename"]))
+            reused["video"] = True
+
+    source_dir = _find_source(upload_folder, video_dir, has_proxy)
+    if source_dir is not None:
+        link_proxy(source_dir, video_dir)
+        reused["proxy"] = True
+
+    source_dir = _find_source(upload_folder, video_dir, has_complete_frames)
+    if source_dir is not None:
+        link_frames(source_dir, video_dir)
+        reused["frames"] = True
+
+    if reuse_mainview(upload_folder, video_dir):
+        reused["mainview"] = True
+
+    # Segmentation and pose depend on the marker input chosen on the source, so they are
+    # taken from a single source to stay consistent with each other
+    source_dir = _find_source(
+        upload_folder, video_dir, lambda d: _segmentation_marker_input(d) is not None and has_current_mainview(d)
+    )
+    if reused["mainview"] and source_dir is not None:
+        link_segmentation(source_dir, video_dir)
+        reused["segmentation"] = True
+        if os.path.exists(os.path.join(source_dir, "pose.json")):
+            link_pose(source_dir, video_dir)
+            reused["pose"] = True
+
+    return reused
+
+
+def reuse_mainview(upload_folder: str, video_dir: str) -> bool:
+    """Reuse the main view timestamps of a duplicate computed with the current parameters"""
+    source_dir = _find_source(upload_folder, video_dir, has_current_mainview)
+    if source_dir is None:
+        return False
+    link_mainview(source_dir, video_dir)
+    return True
+
+
+def reuse_segmentation(upload_folder: str, video_dir: str, marker_input: list) -> bool:
+    """Reuse the segmentation of a duplicate computed from the same marker input"""
+    if not has_current_mainview(video_dir):
+        return False
+    source_dir = _find_source(
+        upload_folder,
+        video_dir,
+        lambda d: has_current_mainview(d) and _segmentation_marker_input(d) == marker_input,
+    )
+    if source_dir is None:
+        return False
+    link_segmentation(source_dir, video_dir)
+    return True
+
+
+def reuse_pose(upload_folder: str, video_dir: str) -> bool:
+    """Reuse the pose results of a duplicate whose segmentation matches this video's"""
+    marker_input = _segmentation_marker_input(video_dir)
+    if marker_input is None:
+        return False
+    source_dir = _find_source(
+        upload_folder,
+        video_dir,
+        lambda d: os.path.exists(os.path.join(d, "pose.json")) and _segmentation_marker_input(d) == marker_input,
+    )
+    if source_dir is None:
+        return False
+    link_pose(source_dir, video_dir)
+    return True
@@ -0,0 +1,137 @@
+"""
+Frame Cache Utilities
+
+Utility functions for serving single frames of an uploaded video as JPEG.
+
+The original JPEG of a frame (from `frames/`, the frame pack, or decoded from the video
+when it was not extracted yet, see `utils.frames.FrameStore`) is served as is. Resized or
+re-encoded variants are written to `frame_cache/w<width>_q<quality>/` in the video
+directory, and recently served images are kept in an in-process LRU cache bounded by
+`FRAME_CACHE_BYTES`.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import cv2
+
+from utils.frames import FrameStore, frame_name
+
+FRAME_CACHE_FOLDER_NAME = "frame_cache"
+# Memory budget of the in-process cache of served frames in bytes
+FRAME_CACHE_BYTES = int(os.environ.get("FRAME_CACHE_BYTES", 64 * 1024 * 1024))
+DEFAULT_QUALITY = 85
+
+_lru = OrderedDict()
+_lru_bytes = 0
+_lru_lock = threading.Lock()
+
+
+def _lru_get(key) -> Optional[Tuple[bytes, str]]:
+    with _lru_lock:
+        entry = _lru.get(key)
+        if entry is not None:
+            _lru.move_to_end(key)
+        return entry
+
+
+def _lru_put(key, entry: Tuple[bytes, str]):
+    global _lru_bytes
+    if len(entry[0]) > FRAME_CACHE_BYTES:
+        return
+    with _lru_lock:
+        if key in _lru:
+            return
+        _lru[key] = entry
+        _lru_bytes += len(entry[0])
+        while _lru_bytes > FRAME_CACHE_BYTES:
+            _, (data, _) = _lru.popitem(last=False)
+            _lru_bytes -= len(data)
+
+
+def make_etag(data: bytes) -> str:
+    return f'"{hashlib.sha1(data).hexdigest()[:20]}"'
+
+
+def get_variant_path(video_dir: str, frame_idx: int, width: Optional[int], quality: int) -> str:
+    variant = f"w{width or 0}_q{quality}"
+    return os.path.join(video_dir, FRAME_CACHE_FOLDER_NAME, variant, frame_name(frame_idx))
+
+
+def _encode_variant(frame_store: FrameStore, frame_idx: int, width: Optional[int], quality: int) -> bytes:
+    image = frame_store.read(frame_idx)
+    if width is not None and width < image.shape[1]:
+        height = max(1, round(image.shape[0] * width / image.shape[1]))
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError(f"Could not encode frame {frame_idx}")
+    return data.tobytes()
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".", suffix=".jpg", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_frame_jpeg(
+    video_dir: str, frame_idx: int, width: Optional[int] = None, quality: Optional[int] = None
+) -> Tuple[bytes, str]:
+    """
+    Get a frame of a video as JPEG
+
+    Args:
+        video_dir: Directory of the video
+        frame_idx: Index of the frame
+        width: Width to scale the frame down to, keeping the aspect ratio (frames are
+            never scaled up)
+        quality: JPEG quality of a resized or re-encoded frame
+
+    Returns:
+        JPEG data and its ETag
+
+    Raises:
+        IndexError: If the frame index is outside the video
+    """
+    key = (video_dir, frame_idx, width, quality)
+    entry = _lru_get(key)
+    if entry is not None:
+        return entry
+
+    frame_store = FrameStore(video_dir)
+    try:
+        if not 0 <= frame_idx < frame_store.total_frames:
+            raise IndexError(f"Frame {frame_idx} is outside the video ({frame_store.total_frames} frames)")
+
+        if width is not None and width >= frame_store.width:
+            width = None
+        if width is None and quality is None:
+            # Pass the extracted JPEG through without re-encoding
+            data = bytes(frame_store.read_bytes(frame_idx))
+        else:
+            quality = quality or DEFAULT_QUALITY
+            variant_path = get_variant_path(video_dir, frame_idx, width, quality)
+            if os.path.exists(variant_path):
+                with open(variant_path, "rb") as f:
+                    data = f.read()
+            else:
+                data = _encode_variant(frame_store, frame_idx, width, quality)
+                _write_atomic(variant_path, data)
+    finally:
+        frame_store.close()
+
+    entry = (data, make_etag(data))
+    _lru_put(key, entry)
+    return entry
@@ -0,0 +1,178 @@
+"""
+Frame Pack Utilities
+
+A single-file container for the encoded frames of a video.
+
+`frames.pack` holds the JPEG frames back to back and `frames.idx.npy` holds one
+(frame index, byte offset, byte length) row per frame, sorted by frame index. Readers
+memory-map the pack, so looking up a frame is a binary search in the index and reading it
+is a zero-copy slice of the mapping.
+
+Existing upload directories can be converted with:
+
+    python -m utils.framepack /data/uploads [--remove-frames]
+"""
+
+import argparse
+import mmap
+import os
+from typing import Iterable, Optional
+
+import cv2
+import numpy as np
+
+PACK_FILENAME = "frames.pack"
+INDEX_FILENAME = "frames.idx.npy"
+
+
+def has_frame_pack(video_dir: str) -> bool:
+    return os.path.exists(os.path.join(video_dir, PACK_FILENAME)) and os.path.exists(
+        os.path.join(video_dir, INDEX_FILENAME)
+    )
+
+
+class FramePackReader:
+    """
+    Memory-mapped reader of a frame pack
+    """
+
+    def __init__(self, video_dir: str):
+        self.pack_path = os.path.join(video_dir, PACK_FILENAME)
+        self.index = np.load(os.path.join(video_dir, INDEX_FILENAME))
+        self._file = open(self.pack_path, "rb")
+        # mmap cannot map an empty file
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if len(self.index) else None
+        self._buffer = memoryview(self._mmap) if self._mmap is not None else None
+
+    @property
+    def frame_indices(self) -> np.ndarray:
+        return self.index[:, 0]
+
+    def __len__(self):
+        return len(self.index)
+
+    def _row(self, frame_idx: int) -> Optional[int]:
+        row = int(np.searchsorted(self.index[:, 0], frame_idx))
+        if row < len(self.index) and self.index[row, 0] == frame_idx:
+            return row
+        return None
+
+    def __contains__(self, frame_idx: int) -> bool:
+        return self._row(frame_idx) is not None
+
+    def read_bytes(self, frame_idx: int) -> memoryview:
+        """Read the encoded frame without copying it"""
+        row = self._row(frame_idx)
+        if row is None:
+            raise KeyError(f"Frame {frame_idx} not in {self.pack_path}")
+        _, offset, length = self.index[row]
+        return self._buffer[offset : offset + length]
+
+    def read(self, frame_idx: int, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+        """Read and decode a frame as a BGR image"""
+        return cv2.imdecode(np.frombuffer(self.read_bytes(frame_idx), dtype=np.uint8), flags)
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.release()
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FramePackWriter:
+    """
+    Writer of a frame pack; frames are appended to an existing pack
+    """
+
+    def __init__(self, video_dir: str):
+        self.pack_path = os.path.join(video_dir, PACK_FILENAME)
+        self.index_path = os.path.join(video_dir, INDEX_FILENAME)
+        rows = np.load(self.index_path).tolist() if os.path.exists(self.index_path) else []
+        self._rows = {frame_idx: (offset, length) for frame_idx, offset, length in rows}
+        self._file = open(self.pack_path, "ab")
+        self._offset = self._file.tell()
+
+    def add(self, frame_idx: int, data: bytes):
+        self._file.write(data)
+        self._rows[frame_idx] = (self._offset, len(data))
+        self._offset += len(data)
+
+    def close(self):
+        self._file.close()
+        index = np.array(
+            [(frame_idx, offset, length) for frame_idx, (offset, length) in sorted(self._rows.items())],
+            dtype=np.int64,
+        ).reshape(-1, 3)
+        # Replace the index atomically, readers only ever see a complete index
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, index)
+        os.replace(tmp_path, self.index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def pack_frames_dir(frames_dir: str, video_dir: str, remove_frames: bool = False) -> int:
+    """
+    Pack the `%06d.jpg` frames of a directory into the frame pack of a video
+
+    Args:
+        frames_dir: Directory holding the frames
+        video_dir: Directory of the video to write the pack to
+        remove_frames: Whether to delete the frame files once they are packed
+
+    Returns:
+        Number of frames packed
+    """
+    frame_names = [
+        frame for frame in os.listdir(frames_dir) if os.path.splitext(frame)[-1] == ".jpg" and frame[:-4].isdigit()
+    ]
+    frame_names.sort(key=lambda p: int(os.path.splitext(p)[0]))
+
+    with FramePackWriter(video_dir) as writer:
+        for frame_name in frame_names:
+            with open(os.path.join(frames_dir, frame_name), "rb") as f:
+                writer.add(int(os.path.splitext(frame_name)[0]), f.read())
+
+    if remove_frames:
+        for frame_name in frame_names:
+            os.remove(os.path.join(frames_dir, frame_name))
+    return len(frame_names)
+
+
+def convert_upload_dirs(paths: Iterable[str], remove_frames: bool = False):
+    """Convert the `frames/` directory of upload directories (or of a folder of them) to frame packs"""
+    for path in paths:
+        if os.path.exists(os.path.join(path, "metadata.json")):
+            video_dirs = [path]
+        else:
+            video_dirs = [
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if not name.startswith(".") and os.path.exists(os.path.join(path, name, "metadata.json"))
+            ]
+
+        for video_dir in video_dirs:
+            frames_dir = os.path.join(video_dir, "frames")
+            if not os.path.isdir(frames_dir):
+                continue
+            num_frames = pack_frames_dir(frames_dir, video_dir, remove_frames=remove_frames)
+            print(f"Packed {num_frames} frames of {video_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert extracted frame directories to frame packs")
+    parser.add_argument("paths", nargs="+", help="Upload directories, or folders of upload directories")
+    parser.add_argument("--remove-frames", action="store_true", help="Delete the frame files once packed")
+    args = parser.parse_args()
+    convert_upload_dirs(args.paths, remove_frames=args.remove_frames)
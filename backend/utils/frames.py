@@ -0,0 +1,219 @@
+"""
+Frame Utilities
+
+Access to the frames of an uploaded video.
+
+Frames live in `frames/` as `%06d.jpg` files named by their frame index, or in the frame
+pack of the video (see `utils.framepack`). When frames are extracted lazily
+(`FRAME_EXTRACTION_MODE=lazy`), only the frames a stage asks for are decoded, with accurate
+seeks into the original video, and are kept in `frames/` as a cache for later stages.
+"""
+
+import bisect
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import BinaryIO, Iterable, List, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from utils.framepack import FramePackReader, has_frame_pack
+from utils.video import FRAME_OUTPUT_OPTIONS, FRAMES_COMPLETE_MARKER, probe_keyframes
+
+# Keyframe tables by video path, shared by the stores of a process so that the frame
+# endpoint does not probe the whole video on every uncached request
+KEYFRAME_CACHE_SIZE = 32
+_keyframe_cache = OrderedDict()
+_keyframe_cache_lock = threading.Lock()
+
+
+def get_keyframes(video_path: str) -> Tuple[List[float], List[int]]:
+    """
+    Keyframe times and frame indices of a video, probed once while the file is unchanged
+
+    Entries are validated by the modification time and size of the video, so a replaced
+    upload with the same path is probed again.
+    """
+    stat = os.stat(video_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _keyframe_cache_lock:
+        entry = _keyframe_cache.get(video_path)
+        if entry is not None and entry[0] == signature:
+            _keyframe_cache.move_to_end(video_path)
+            return entry[1]
+
+    keyframe_times, keyframe_indices, _ = probe_keyframes(video_path)
+    keyframes = (keyframe_times, keyframe_indices)
+    with _keyframe_cache_lock:
+        _keyframe_cache[video_path] = (signature, keyframes)
+        _keyframe_cache.move_to_end(video_path)
+        while len(_keyframe_cache) > KEYFRAME_CACHE_SIZE:
+            _keyframe_cache.popitem(last=False)
+    return keyframes
+
+
+def frame_name(frame_idx: int) -> str:
+    return f"{frame_idx:06d}.jpg"
+
+
+def strided_frame_indices(frame_ranges: Sequence[Sequence[int]], stride: int = 1) -> List[int]:
+    """Expand inclusive (start_frame, end_frame) ranges into frame indices with a stride"""
+    frame_indices = []
+    for start_frame, end_frame in frame_ranges:
+        frame_indices.extend(range(start_frame, end_frame + 1, stride))
+    return frame_indices
+
+
+def group_frame_runs(frame_indices: Iterable[int], max_stride: int = 30) -> List[Tuple[int, int, int]]:
+    """
+    Group sorted frame indices into evenly spaced runs
+
+    Frames further apart than `max_stride` start a new run, since seeking is cheaper than
+    decoding the frames in between.
+
+    Returns:
+        List of (start frame, stride, number of frames) per run
+    """
+    runs = []
+    for frame_idx in sorted(set(frame_indices)):
+        if runs:
+            start_frame, stride, count = runs[-1]
+            last_frame = start_frame + stride * (count - 1)
+            if count == 1 and frame_idx - start_frame <= max_stride:
+                runs[-1] = (start_frame, frame_idx - start_frame, 2)
+                continue
+            if frame_idx - last_frame == stride:
+                runs[-1] = (start_frame, stride, count + 1)
+                continue
+        runs.append((frame_idx, 1, 1))
+    return runs
+
+
+class FrameStore:
+    """
+    Frames of an uploaded video, materialized on demand
+    """
+
+    def __init__(self, video_dir: str):
+        self.video_dir = video_dir
+        self.frames_dir = os.path.join(video_dir, "frames")
+        with open(os.path.join(video_dir, "metadata.json"), "r", encoding="UTF-8") as f:
+            metadata = json.load(f)
+        self.video_path = os.path.join(video_dir, metadata["filename"])
+        self.fps = metadata["fps"]
+        self.total_frames = metadata["total_frames"]
+        self.width = metadata["width"]
+        self.height = metadata["height"]
+        self.pack = FramePackReader(video_dir) if has_frame_pack(video_dir) else None
+        self._keyframes = None
+
+    def close(self):
+        if self.pack is not None:
+            self.pack.close()
+
+    def frame_path(self, frame_idx: int) -> str:
+        return os.path.join(self.frames_dir, frame_name(frame_idx))
+
+    def keyframes(self) -> Tuple[List[float], List[int]]:
+        """Keyframe times and frame indices of the video, see `get_keyframes`"""
+        if self._keyframes is None:
+            self._keyframes = get_keyframes(self.video_path)
+        return self._keyframes
+
+    def is_complete(self) -> bool:
+        return os.path.exists(os.path.join(self.frames_dir, FRAMES_COMPLETE_MARKER))
+
+    def has_frame(self, frame_idx: int) -> bool:
+        if self.pack is not None and frame_idx in self.pack:
+            return True
+        return os.path.exists(self.frame_path(frame_idx))
+
+    def ensure_frames(self, frame_indices: Iterable[int]):
+        """Make sure the given frames exist, extracting the missing ones"""
+        if not self.is_complete():
+            missing_frames = [frame_idx for frame_idx in set(frame_indices) if not self.has_frame(frame_idx)]
+            if missing_frames:
+                self.extract(missing_frames)
+
+    def read_bytes(self, frame_idx: int) -> Union[bytes, memoryview]:
+        """Read the encoded JPEG of a frame, extracting it first if needed"""
+        self.ensure_frames([frame_idx])
+        if self.pack is not None and frame_idx in self.pack:
+            return self.pack.read_bytes(frame_idx)
+        with open(self.frame_path(frame_idx), "rb") as f:
+            return f.read()
+
+    def read(self, frame_idx: int) -> np.ndarray:
+        """Read and decode a frame as a BGR image, extracting it first if needed"""
+        return cv2.imdecode(np.frombuffer(self.read_bytes(frame_idx), dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    def frame_sources(self, frame_indices: Iterable[int]) -> List[Union[str, BinaryIO]]:
+        """
+        Get a JPEG source per frame that image readers (PIL, SAM2 loading) can open
+
+        Returns:
+            List of file paths, or in-memory files for frames in the frame pack
+        """
+        frame_indices = list(frame_indices)
+        self.ensure_frames(frame_indices)
+        frame_sources = []
+        for frame_idx in frame_indices:
+            if self.pack is not None and frame_idx in self.pack:
+                frame_sources.append(io.BytesIO(self.pack.read_bytes(frame_idx)))
+            else:
+                frame_sources.append(self.frame_path(frame_idx))
+        return frame_sources
+
+    def ensure_ranges(self, frame_ranges: Sequence[Sequence[int]], stride: int = 1) -> List[int]:
+        """
+        Make sure every `stride`-th frame of the inclusive frame ranges exists on disk
+
+        Returns:
+            List of the frame indices covered
+        """
+        frame_indices = strided_frame_indices(frame_ranges, stride)
+        self.ensure_frames(frame_indices)
+        return frame_indices
+
+    def extract(self, frame_indices: Iterable[int]):
+        """Decode the given frames from the video with accurate seeks"""
+        os.makedirs(self.frames_dir, exist_ok=True)
+        for start_frame, stride, count in group_frame_runs(frame_indices):
+            self._extract_run(start_frame, stride, count)
+
+    def _extract_run(self, start_frame: int, stride: int, count: int):
+        # Decode into a private directory first, so concurrent extractions of the same
+        # frames never expose partially written files
+        tmp_dir = tempfile.mkdtemp(prefix=".extract-", dir=self.frames_dir)
+        try:
+            # Seek to the keyframe before the run and count frames from it, which holds for
+            # variable frame rate videos too; see `utils.video.extract_frames_parallel`
+            keyframe_times, keyframe_indices = self.keyframes()
+            k = max(0, bisect.bisect_right(keyframe_indices, start_frame) - 1)
+            keyframe_idx, keyframe_time = (keyframe_indices[k], keyframe_times[k]) if keyframe_indices else (0, 0.0)
+            offset = start_frame - keyframe_idx
+            subprocess.run(
+                [
+                    "ffmpeg", "-v", "error", "-ss", f"{max(0.0, keyframe_time - 0.001):.6f}", "-i", self.video_path,
+                    "-map", "0:v:0", "-vf", f"select=gte(n\\,{offset})*not(mod(n-{offset}\\,{stride}))",
+                    "-frames:v", str(count), *FRAME_OUTPUT_OPTIONS, "-start_number", "0", f"{tmp_dir}/%06d.jpg",
+                ],
+                check=True,
+            )  # fmt: skip
+            tmp_paths = [os.path.join(tmp_dir, frame_name(i)) for i in range(count)]
+            missing = [start_frame + i * stride for i, tmp_path in enumerate(tmp_paths) if not os.path.exists(tmp_path)]
+            if missing:
+                raise RuntimeError(
+                    f"Extracted {count - len(missing)} of {count} frames from frame {start_frame} of {self.video_path},"
+                    f" first missing frame {missing[0]}"
+                )
+            for i, tmp_path in enumerate(tmp_paths):
+                os.replace(tmp_path, self.frame_path(start_frame + i * stride))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,634 @@
+"""
+Job Utilities
+
+Utility functions for the queue of processing jobs.
+
+Heavy processing stages (preparing an upload, thumbnails, main view detection, segmentation
+and pose detection) run as jobs in worker processes (see `worker.py`) instead of inside the
+API process. The queue (`<UPLOAD_FOLDER>/.jobs.sqlite3`) is durable, so queued jobs survive a
+restart of the API and of the workers, and it is shared by every worker process, including
+workers started on their own with `python worker.py`.
+
+- A video has at most one queued or running job per stage, enqueueing it again returns the
+  existing job
+- Workers claim the queued job with the highest priority (then the oldest), of a stage with
+  fewer running jobs than its concurrency limit (`JOB_CONCURRENCY`)
+- A failed job is queued again until it has been attempted `JOB_MAX_ATTEMPTS` times
+- Running jobs send heartbeats, the jobs of a worker that stopped sending them are queued
+  again (or failed, when they ran out of attempts)
+- Cancelling a queued job drops it, cancelling a running job asks its worker to interrupt it
+- Running jobs publish their progress (see `utils.progress`), which clients follow as
+  server-sent events of the jobs of a video (`job_events`) instead of polling
+
+As the state of every job lives in the queue, it is the same for every API process and
+survives restarts.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+JOBS_FILENAME = ".jobs.sqlite3"
+
+# Stages processed as jobs, with the worker function of each in `worker.py`
+JOB_STAGES = ["prepare", "thumbnails", "mainview", "segmentation", "pose"]
+JOB_STATUSES = ["queued", "running", "completed", "failed", "cancelled"]
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def parse_concurrency(value: str) -> Dict[str, int]:
+    """Parse the number of concurrent jobs per stage from "stage=count,..." """
+    concurrency = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        stage, _, count = item.partition("=")
+        if stage.strip() not in JOB_STAGES:
+            raise ValueError(f"Unknown job stage {stage.strip()!r}, expected one of {JOB_STAGES}")
+        concurrency[stage.strip()] = int(count)
+    return concurrency
+
+
+# Maximum number of running jobs per stage, across all workers
+JOB_CONCURRENCY = {
+    "prepare": 2,
+    "thumbnails": 1,
+    "mainview": 1,
+    "segmentation": 1,
+    "pose": 1,
+    **parse_concurrency(os.environ.get("JOB_CONCURRENCY", "")),
+}
+# Attempts of a job before it fails, the first one included
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 2))
+# Seconds before a failed job is retried, multiplied by the number of attempts so far
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", 10))
+# Seconds without a heartbeat after which a running job is considered abandoned
+JOB_HEARTBEAT_TIMEOUT = float(os.environ.get("JOB_HEARTBEAT_TIMEOUT", 60))
+# Seconds between two checks of the queue for changes by the job event streams
+JOB_EVENTS_INTERVAL = float(os.environ.get("JOB_EVENTS_INTERVAL", 0.5))
+# Seconds between two keep-alive comments of an idle stream of job events
+JOB_EVENTS_KEEPALIVE = 15
+# Response headers of a stream of job events, which proxies must neither cache nor buffer
+JOB_EVENTS_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stage TEXT NOT NULL,
+    video_uuid TEXT NOT NULL,
+    params TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker TEXT,
+    created REAL NOT NULL,
+    not_before REAL NOT NULL,
+    started REAL,
+    heartbeat REAL,
+    finished REAL,
+    progress TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active ON jobs (stage, video_uuid) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, id);
+CREATE INDEX IF NOT EXISTS jobs_video ON jobs (video_uuid, stage, id);
+"""
+
+
+def worker_name(pid: Optional[int] = None) -> str:
+    """Name of the worker running in a process (this one by default), unique across the containers sharing a queue"""
+    return f"{socket.gethostname()}:{os.getpid() if pid is None else pid}"
+
+
+def _jobs_path(upload_folder: str) -> str:
+    return os.path.join(upload_folder, JOBS_FILENAME)
+
+
+def _open(path: str) -> sqlite3.Connection:
+    # Transactions are explicit, see `_transaction`
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    if "progress" not in {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}:
+        # Queues created before jobs reported their progress
+        try:
+            conn.execute("ALTER TABLE jobs ADD COLUMN progress TEXT")
+        except sqlite3.OperationalError:
+            # Added by another process in the meantime
+            pass
+    return conn
+
+
+# Connections of the current thread by queue path, with the process they were opened in
+_connections = threading.local()
+
+
+def _connect(upload_folder: str) -> sqlite3.Connection:
+    # Every thread opens (and migrates) a queue once and keeps the connection, the API and the
+    # heartbeats read the queue far too often to open it every time
+    path = _jobs_path(upload_folder)
+    if getattr(_connections, "pid", None) != os.getpid():
+        # Connections must not be used across a fork
+        _connections.pid, _connections.by_path = os.getpid(), {}
+    conn = _connections.by_path.get(path)
+    if conn is None:
+        conn = _connections.by_path[path] = _open(path)
+    return conn
+
+
+@contextmanager
+def _transaction(upload_folder: str):
+    # Take the write lock up front, so that concurrent workers cannot claim the same job
+    conn = _connect(upload_folder)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _to_job(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    return {
+        **dict(row),
+        "params": json.loads(row["params"]),
+        "cancel_requested": bool(row["cancel_requested"]),
+        "progress": json.loads(row["progress"]) if row["progress"] else None,
+    }
+
+
+def _get(conn: sqlite3.Connection, job_id: int) -> Optional[Dict[str, Any]]:
+    return _to_job(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def enqueue_job(
+    upload_folder: str,
+    stage: str,
+    video_uuid: str,
+    params: Optional[Dict[str, Any]] = None,
+    priority: int = 0,
+    max_attempts: int = JOB_MAX_ATTEMPTS,
+) -> Dict[str, Any]:
+    """
+    Queue a job, unless the video already has a queued or running job of this stage
+
+    Returns:
+        The new job, or the existing one (`created` tells them apart)
+    """
+    if stage not in JOB_STAGES:
+        raise ValueError(f"Unknown job stage {stage!r}, expected one of {JOB_STAGES}")
+    now = time.time()
+    with _transaction(upload_folder) as conn:
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE stage = ? AND video_uuid = ? AND status IN ('queued', 'running')",
+            (stage, video_uuid),
+        ).fetchone()
+        if row is not None:
+            return {**_to_job(row), "created": False}
+        cursor = conn.execute(
+            "INSERT INTO jobs (stage, video_uuid, params, priority, status, max_attempts, created, not_before)"
+            " VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (stage, video_uuid, json.dumps(params or {}), priority, max(1, max_attempts), now, now),
+        )
+        return {**_get(conn, cursor.lastrowid), "created": True}
+
+
+def _requeue_abandoned(conn: sqlite3.Connection, condition: str, params: Iterable[Any], error: str, now: float):
+    # Abandoned jobs count as failed attempts, and can be claimed again at once
+    conn.execute(
+        "UPDATE jobs SET"
+        " status = CASE WHEN cancel_requested THEN 'cancelled'"
+        " WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,"
+        " error = ?, worker = NULL, not_before = ?,"
+        " finished = CASE WHEN cancel_requested OR attempts >= max_attempts THEN ? END"
+        f" WHERE status = 'running' AND {condition}",
+        (error, now, now, *params),
+    )
+
+
+def claim_job(
+    upload_folder: str,
+    stages: Iterable[str],
+    worker: str,
+    concurrency: Optional[Dict[str, int]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Start the next job of one of `stages` in `worker`
+
+    Args:
+        upload_folder: Upload folder of the queue
+        stages: Stages the worker processes
+        worker: Name of the worker, see `worker_name`
+        concurrency: Maximum number of running jobs per stage, `JOB_CONCURRENCY` by default
+
+    Returns:
+        The claimed job, or None if there is no job the worker can start
+    """
+    concurrency = JOB_CONCURRENCY if concurrency is None else concurrency
+    now = time.time()
+    with _transaction(upload_folder) as conn:
+        _requeue_abandoned(conn, "heartbeat < ?", (now - JOB_HEARTBEAT_TIMEOUT,), "The worker stopped responding", now)
+        running = dict(conn.execute("SELECT stage, COUNT(*) FROM jobs WHERE status = 'running' GROUP BY stage"))
+        available = [stage for stage in stages if running.get(stage, 0) < concurrency.get(stage, 1)]
+        if not available:
+            return None
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' AND not_before <= ?"
+            f" AND stage IN ({', '.join('?' for _ in available)})"
+            " ORDER BY priority DESC, id LIMIT 1",
+            (now, *available),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, started = ?, heartbeat = ?,"
+            " error = NULL, progress = NULL WHERE id = ?",
+            (worker, now, now, row["id"]),
+        )
+        return _get(conn, row["id"])
+
+
+def heartbeat_job(upload_folder: str, job_id: int, progress: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Record that a running job is alive, with its progress if given
+
+    Returns:
+        True if the job should carry on, False if it was cancelled or taken from the worker
+    """
+    conn = _connect(upload_folder)
+    conn.execute(
+        "UPDATE jobs SET heartbeat = ?, progress = COALESCE(?, progress) WHERE id = ? AND status = 'running'",
+        (time.time(), json.dumps(progress) if progress is not None else None, job_id),
+    )
+    row = conn.execute("SELECT status, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return row is not None and row["status"] == "running" and not row["cancel_requested"]
+
+
+def set_job_progress(upload_folder: str, job_id: int, progress: Dict[str, Any]):
+    """Record the progress of a running job, see `utils.progress.ProgressTracker.snapshot`"""
+    conn = _connect(upload_folder)
+    conn.execute("UPDATE jobs SET progress = ? WHERE id = ? AND status = 'running'", (json.dumps(progress), job_id))
+
+
+def complete_job(upload_folder: str, job_id: int):
+    """Mark a running job as completed"""
+    conn = _connect(upload_folder)
+    conn.execute(
+        "UPDATE jobs SET status = 'completed', finished = ? WHERE id = ? AND status = 'running'",
+        (time.time(), job_id),
+    )
+
+
+def fail_job(upload_folder: str, job_id: int, error: str) -> Dict[str, Any]:
+    """
+    Record the failure of a running job, queueing it again if it has attempts left and was
+    not cancelled
+
+    Returns:
+        The updated job
+    """
+    now = time.time()
+    with _transaction(upload_folder) as conn:
+        conn.execute(
+            "UPDATE jobs SET error = ?, worker = NULL,"
+            " status = CASE WHEN cancel_requested THEN 'cancelled'"
+            " WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,"
+            " not_before = ? + ? * attempts,"
+            " finished = CASE WHEN cancel_requested OR attempts >= max_attempts THEN ? END"
+            " WHERE id = ? AND status = 'running'",
+            (error, now, JOB_RETRY_DELAY, now, job_id),
+        )
+        return _get(conn, job_id)
+
+
+def release_job(upload_folder: str, job_id: int):
+    """Queue a running job again without counting the attempt, e.g. when its worker stops"""
+    conn = _connect(upload_folder)
+    conn.execute(
+        "UPDATE jobs SET status = CASE WHEN cancel_requested THEN 'cancelled' ELSE 'queued' END,"
+        " attempts = attempts - 1, worker = NULL, not_before = ?,"
+        " finished = CASE WHEN cancel_requested THEN ? END"
+        " WHERE id = ? AND status = 'running'",
+        (time.time(), time.time(), job_id),
+    )
+
+
+def release_worker_jobs(upload_folder: str, worker: str):
+    """Queue the running jobs of a worker that exited again"""
+    with _transaction(upload_folder) as conn:
+        _requeue_abandoned(conn, "worker = ?", (worker,), "The worker exited", time.time())
+
+
+def cancel_job(upload_folder: str, job_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Cancel a job: a queued job is cancelled at once, a running job is interrupted by its
+    worker at its next heartbeat
+
+    Returns:
+        The updated job, or None if there is no such job
+    """
+    with _transaction(upload_folder) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        )
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+        return _get(conn, job_id)
+
+
+def cancel_video_jobs(upload_folder: str, video_uuid: str):
+    """Cancel the queued and running jobs of a video, e.g. when it is deleted"""
+    with _transaction(upload_folder) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished = ? WHERE video_uuid = ? AND status = 'queued'",
+            (time.time(), video_uuid),
+        )
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE video_uuid = ? AND status = 'running'", (video_uuid,))
+
+
+def set_job_priority(upload_folder: str, job_id: int, priority: int) -> Optional[Dict[str, Any]]:
+    """
+    Change the priority of a job, which only matters while it is queued
+
+    Returns:
+        The updated job, or None if there is no such job
+    """
+    with _transaction(upload_folder) as conn:
+        conn.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, job_id))
+        return _get(conn, job_id)
+
+
+def get_job(upload_folder: str, job_id: int) -> Optional[Dict[str, Any]]:
+    """Get a job by ID"""
+    return _get(_connect(upload_folder), job_id)
+
+
+def latest_job(upload_folder: str, stage: str, video_uuid: str) -> Optional[Dict[str, Any]]:
+    """Get the most recent job of a stage for a video"""
+    conn = _connect(upload_folder)
+    row = conn.execute(
+        "SELECT * FROM jobs WHERE stage = ? AND video_uuid = ? ORDER BY id DESC LIMIT 1", (stage, video_uuid)
+    ).fetchone()
+    return _to_job(row)
+
+
+def latest_jobs(upload_folder: str, video_uuid: str) -> Dict[str, Dict[str, Any]]:
+    """Get the most recent job of every stage for a video, by stage"""
+    conn = _connect(upload_folder)
+    rows = conn.execute(
+        "SELECT * FROM jobs WHERE id IN (SELECT MAX(id) FROM jobs WHERE video_uuid = ? GROUP BY stage)",
+        (video_uuid,),
+    ).fetchall()
+    return {row["stage"]: _to_job(row) for row in rows}
+
+
+def list_jobs(
+    upload_folder: str,
+    video_uuid: Optional[str] = None,
+    stages: Optional[List[str]] = None,
+    statuses: Optional[List[str]] = None,
+    limit: int = 100,
+) -> List[Dict[str, Any]]:
+    """
+    List jobs, the active ones in the order they will run followed by the most recent others
+    """
+    conditions, params = [], []
+    if video_uuid is not None:
+        conditions.append("video_uuid = ?")
+        params.append(video_uuid)
+    for column, values in [("stage", stages), ("status", statuses)]:
+        if values:
+            conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    conn = _connect(upload_folder)
+    rows = conn.execute(
+        f"SELECT * FROM jobs{where}"
+        " ORDER BY status = 'running' DESC, status = 'queued' DESC, priority DESC, id DESC LIMIT ?",
+        [*params, limit],
+    ).fetchall()
+    return [_to_job(row) for row in rows]
+
+
+def stage_status(job: Optional[Dict[str, Any]], completed: bool) -> Dict[str, Any]:
+    """
+    Processing status of a stage from its latest job and whether its result exists
+
+    Returns:
+        `is_processing`, `status` ("queued", "processing", "error: <message>", "cancelled",
+        "completed" or "idle"), `job_id` and the `progress` of a running job
+    """
+    status = "completed" if completed else "idle"
+    if job is not None:
+        if job["status"] == "queued":
+            status = "queued"
+        elif job["status"] == "running":
+            status = "processing"
+        elif job["status"] == "failed":
+            status = f"error: {job['error']}"
+        elif job["status"] == "cancelled" and not completed:
+            status = "cancelled"
+    return {
+        "is_processing": job is not None and job["status"] in ACTIVE_STATUSES,
+        "status": status,
+        "job_id": job["id"] if job is not None else None,
+        "progress": job["progress"] if job is not None and job["status"] == "running" else None,
+    }
+
+
+def describe_job(job: Dict[str, Any]) -> str:
+    """Human readable status of a job, e.g. "processing: scan 1200/1698 frames, 301.5 fps, ETA 1.7 s" """
+    if job["status"] == "failed":
+        return f"error: {job['error']}"
+    if job["status"] != "running":
+        return job["status"]
+    progress = job["progress"]
+    if not progress or progress["step"] is None:
+        return "processing"
+    description = f"processing: {progress['step']}"
+    if progress["total"] is not None:
+        description += f" {progress['done']}/{progress['total']} frames"
+    elif progress["done"]:
+        description += f" {progress['done']} frames"
+    if progress["fps"] is not None:
+        description += f", {progress['fps']} fps"
+    if progress["eta_seconds"] is not None:
+        description += f", ETA {progress['eta_seconds']} s"
+    return description
+
+
+def _event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+
+
+class JobWatcher:
+    """
+    Latest jobs of the videos followed by the job event streams of this process
+
+    A single poller reads the queue for all the streams, every `interval` seconds while at
+    least one stream is open. It only queries the jobs when the queue changed since its last
+    read (`PRAGMA data_version` of its own connection) or a stream follows a new video, so idle
+    streams cost no query at all.
+    """
+
+    def __init__(self, upload_folder: str, interval: float = JOB_EVENTS_INTERVAL):
+        self.upload_folder = upload_folder
+        self.interval = interval
+        # Incremented whenever the jobs are read again
+        self.generation = 0
+        self._followers: Dict[str, int] = {}
+        self._jobs: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._changed: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # The connection stays in a single thread, data versions only compare within a connection
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-watcher")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version: Optional[int] = None
+
+    def _read(self, video_uuids: List[str], force: bool) -> Optional[Dict[str, Dict[str, Dict[str, Any]]]]:
+        if self._conn is None:
+            self._conn = _open(_jobs_path(self.upload_folder))
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version and not force:
+            return None
+        self._data_version = data_version
+        rows = self._conn.execute(
+            "SELECT * FROM jobs WHERE id IN (SELECT MAX(id) FROM jobs"
+            f" WHERE video_uuid IN ({', '.join('?' for _ in video_uuids)}) GROUP BY video_uuid, stage)",
+            video_uuids,
+        ).fetchall()
+        jobs = {video_uuid: {} for video_uuid in video_uuids}
+        for row in rows:
+            jobs[row["video_uuid"]][row["stage"]] = _to_job(row)
+        return jobs
+
+    async def _poll(self):
+        loop = asyncio.get_running_loop()
+        while self._followers:
+            video_uuids = sorted(self._followers)
+            # Videos followed since the last read have no jobs yet
+            force = not set(video_uuids) <= set(self._jobs)
+            try:
+                jobs = await loop.run_in_executor(self._executor, self._read, video_uuids, force)
+            except sqlite3.Error as e:
+                print(f"Error reading the jobs of the event streams: {e}")
+                jobs = None
+            if jobs is not None:
+                self._jobs = jobs
+                self.generation += 1
+                self._changed.set()
+                self._changed = asyncio.Event()
+            await asyncio.sleep(self.interval)
+        self._task = None
+
+    @asynccontextmanager
+    async def follow(self, video_uuid: str):
+        """Keep the latest jobs of a video up to date while the block runs"""
+        self._followers[video_uuid] = self._followers.get(video_uuid, 0) + 1
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll())
+        try:
+            yield
+        finally:
+            self._followers[video_uuid] -= 1
+            if not self._followers[video_uuid]:
+                # Nothing keeps its jobs up to date anymore
+                del self._followers[video_uuid]
+                self._jobs.pop(video_uuid, None)
+
+    def latest_jobs(self, video_uuid: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Latest job of every stage of a followed video, None until they are first read"""
+        return self._jobs.get(video_uuid)
+
+    async def wait(self, generation: int, timeout: float):
+        """Wait until the jobs are read again after `generation`, at most `timeout` seconds"""
+        if self.generation != generation:
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+# Watchers by upload folder, shared by the event streams of the process
+_watchers: Dict[str, JobWatcher] = {}
+
+
+def job_watcher(upload_folder: str) -> JobWatcher:
+    if upload_folder not in _watchers:
+        _watchers[upload_folder] = JobWatcher(upload_folder)
+    return _watchers[upload_folder]
+
+
+async def job_events(
+    upload_folder: str,
+    video_uuid: str,
+    stages: Optional[List[str]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> AsyncIterator[str]:
+    """
+    Server-sent events of the latest jobs of a video (of `stages`, all by default), from their
+    state when the stream opens until the client disconnects
+
+    - `connected`: the video UUID, once
+    - `job`: a job (with its `progress`) whenever it changes
+    - `status`: the stage and status of a changed job, see `describe_job`
+    - `complete`: the stage and ID of a job that completed
+    - `failed`: the stage, ID, status and error of a job that failed or was cancelled (not
+      `error`, which EventSource clients also receive when the connection drops)
+    """
+    yield _event("connected", video_uuid)
+    watcher = job_watcher(upload_folder)
+    sent_jobs: Dict[str, Dict[str, Any]] = {}
+    sent_statuses: Dict[str, str] = {}
+    last_sent = time.monotonic()
+    generation = None
+    async with watcher.follow(video_uuid):
+        while not await is_disconnected():
+            jobs = watcher.latest_jobs(video_uuid) if watcher.generation != generation else None
+            generation = watcher.generation
+            for stage, job in sorted((jobs or {}).items(), key=lambda item: item[1]["id"]):
+                # Heartbeats alone are not worth an event
+                job = {key: value for key, value in job.items() if key != "heartbeat"}
+                if (stages and stage not in stages) or sent_jobs.get(stage) == job:
+                    continue
+                previous_job = sent_jobs.get(stage)
+                sent_jobs[stage] = job
+                last_sent = time.monotonic()
+                yield _event("job", job)
+                status = describe_job(job) if stages and len(stages) == 1 else f"{stage} {describe_job(job)}"
+                if sent_statuses.get(stage) != status:
+                    sent_statuses[stage] = status
+                    yield _event("status", status)
+                same_job = previous_job is not None and previous_job["id"] == job["id"]
+                if same_job and previous_job["status"] == job["status"]:
+                    # Progress of a running job
+                    continue
+                if job["status"] == "completed":
+                    yield _event("complete", {"stage": stage, "job_id": job["id"]})
+                elif job["status"] in ("failed", "cancelled"):
+                    yield _event(
+                        "failed", {"stage": stage, "job_id": job["id"], "status": job["status"], "error": job["error"]}
+                    )
+            if time.monotonic() - last_sent >= JOB_EVENTS_KEEPALIVE:
+                # Keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            # Also how often a closed connection is noticed
+            await watcher.wait(generation, JOB_EVENTS_INTERVAL)
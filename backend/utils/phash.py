@@ -0,0 +1,183 @@
+"""
+Perceptual Hash Utilities
+
+Vectorized perceptual hashing (pHash) of frame batches.
+
+Hashes are bit-identical to `imagehash.phash` with its defaults (8x8 hash of the DCT of a
+32x32 grayscale image): a stack of grayscale images is transformed with the same
+`scipy.fftpack` DCT in one call, and every hash is packed into a uint64 whose most
+significant bit is the first bit of the imagehash array (`int(str(imagehash.phash(img)), 16)`).
+The Hamming distance of two hashes, `hash_a - hash_b` with imagehash, is the popcount of
+their XOR.
+
+Views (camera angles) are found as k-medoids clusters of hashes (`cluster_views`), and
+frames are classified by their closest reference hash (`classify_hashes`). Both compare every
+distinct hash once against blocks of candidates with vectorized XOR and popcount: at the
+usual radius of 10 bits, metric trees (BK-trees) prune too little of the 64-bit space to
+beat this in Python.
+"""
+
+from typing import Dict, List, Union
+
+import cv2
+import numpy as np
+import scipy.fftpack
+from PIL import Image
+
+HASH_SIZE = 8
+HIGHFREQ_FACTOR = 4
+# Side of the grayscale images that are hashed
+IMG_SIZE = HASH_SIZE * HIGHFREQ_FACTOR
+
+# Set bits per byte value, for NumPy versions without `np.bitwise_count`
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def to_grayscale(frame: np.ndarray) -> np.ndarray:
+    """
+    Convert a BGR frame to grayscale with PIL's `convert("L")`, as imagehash does
+    (cv2.COLOR_BGR2GRAY rounds differently)
+    """
+    return np.asarray(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).convert("L"))
+
+
+def phash_input(frame: np.ndarray) -> np.ndarray:
+    """
+    Reduce a BGR (or grayscale) frame to the 32x32 grayscale image imagehash would hash
+
+    Returns:
+        (IMG_SIZE, IMG_SIZE) uint8 array
+    """
+    gray = to_grayscale(frame) if frame.ndim == 3 else frame
+    return np.asarray(Image.fromarray(gray, "L").resize((IMG_SIZE, IMG_SIZE), Image.LANCZOS))
+
+
+def batch_phash(images: np.ndarray) -> np.ndarray:
+    """
+    Compute the perceptual hashes of a stack of 32x32 grayscale images
+
+    Args:
+        images: (N, IMG_SIZE, IMG_SIZE) uint8 array, see `phash_input`
+
+    Returns:
+        (N,) uint64 array of packed hashes
+    """
+    images = np.asarray(images)
+    if images.ndim != 3 or images.shape[1:] != (IMG_SIZE, IMG_SIZE):
+        raise ValueError(f"Expected a stack of {IMG_SIZE}x{IMG_SIZE} images, got shape {images.shape}")
+    if len(images) == 0:
+        return np.zeros(0, dtype=np.uint64)
+
+    dct = scipy.fftpack.dct(scipy.fftpack.dct(images, axis=1), axis=2)
+    dct_low_freq = dct[:, :HASH_SIZE, :HASH_SIZE].reshape(len(images), -1)
+    bits = dct_low_freq > np.median(dct_low_freq, axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view(">u8").ravel().astype(np.uint64)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Number of set bits of every uint64"""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values).astype(np.int64)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1, dtype=np.int64)
+
+
+def hamming_distance(hashes: np.ndarray, reference: Union[int, np.ndarray]) -> np.ndarray:
+    """Hamming distances between packed hashes and a reference hash (or hashes)"""
+    return popcount(np.bitwise_xor(np.asarray(hashes, dtype=np.uint64), np.asarray(reference, dtype=np.uint64)))
+
+
+def cluster_views(
+    hashes: np.ndarray, max_distance: int, max_views: int, max_candidates: int = 512, max_iterations: int = 10
+) -> List[Dict[str, int]]:
+    """
+    Cluster hashes into views with k-medoids, seeded greedily with the hashes covering the
+    most hashes within `max_distance` bits that no earlier view covers
+
+    The candidate medoids are the distinct hashes, or the most frequent half of
+    `max_candidates` plus a fixed-seed random sample of the rest when there are more. Hashes
+    further than `max_distance` from every medoid (close-ups, replays, crowd shots) are
+    outliers and do not move the medoids. With one view, the medoid is the centre of the
+    largest cluster of hashes.
+
+    Returns:
+        Views ordered by support, with the medoid `hash`, the number of hashes within
+        `max_distance` of it (`support`), and the index of its first occurrence (`index`)
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    unique_hashes, first_index, counts = np.unique(hashes, return_index=True, return_counts=True)
+    # Most frequent first, so ties go to the more frequent exact hash
+    order = np.argsort(-counts, kind="stable")
+    if len(order) > max_candidates:
+        rng = np.random.default_rng(0)
+        num_frequent = max_candidates // 2
+        sampled = rng.choice(order[num_frequent:], max_candidates - num_frequent, replace=False)
+        order = np.concatenate([order[:num_frequent], sampled])
+    candidates = unique_hashes[order]
+
+    # Which hashes every candidate covers, compared in blocks to bound the size of the
+    # distance matrix
+    within = np.zeros((len(candidates), len(unique_hashes)), dtype=bool)
+    for start in range(0, len(candidates), 64):
+        block = candidates[start : start + 64]
+        within[start : start + 64] = hamming_distance(unique_hashes[None, :], block[:, None]) <= max_distance
+
+    medoids = []
+    uncovered = np.ones(len(unique_hashes), dtype=bool)
+    while len(medoids) < max_views:
+        support = within[:, uncovered] @ counts[uncovered]
+        best = int(np.argmax(support))
+        if support[best] == 0:
+            break
+        medoids.append(candidates[best])
+        uncovered &= ~within[best]
+
+    # Voronoi iterations: assign the covered hashes to their nearest medoid, then move every
+    # medoid to the member with the smallest total distance to the cluster
+    for _ in range(max_iterations if len(medoids) > 1 else 0):
+        distances = hamming_distance(unique_hashes[None, :], np.array(medoids, dtype=np.uint64)[:, None])
+        nearest = np.argmin(distances, axis=0)
+        inliers = distances.min(axis=0) <= max_distance
+        new_medoids = []
+        for view, medoid in enumerate(medoids):
+            members = unique_hashes[inliers & (nearest == view)]
+            member_counts = counts[inliers & (nearest == view)]
+            # The most frequent members are the medoid candidates
+            member_candidates = members[np.argsort(-member_counts, kind="stable")[:max_candidates]]
+            if len(member_candidates) == 0:
+                new_medoids.append(medoid)
+                continue
+            cost = (hamming_distance(members[None, :], member_candidates[:, None]) * member_counts[None, :]).sum(axis=1)
+            new_medoids.append(member_candidates[int(np.argmin(cost))])
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+
+    views = []
+    for medoid in medoids:
+        support = int(counts[hamming_distance(unique_hashes, medoid) <= max_distance].sum())
+        index = int(first_index[np.searchsorted(unique_hashes, medoid)])
+        views.append({"hash": int(medoid), "support": support, "index": index})
+    return sorted(views, key=lambda view: -view["support"])
+
+
+def classify_hashes(hashes: np.ndarray, references: np.ndarray, max_distance: int) -> np.ndarray:
+    """
+    Index of the closest reference hash for every hash, comparing every distinct hash once
+
+    Returns:
+        (N,) int64 array of reference indices, -1 where no reference is within `max_distance` bits
+    """
+    unique_hashes, inverse = np.unique(np.asarray(hashes, dtype=np.uint64), return_inverse=True)
+    references = np.asarray(references, dtype=np.uint64).ravel()
+    best_distances = np.full(len(unique_hashes), max_distance + 1, dtype=np.int64)
+    labels = np.full(len(unique_hashes), -1, dtype=np.int64)
+    # Compare references in blocks to bound the size of the distance matrix
+    for start in range(0, len(references), 64):
+        distances = hamming_distance(unique_hashes[:, None], references[None, start : start + 64])
+        nearest = np.argmin(distances, axis=1)
+        nearest_distances = distances[np.arange(len(unique_hashes)), nearest]
+        closer = nearest_distances < best_distances
+        best_distances[closer] = nearest_distances[closer]
+        labels[closer] = start + nearest[closer]
+    return labels[inverse.reshape(-1)]
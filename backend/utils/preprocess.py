@@ -1,29 +1,252 @@
+import bisect
 import gc
 import json
 import os
 import random
+import subprocess
 from collections import Counter
+from typing import Dict, List, Optional, Tuple
 
 import cv2
-import imagehash
-from PIL import Image
+import numpy as np
+from pydantic import BaseModel
+
+from utils.chunk_planner import plan_chunks, predict_chunk_memory
+from utils.frames import group_frame_runs
+from utils.phash import IMG_SIZE, batch_phash, classify_hashes, cluster_views, hamming_distance, phash_input
+from utils.progress import advance_progress, start_progress
+from utils.video import ProcessGroup, probe_keyframes, run_sharded, split_frame_ranges
+
+_scan_mode = os.environ.get("MAINVIEW_SCAN_MODE", "single")
+# Parameters of the main view detection, stored with the result so that results computed
+# with different parameters are never reused for a duplicate upload
+MAINVIEW_PARAMS = {
+    "every_n_frame": 5,
+    "crop_ratio": 0.33,
+    "max_distance": 10,
+    "sample_ratio": 0.1,  # 10% of frames for sampling (two-pass mode)
+    # Decode once and take the reference from the hashes of all scanned frames, instead of a
+    # first pass over a random sample and a second pass after seeking back to the start
+    "single_pass": _scan_mode != "two-pass",
+    # Scan every `coarse_n_frame`th frame only, then bisect between the scanned frames around
+    # every change of view for frame-accurate boundaries (single pass)
+    "coarse_to_fine": _scan_mode == "coarse-to-fine",
+    "coarse_n_frame": 30,
+    # Number of view clusters found among the scanned frames, and the number of them taken as
+    # main views (the largest clusters, if they hold at least `min_view_share` of the frames)
+    "view_clusters": 8,
+    "max_views": int(os.environ.get("MAINVIEW_MAX_VIEWS", 1)),
+    "min_view_share": 0.1,
+}
+# "ffmpeg" has ffmpeg crop, convert and scale the scanned frames down to the 32x32 grayscale
+# hash input, "opencv" decodes full BGR frames and prepares them exactly as imagehash does.
+# The two-pass mode always uses OpenCV.
+MAINVIEW_PARAMS["decoder"] = (
+    os.environ.get("MAINVIEW_DECODER", "ffmpeg") if MAINVIEW_PARAMS["single_pass"] else "opencv"
+)
+# Number of frames hashed per batch
+PHASH_BATCH_SIZE = 256
+# Number of concurrent ffmpeg processes hashing keyframe-aligned time ranges of the video with
+# the ffmpeg decoder (1 scans the video in a single process)
+MAINVIEW_WORKERS = int(os.environ.get("MAINVIEW_WORKERS", min(8, os.cpu_count() or 1)))
+
+
+def _hash_frame(frame: np.ndarray, crop_ratio: float) -> np.ndarray:
+    # Hash input of the top part of the frame
+    height = int(frame.shape[0] * crop_ratio)
+    return phash_input(frame[:height, :, :])
+
+
+def scan_phashes(cap: cv2.VideoCapture, every_n_frame: int, crop_ratio: float) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Hash every nth frame from the current position of the capture to the end of the video
+
+    Returns:
+        Frame indices and packed hashes of the scanned frames, and the number of frames read
+    """
+    frame_count = 0
+    # Frames counted in the progress of the job so far
+    reported_count = 0
+    frame_indices = []
+    hashes = []
+    batch_inputs = []
 
+    while cap.isOpened():
+        if frame_count % every_n_frame == 0:
+            ret, frame = cap.read()
+            if not ret:
+                break
 
-def generate_mainview_timestamp(video_file_path: str, video_file_dir: str):
-    # extract frames
-    every_n_frame = 5
-    crop_ratio = 0.33
-    max_distance = 10
-    sample_ratio = 0.1  # 10% of frames for sampling
+            batch_inputs.append(_hash_frame(frame, crop_ratio))
+            frame_indices.append(frame_count)
+            if len(batch_inputs) == PHASH_BATCH_SIZE:
+                hashes.append(batch_phash(np.stack(batch_inputs)))
+                batch_inputs.clear()
+                advance_progress(frame_count + 1 - reported_count)
+                reported_count = frame_count + 1
 
-    cap = cv2.VideoCapture(video_file_path)
-    if not cap.isOpened():
-        print(f"Cannot open video file: {video_file_path}")
-        return None
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    print(f"Opened video: FPS={fps}, total frames={total_frames}")
+            # Explicitly delete to help garbage collection
+            del frame
+        elif not cap.grab():
+            # Skip frames we don't need to process, until the end of the video
+            break
+
+        frame_count += 1
 
+    if batch_inputs:
+        hashes.append(batch_phash(np.stack(batch_inputs)))
+    advance_progress(frame_count - reported_count)
+    hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+    return np.array(frame_indices, dtype=np.int64), hashes, frame_count
+
+
+def _ffmpeg_hash_filter(crop_ratio: float) -> str:
+    # Filters reducing frames to the hash input: the top part, in grayscale, at 32x32
+    return f"crop=iw:trunc(ih*{crop_ratio}):0:0,format=gray,scale={IMG_SIZE}:{IMG_SIZE}:flags=lanczos"
+
+
+def scan_phashes_ffmpeg(
+    video_file_path: str,
+    every_n_frame: int,
+    crop_ratio: float,
+    start_time: float = 0.0,
+    start_frame: int = 0,
+    num_frames: Optional[int] = None,
+    threads: Optional[int] = None,
+    processes: Optional[ProcessGroup] = None,
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Hash every nth frame of a video, with ffmpeg selecting, cropping and scaling the frames
+    down to the 32x32 grayscale hash input, so only 1 KB per scanned frame leaves ffmpeg
+
+    Args:
+        video_file_path: Path to the video file
+        every_n_frame: Hash the frames whose index is a multiple of this
+        crop_ratio: Fraction of the frame height (from the top) that is hashed
+        start_time: Time of the keyframe to start at in seconds
+        start_frame: Index of the keyframe to start at
+        num_frames: Number of frames to scan from the start frame, all if None
+        threads: Number of ffmpeg decoding threads, ffmpeg's default if None
+        processes: Group to start ffmpeg in when scanning a shard, see `utils.video.run_sharded`
+
+    Returns:
+        Frame indices and packed hashes of the scanned frames, and the index after the last
+        frame read (rounded up to the next multiple of `every_n_frame` if `num_frames` is None)
+    """
+    # Global index of the first frame to hash and the number of frames to hash
+    first_frame = start_frame + (-start_frame) % every_n_frame
+    max_hashes = None if num_frames is None else len(range(first_frame, start_frame + num_frames, every_n_frame))
+    if max_hashes == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint64), start_frame + num_frames
+
+    command = ["ffmpeg", "-v", "error"]
+    if threads is not None:
+        command += ["-threads", str(threads)]
+    if start_frame > 0:
+        # Seek a millisecond past the keyframe without accurate seeking: decoding starts at the
+        # last keyframe before the seek point, which is the keyframe itself (seeking before it
+        # would decode the whole previous group of pictures)
+        command += ["-noaccurate_seek", "-ss", f"{start_time + 0.001:.6f}"]
+    command += [
+        "-i", video_file_path, "-map", "0:v:0",
+        "-vf", f"select=not(mod(n+{start_frame % every_n_frame}\\,{every_n_frame})),{_ffmpeg_hash_filter(crop_ratio)}",
+    ]  # fmt: skip
+    if max_hashes is not None:
+        command += ["-frames:v", str(max_hashes)]
+    command += ["-vsync", "passthrough", "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"]
+    process = (processes.popen if processes is not None else subprocess.Popen)(command, stdout=subprocess.PIPE)
+
+    frame_bytes = IMG_SIZE * IMG_SIZE
+    hashes = []
+    try:
+        while True:
+            # Read a whole batch of small frames at once
+            data = process.stdout.read(frame_bytes * PHASH_BATCH_SIZE)
+            num_read = len(data) // frame_bytes
+            if num_read:
+                images = np.frombuffer(data, dtype=np.uint8, count=num_read * frame_bytes)
+                hashes.append(batch_phash(images.reshape(num_read, IMG_SIZE, IMG_SIZE)))
+                # Shards of a sharded scan all count towards the progress of the scan
+                advance_progress(num_read * every_n_frame)
+            if len(data) < frame_bytes * PHASH_BATCH_SIZE:
+                break
+    except BaseException:
+        # Stop ffmpeg when reading is interrupted, e.g. by a cancelled job
+        process.kill()
+        process.wait()
+        raise
+    finally:
+        process.stdout.close()
+    if process.wait() != 0:
+        raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+
+    hashes = np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)
+    frame_indices = first_frame + np.arange(len(hashes), dtype=np.int64) * every_n_frame
+    if num_frames is not None:
+        frame_count = start_frame + num_frames
+    else:
+        frame_count = first_frame + len(hashes) * every_n_frame if len(hashes) else start_frame
+    return frame_indices, hashes, frame_count
+
+
+def scan_phashes_sharded(
+    video_file_path: str, every_n_frame: int, crop_ratio: float, workers: int
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Hash every nth frame of a video with concurrent ffmpeg processes over keyframe-aligned
+    time ranges, see `scan_phashes_ffmpeg`
+
+    Every range is decoded from its own keyframe and hashes the frames whose global index is
+    a multiple of `every_n_frame`, so the concatenated ranges hold exactly the hashes of a
+    single scan. The main view segments are detected on the merged hashes, so segments
+    spanning a range boundary are never split.
+
+    Returns:
+        Frame indices and packed hashes of the scanned frames, and the total number of frames
+
+    Raises:
+        ValueError: If the ranges did not hash every expected frame
+    """
+    keyframe_times, keyframe_indices, total_frames = probe_keyframes(video_file_path)
+    ranges = split_frame_ranges(keyframe_times, keyframe_indices, total_frames, workers)
+    # Share the cores between the workers instead of oversubscribing them
+    threads = max(1, (os.cpu_count() or 1) // len(ranges))
+
+    def scan_range(frame_range: Tuple[float, int, int], processes: ProcessGroup):
+        start_time, start_frame, num_frames = frame_range
+        return scan_phashes_ffmpeg(
+            video_file_path, every_n_frame, crop_ratio, start_time, start_frame, num_frames, threads, processes
+        )
+
+    results = run_sharded(scan_range, ranges)
+
+    frame_indices = np.concatenate([result[0] for result in results])
+    hashes = np.concatenate([result[1] for result in results])
+    expected_indices = np.arange(0, total_frames, every_n_frame, dtype=np.int64)
+    if not np.array_equal(frame_indices, expected_indices):
+        raise ValueError(f"Sharded scan hashed {len(frame_indices)} of {len(expected_indices)} frames")
+    return frame_indices, hashes, total_frames
+
+
+def scan_phashes_ffmpeg_auto(
+    video_file_path: str, every_n_frame: int, crop_ratio: float, workers: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, int]:
+    """Hash every nth frame of a video with ffmpeg, sharded over `workers` processes if possible"""
+    if workers is None:
+        workers = MAINVIEW_WORKERS
+    if workers > 1:
+        try:
+            return scan_phashes_sharded(video_file_path, every_n_frame, crop_ratio, workers)
+        except (subprocess.CalledProcessError, ValueError) as e:
+            print(f"Sharded main view scan failed: {e}")
+            print("Falling back to a single process scan")
+    return scan_phashes_ffmpeg(video_file_path, every_n_frame, crop_ratio)
+
+
+def sample_typical_phash(
+    cap: cv2.VideoCapture, total_frames: int, every_n_frame: int, crop_ratio: float, sample_ratio: float
+) -> Optional[int]:
+    """Most common hash of a random sample of every nth frame (first pass of the two-pass mode)"""
     # Calculate total frames we'll actually process (every nth frame)
     processed_frames = total_frames // every_n_frame
     sample_size = int(processed_frames * sample_ratio)
@@ -32,9 +255,10 @@ def generate_mainview_timestamp(video_file_path: str, video_file_dir: str):
     sample_frames = (i * every_n_frame for i in sorted(random.sample(range(processed_frames), sample_size)))
 
     frame_count = 0
-    phash_counter = Counter()
+    # Only the 32x32 hash inputs of the sampled frames are kept, the frames are not stored
+    sample_inputs = []
+    start_progress("sample", sample_size)
 
-    # Process frames one at a time without storing them
     for target_frame in sample_frames:
         # Skip frames until we reach the target
         while frame_count < target_frame:
@@ -43,70 +267,270 @@ def generate_mainview_timestamp(video_file_path: str, video_file_dir: str):
 
         ret, frame = cap.read()
         if ret:
-            # Process only the cropped portion directly
-            height = int(frame.shape[0] * crop_ratio)
-            cropped_frame = frame[:height, :, :]
-            current_phash = calculate_phash(cropped_frame)
-            phash_counter[current_phash] += 1
+            sample_inputs.append(_hash_frame(frame, crop_ratio))
             # Explicitly delete to help garbage collection
             del frame
-            del cropped_frame
 
         frame_count += 1
+        advance_progress()
 
-    # Find the most common phash
-    if phash_counter:
-        typical_phash = phash_counter.most_common(1)[0][0]
-        print(f"Found typical pattern with {phash_counter[typical_phash]} occurrences")
-    else:
-        print("Failed to find typical pattern!")
+    if not sample_inputs:
         return None
+    # Hash the samples in one call and find the most common phash
+    phash_counter = Counter(batch_phash(np.stack(sample_inputs)).tolist())
+    typical_phash = phash_counter.most_common(1)[0][0]
+    print(f"Found typical pattern with {phash_counter[typical_phash]} occurrences")
+    return typical_phash
+
+
+class MainViewRequest(BaseModel):
+    # Frames showing the main views, instead of selecting them automatically
+    reference_frames: Optional[List[int]] = None
+
+
+def hash_frames(
+    video_file_path: str,
+    frame_indices: List[int],
+    crop_ratio: float,
+    decoder: str,
+    keyframes: Optional[Tuple[List[float], List[int]]] = None,
+) -> np.ndarray:
+    """
+    Hash single frames of a video with the decoder of the scan, so their hashes compare
+    exactly with the scanned ones
+
+    Args:
+        video_file_path: Path to the video file
+        frame_indices: Indices of the frames to hash
+        crop_ratio: Fraction of the frame height (from the top) that is hashed
+        decoder: Decoder of the scan, "ffmpeg" or "opencv"
+        keyframes: Keyframe times and indices of the video (see `utils.video.probe_keyframes`),
+            probed if None and the decoder is ffmpeg
+
+    Returns:
+        (N,) uint64 array of packed hashes in the order of `frame_indices`
+    """
+    if decoder != "ffmpeg":
+        cap = cv2.VideoCapture(video_file_path)
+        try:
+            images = []
+            for frame_idx in frame_indices:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+                ret, frame = cap.read()
+                if not ret:
+                    raise ValueError(f"Cannot read frame {frame_idx} of {video_file_path}")
+                images.append(_hash_frame(frame, crop_ratio))
+        finally:
+            cap.release()
+        return batch_phash(np.stack(images))
+
+    if keyframes is None:
+        keyframes = probe_keyframes(video_file_path)[:2]
+    keyframes = sorted(zip(keyframes[1], keyframes[0]))
+    keyframe_indices = [keyframe_idx for keyframe_idx, _ in keyframes]
+    hashes = {}
+    for start_frame, stride, count in group_frame_runs(frame_indices):
+        # Decode from the last keyframe before the run, counting frames from it, as the sharded
+        # scan does
+        keyframe = bisect.bisect_right(keyframe_indices, start_frame) - 1
+        keyframe_idx, keyframe_time = keyframes[keyframe] if keyframe >= 0 else (0, 0.0)
+        command = ["ffmpeg", "-v", "error"]
+        if keyframe_idx > 0:
+            command += ["-noaccurate_seek", "-ss", f"{keyframe_time + 0.001:.6f}"]
+        first, last = start_frame - keyframe_idx, start_frame - keyframe_idx + stride * (count - 1)
+        select = f"select=between(n\\,{first}\\,{last})*not(mod(n-{first}\\,{stride}))"
+        command += [
+            "-i", video_file_path, "-map", "0:v:0", "-vf", f"{select},{_ffmpeg_hash_filter(crop_ratio)}",
+            "-frames:v", str(count), "-vsync", "passthrough", "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1",
+        ]  # fmt: skip
+        data = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+        num_read = len(data) // (IMG_SIZE * IMG_SIZE)
+        if num_read < count:
+            raise ValueError(f"Decoded {num_read} of {count} frames from frame {start_frame} of {video_file_path}")
+        images = np.frombuffer(data, dtype=np.uint8, count=count * IMG_SIZE * IMG_SIZE)
+        run_hashes = batch_phash(images.reshape(count, IMG_SIZE, IMG_SIZE))
+        hashes.update(zip(range(start_frame, start_frame + stride * count, stride), run_hashes.tolist()))
+    return np.array([hashes[frame_idx] for frame_idx in frame_indices], dtype=np.uint64)
+
+
+def select_main_views(
+    views: List[Dict[str, int]],
+    hashes: np.ndarray,
+    video_file_path: str,
+    decoder: str,
+    crop_ratio: float,
+    reference_frames: Optional[List[int]] = None,
+) -> List[int]:
+    """
+    Choose the hashes of the main views
+
+    Args:
+        views: View clusters of the scanned frames, see `utils.phash.cluster_views`
+        hashes: Hashes of the scanned frames
+        video_file_path: Path to the video file
+        decoder: Decoder of the scan, "ffmpeg" or "opencv"
+        crop_ratio: Fraction of the frame height (from the top) that is hashed
+        reference_frames: Frames showing the main views, labelled by the user
+
+    Returns:
+        Hashes of the main views
+    """
+    if reference_frames:
+        # Hash the labelled frames themselves, with the decoder of the scan so they compare
+        # exactly with the scanned frames
+        return hash_frames(video_file_path, sorted(set(reference_frames)), crop_ratio, decoder).tolist()
+
+    min_support = MAINVIEW_PARAMS["min_view_share"] * len(hashes)
+    selected = views[: MAINVIEW_PARAMS["max_views"]]
+    # The largest view is always a main view
+    return [view["hash"] for i, view in enumerate(selected) if i == 0 or view["support"] >= min_support]
+
+
+def refine_view_changes(
+    video_file_path: str,
+    decoder: str,
+    frame_indices: List[int],
+    main_view_flags: List[bool],
+    main_views: np.ndarray,
+    max_distance: int,
+    crop_ratio: float,
+) -> Dict[int, int]:
+    """
+    Find the exact frame of every change of view between two scanned frames by bisection
+
+    Every round decodes the midpoints of all unresolved changes together, with the decoder
+    of the scan. Each gap between scanned frames is assumed to hold a single change of view.
+
+    Args:
+        video_file_path: Path to the video file
+        decoder: Decoder of the scan, "ffmpeg" or "opencv"
+        frame_indices: Indices of the scanned frames
+        main_view_flags: Whether each scanned frame shows the main view
+        main_views: Hashes of the main views
+        max_distance: Maximum Hamming distance to a main view hash
+        crop_ratio: Fraction of the frame height (from the top) that is hashed
+
+    Returns:
+        First frame of the new view by the position of the first scanned frame after each change
+    """
+    # Last frame known to show the old view and first frame known to show the new view
+    bounds = {
+        pos: [frame_indices[pos - 1], frame_indices[pos]]
+        for pos in range(1, len(main_view_flags))
+        if main_view_flags[pos] != main_view_flags[pos - 1]
+    }
+    keyframes = probe_keyframes(video_file_path)[:2] if bounds and decoder == "ffmpeg" else None
+    # The number of rounds depends on the gaps, only the probed frames are counted
+    start_progress("refine", None)
+    while True:
+        probes = {pos: (lo + hi) // 2 for pos, (lo, hi) in bounds.items() if hi - lo > 1}
+        if not probes:
+            break
+        probe_frames = sorted(set(probes.values()))
+        probe_hashes = hash_frames(video_file_path, probe_frames, crop_ratio, decoder, keyframes)
+        advance_progress(len(probe_frames))
+        probe_flags = dict(zip(probe_frames, (classify_hashes(probe_hashes, main_views, max_distance) >= 0).tolist()))
+        for pos, frame_idx in probes.items():
+            if probe_flags[frame_idx] == main_view_flags[pos]:
+                bounds[pos][1] = frame_idx
+            else:
+                bounds[pos][0] = frame_idx
+    return {pos: hi for pos, (lo, hi) in bounds.items()}
 
-    # Reset video capture to start
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-    frame_count = 0
+
+def generate_mainview_timestamp(
+    video_file_path: str, video_file_dir: str, reference_frames: Optional[List[int]] = None
+):
+    # extract frames
+    every_n_frame = MAINVIEW_PARAMS["every_n_frame"]
+    crop_ratio = MAINVIEW_PARAMS["crop_ratio"]
+    max_distance = MAINVIEW_PARAMS["max_distance"]
+    sample_ratio = MAINVIEW_PARAMS["sample_ratio"]
+    single_pass = MAINVIEW_PARAMS["single_pass"]
+    decoder = MAINVIEW_PARAMS["decoder"]
+    coarse_to_fine = MAINVIEW_PARAMS["coarse_to_fine"]
+    # Stride of the scan, the boundaries found by a coarse scan are refined afterwards
+    scan_n_frame = MAINVIEW_PARAMS["coarse_n_frame"] if coarse_to_fine else every_n_frame
+
+    cap = cv2.VideoCapture(video_file_path)
+    if not cap.isOpened():
+        print(f"Cannot open video file: {video_file_path}")
+        return None
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    print(f"Opened video: FPS={fps}, total frames={total_frames}")
+
+    if single_pass:
+        start_progress("scan", total_frames or None)
+        # Hash every nth frame once, then find the dominant view among the stored hashes
+        if decoder == "ffmpeg":
+            cap.release()
+            frame_indices, hashes, frame_count = scan_phashes_ffmpeg_auto(video_file_path, scan_n_frame, crop_ratio)
+        else:
+            frame_indices, hashes, frame_count = scan_phashes(cap, scan_n_frame, crop_ratio)
+        if len(hashes) == 0:
+            print("Failed to find typical pattern!")
+            return None
+        views = cluster_views(hashes, max_distance, MAINVIEW_PARAMS["view_clusters"])
+        main_view_hashes = select_main_views(views, hashes, video_file_path, decoder, crop_ratio, reference_frames)
+        print(f"Found {len(views)} views, {len(main_view_hashes)} main views")
+    else:
+        typical_phash = sample_typical_phash(cap, total_frames, every_n_frame, crop_ratio, sample_ratio)
+        if typical_phash is None:
+            print("Failed to find typical pattern!")
+            return None
+
+        # Reset video capture to start
+        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        start_progress("scan", total_frames or None)
+        frame_indices, hashes, frame_count = scan_phashes(cap, every_n_frame, crop_ratio)
+        views = cluster_views(hashes, max_distance, MAINVIEW_PARAMS["view_clusters"])
+        main_view_hashes = [typical_phash]
+        if reference_frames:
+            # The scan of this path always reads the frames with OpenCV
+            main_view_hashes = select_main_views(views, hashes, video_file_path, "opencv", crop_ratio, reference_frames)
+
+    # The scan only knows the frames it read, the container knows the exact end
+    if total_frames > 0:
+        frame_count = min(frame_count, total_frames)
+
+    frame_indices = frame_indices.tolist()
+    # Frames are classified by their closest main view within `max_distance` bits
+    main_views = np.array(main_view_hashes, dtype=np.uint64)
+    main_view_flags = (classify_hashes(hashes, main_views, max_distance) >= 0).tolist()
+
+    view_changes = {}
+    if coarse_to_fine:
+        view_changes = refine_view_changes(
+            video_file_path, decoder, frame_indices, main_view_flags, main_views, max_distance, crop_ratio
+        )
+        print(f"Refined {len(view_changes)} changes of view")
 
     # Variables for timestamp detection
     timestamps = []
     onset = None
     onset_frame = None
 
-    # Second phase: Process frames with minimal memory usage
-    while cap.isOpened():
-        if frame_count % every_n_frame == 0:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            height = int(frame.shape[0] * crop_ratio)
-            cropped_frame = frame[:height, :, :]
-            current_phash = calculate_phash(cropped_frame)
-
-            is_main_view = (current_phash - typical_phash) <= max_distance
-
-            # Process timestamp logic
-            if is_main_view and onset is None:
-                onset = frame_count / fps
-                onset_frame = frame_count
-            elif not is_main_view and onset is not None:
-                offset = max(0, (frame_count - every_n_frame) / fps)
-                offset_frame = max(0, frame_count - every_n_frame)
-                timestamps.append((onset, offset, onset_frame, offset_frame))
-                onset = None
-                onset_frame = None
-
-            # Explicitly delete to help garbage collection
-            del frame
-            del cropped_frame
-        else:
-            # Skip frames we don't need to process
-            cap.grab()
-
-        frame_count += 1
+    # Process timestamp logic
+    for pos, (frame_idx, is_main_view) in enumerate(zip(frame_indices, main_view_flags)):
+        if is_main_view and onset is None:
+            onset_frame = view_changes.get(pos, frame_idx)
+            onset = onset_frame / fps
+        elif not is_main_view and onset is not None:
+            if pos in view_changes:
+                offset_frame = view_changes[pos] - 1
+            else:
+                offset_frame = max(0, frame_idx - scan_n_frame)
+            offset = offset_frame / fps
+            timestamps.append((onset, offset, onset_frame, offset_frame))
+            onset = None
+            onset_frame = None
 
-    # Handle the case where video ends during a main view
+    # Handle the case where video ends during a main view, offsets are inclusive
     if onset is not None:
-        timestamps.append((onset, frame_count / fps, onset_frame, frame_count))
+        timestamps.append((onset, (frame_count - 1) / fps, onset_frame, frame_count - 1))
 
     cap.release()
     gc.collect()  # Force garbage collection after processing
@@ -118,98 +542,35 @@ def generate_mainview_timestamp(video_file_path: str, video_file_dir: str):
     print(f"Main view timestamps: {timestamps}")
     mainview_file_path = os.path.join(video_file_dir, "mainview_timestamp.json")
 
-    # Create chunks
-    chunk_size = 2500
-    json_chunks = []
-    current_chunk = []
-    current_chunk_size = 0
-
-    for timestamp in timestamps:
-        start_frame = timestamp[2]  # Get the start_frame from the timestamp
-        end_frame = timestamp[3]  # Get the end_frame from the timestamp
-        segment_size = end_frame - start_frame + 1
-
-        # If this segment fits in the current chunk
-        if current_chunk_size + segment_size <= chunk_size:
-            current_chunk.append((start_frame, end_frame))
-            current_chunk_size += segment_size
-
-        # If this segment doesn't fit entirely, we need to split it
-        else:
-            # Calculate how many frames can fit in the current chunk
-            frames_to_add = chunk_size - current_chunk_size
-
-            if frames_to_add > 0:
-                # Add the first part of the segment to the current chunk
-                split_end_frame = start_frame + frames_to_add - 1
-                current_chunk.append((start_frame, split_end_frame))
-                json_chunks.append(current_chunk)
-
-                # Start a new chunk with the remaining part of the segment
-                remaining_start = split_end_frame + 1
-
-                # Process the remaining part, potentially across multiple chunks
-                remaining_end = end_frame
-                while remaining_start <= remaining_end:
-                    new_chunk = []
-                    new_chunk_end = min(remaining_start + chunk_size - 1, remaining_end)
-                    new_chunk.append((remaining_start, new_chunk_end))
-
-                    if new_chunk_end == remaining_end:
-                        # If we've reached the end of the segment, we're done with this split
-                        current_chunk = new_chunk
-                        current_chunk_size = new_chunk_end - remaining_start + 1
-                        break
-                    else:
-                        # If there's still more to process, add this chunk and continue
-                        json_chunks.append(new_chunk)
-                        remaining_start = new_chunk_end + 1
-            else:
-                # If the current chunk is already full, start a new one
-                json_chunks.append(current_chunk)
-
-                # Process this segment with a fresh chunk
-                current_chunk = []
-                current_chunk_size = 0
-
-                # We need to recursively handle this segment as it might span multiple chunks
-                remaining_start = start_frame
-                remaining_end = end_frame
-
-                while remaining_start <= remaining_end:
-                    if remaining_end - remaining_start + 1 <= chunk_size:
-                        # If the remainder fits in one chunk
-                        current_chunk.append((remaining_start, remaining_end))
-                        current_chunk_size = remaining_end - remaining_start + 1
-                        break
-                    else:
-                        # If we need multiple chunks
-                        new_chunk = [(remaining_start, remaining_start + chunk_size - 1)]
-                        json_chunks.append(new_chunk)
-                        remaining_start += chunk_size
-
-    # Don't forget to add the last chunk if it's not empty
-    if current_chunk:
-        json_chunks.append(current_chunk)
+    # Group the segments into chunks SAM2 can segment within the memory budget
+    segments = [(onset_frame, offset_frame) for _, _, onset_frame, offset_frame in timestamps]
+    json_chunks = plan_chunks(segments, width, height)
 
     json_timestamps = []
     for onset, offset, onset_frame, offset_frame in timestamps:
         json_timestamps.append([onset, offset, onset_frame, offset_frame])
 
     # Create the final JSON structure
-    result = {"fps": fps, "total_frames": total_frames, "timestamps": json_timestamps, "chunks": json_chunks}
+    result = {
+        "fps": fps,
+        "total_frames": total_frames,
+        "timestamps": json_timestamps,
+        "chunks": json_chunks,
+        "chunk_peak_bytes": predict_chunk_memory(json_chunks, width, height),
+        # View clusters with a representative scanned frame, for labelling reference frames
+        "views": [
+            {
+                "hash": f"{view['hash']:016x}",
+                "support": view["support"],
+                "frame": frame_indices[view["index"]],
+                "main": bool((hamming_distance(main_views, view["hash"]) <= max_distance).any()),
+            }
+            for view in views
+        ],
+        "reference_frames": reference_frames or None,
+        "params": MAINVIEW_PARAMS,
+    }
     with open(mainview_file_path, "w") as f:
         json.dump(result, f, indent=2)
 
     return mainview_file_path
-
-
-# calculate phash
-def calculate_phash(frame):
-    # Convert directly to RGB to avoid extra copy
-    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    pil_image = Image.fromarray(frame)
-    phash = imagehash.phash(pil_image)
-    # Clean up
-    del pil_image
-    return phash
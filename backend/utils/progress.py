@@ -0,0 +1,176 @@
+"""
+Progress Utilities
+
+Progress of the processing step a job is running.
+
+Processing code announces a step with its total number of frames (`start_progress`) and
+counts the frames it has processed (`advance_progress`), from any thread. Both do nothing
+unless a worker tracks a job in the process (`track_progress`, see `worker.py`): the tracker
+derives the throughput and remaining time of the step, and publishes them with the peak
+memory of the job at most every `JOB_PROGRESS_INTERVAL` seconds. The peak memory of a block,
+such as a whole job or a segmentation chunk, is measured with `PeakMemorySampler`.
+"""
+
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+# Minimum number of seconds between two published progress updates of a job
+JOB_PROGRESS_INTERVAL = float(os.environ.get("JOB_PROGRESS_INTERVAL", 1))
+
+
+def _gpu_peak_bytes() -> Optional[int]:
+    # Only when a model already loaded torch, the progress of other stages never imports it
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return int(torch.cuda.max_memory_allocated())
+
+
+def _rss_bytes() -> int:
+    # Resident set size of the process
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Peak of the whole process lifetime, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class PeakMemorySampler:
+    """
+    Context manager sampling the resident set size of the process in a thread, to measure
+    the peak memory of a block
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while True:
+            self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+            if self._stop.wait(self.interval):
+                break
+
+    def __enter__(self) -> "PeakMemorySampler":
+        self.peak_bytes = _rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, _rss_bytes())
+
+
+class ProgressTracker:
+    """
+    Progress of the current step of a job, published through `publish`
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[Dict[str, Any]], None],
+        peak_bytes: Callable[[], int],
+        interval: float = JOB_PROGRESS_INTERVAL,
+    ):
+        self.publish = publish
+        self.peak_bytes = peak_bytes
+        self.interval = interval
+        self.step: Optional[str] = None
+        self.total: Optional[int] = None
+        self.done = 0
+        self._lock = threading.Lock()
+        self._start_time = time.monotonic()
+        self._step_start_time = self._start_time
+        self._published_time = float("-inf")
+
+    def start(self, step: str, total: Optional[int]):
+        with self._lock:
+            self.step, self.total, self.done = step, total, 0
+            self._step_start_time = time.monotonic()
+        self._publish(force=True)
+
+    def advance(self, count: int):
+        with self._lock:
+            self.done += count
+            if self.total is not None:
+                # Strided reads may count a few frames past the end
+                self.done = min(self.done, self.total)
+            finished = self.total is not None and self.done >= self.total
+        self._publish(force=finished)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns:
+            `step`, frames `done` of `total` (None if unknown), frames per second (`fps`) and
+            estimated seconds left (`eta_seconds`) of the step, `elapsed_seconds` of the job,
+            and the peak resident memory of the worker process (`peak_bytes`) and of the GPU
+            (`gpu_peak_bytes`, None without CUDA)
+        """
+        now = time.monotonic()
+        with self._lock:
+            step, total, done = self.step, self.total, self.done
+            step_seconds = now - self._step_start_time
+        fps = done / step_seconds if done and step_seconds > 0 else None
+        eta_seconds = max(0, total - done) / fps if fps and total is not None else None
+        return {
+            "step": step,
+            "done": done,
+            "total": total,
+            "fps": round(fps, 1) if fps is not None else None,
+            "eta_seconds": round(eta_seconds, 1) if eta_seconds is not None else None,
+            "elapsed_seconds": round(now - self._start_time, 1),
+            "peak_bytes": self.peak_bytes(),
+            "gpu_peak_bytes": _gpu_peak_bytes(),
+        }
+
+    def _publish(self, force: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._published_time < self.interval:
+                return
+            self._published_time = now
+        self.publish(self.snapshot())
+
+
+# Tracker of the job running in this process, a worker runs one job at a time
+_tracker: Optional[ProgressTracker] = None
+
+
+@contextmanager
+def track_progress(
+    publish: Callable[[Dict[str, Any]], None], peak_bytes: Callable[[], int], interval: float = JOB_PROGRESS_INTERVAL
+):
+    """Track the progress reported while the block runs"""
+    global _tracker
+    _tracker = ProgressTracker(publish, peak_bytes, interval)
+    try:
+        yield _tracker
+    finally:
+        _tracker = None
+
+
+def start_progress(step: str, total: Optional[int]):
+    """Start a step of `total` frames (None if unknown) of the running job"""
+    if _tracker is not None:
+        _tracker.start(step, total)
+
+
+def advance_progress(count: int = 1):
+    """Count processed frames of the current step of the running job"""
+    if _tracker is not None:
+        _tracker.advance(count)
+
+
+def current_progress() -> Optional[Dict[str, Any]]:
+    """Progress of the running job, None if no job is tracked"""
+    tracker = _tracker
+    return tracker.snapshot() if tracker is not None else None
@@ -0,0 +1,106 @@
+"""
+Proxy Utilities
+
+Utility functions for the low-resolution proxy rendition of uploaded videos.
+
+The proxy (`proxy/proxy.mp4`) is an H.264 copy of the upload scaled down to
+`PROXY_HEIGHT` with a keyframe every `PROXY_GOP_SECONDS`, so a seek only has to decode a
+fraction of a second of small frames. The same stream is also cut into HLS segments
+(`proxy/hls/index.m3u8`) without re-encoding. Frame timing is kept as is, so frame
+indices computed from the playback time match the original video.
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+
+PROXY_FOLDER_NAME = "proxy"
+PROXY_FILENAME = "proxy.mp4"
+PROXY_INFO_FILENAME = "proxy.json"
+HLS_FOLDER_NAME = "hls"
+HLS_PLAYLIST_FILENAME = "index.m3u8"
+
+# Height of the proxy rendition in pixels, videos are never scaled up
+PROXY_HEIGHT = int(os.environ.get("PROXY_HEIGHT", 480))
+# Keyframe interval of the proxy rendition in seconds
+PROXY_GOP_SECONDS = float(os.environ.get("PROXY_GOP_SECONDS", 0.5))
+# Target duration of the HLS segments in seconds
+HLS_SEGMENT_SECONDS = float(os.environ.get("HLS_SEGMENT_SECONDS", 2))
+
+HLS_CONTENT_TYPES = {".m3u8": "application/vnd.apple.mpegurl", ".ts": "video/mp2t"}
+
+
+def get_proxy_dir(video_dir: str) -> str:
+    return os.path.join(video_dir, PROXY_FOLDER_NAME)
+
+
+def get_proxy_path(video_dir: str) -> str:
+    return os.path.join(video_dir, PROXY_FOLDER_NAME, PROXY_FILENAME)
+
+
+def get_hls_dir(video_dir: str) -> str:
+    return os.path.join(video_dir, PROXY_FOLDER_NAME, HLS_FOLDER_NAME)
+
+
+def has_proxy(video_dir: str) -> bool:
+    # The proxy directory is only moved into place once everything in it is written
+    return os.path.exists(os.path.join(video_dir, PROXY_FOLDER_NAME, PROXY_INFO_FILENAME))
+
+
+def generate_proxy(video_file_path: str, video_dir: str, fps: float):
+    """
+    Encode the proxy rendition of a video and segment it for HLS
+
+    Args:
+        video_file_path: Path to the original video
+        video_dir: Directory of the video, the proxy is written to `proxy/` in it
+        fps: Frame rate of the video, used for the keyframe interval
+    """
+    gop_frames = max(1, round(fps * PROXY_GOP_SECONDS)) if fps > 0 else 15
+    tmp_dir = tempfile.mkdtemp(prefix=".proxy-", dir=video_dir)
+    try:
+        proxy_path = os.path.join(tmp_dir, PROXY_FILENAME)
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-y", "-i", video_file_path,
+                "-map", "0:v:0", "-map", "0:a:0?",
+                "-vf", f"scale=-2:min(ih\\,{PROXY_HEIGHT})", "-vsync", "passthrough",
+                "-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-pix_fmt", "yuv420p",
+                "-g", str(gop_frames), "-keyint_min", str(gop_frames), "-sc_threshold", "0",
+                "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart", proxy_path,
+            ],
+            check=True,
+        )  # fmt: skip
+
+        hls_dir = os.path.join(tmp_dir, HLS_FOLDER_NAME)
+        os.makedirs(hls_dir)
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-i", proxy_path, "-c", "copy",
+                "-f", "hls", "-hls_time", str(HLS_SEGMENT_SECONDS), "-hls_playlist_type", "vod",
+                "-hls_segment_filename", os.path.join(hls_dir, "segment_%05d.ts"),
+                os.path.join(hls_dir, HLS_PLAYLIST_FILENAME),
+            ],
+            check=True,
+        )  # fmt: skip
+
+        with open(os.path.join(tmp_dir, PROXY_INFO_FILENAME), "w", encoding="UTF-8") as f:
+            json.dump(
+                {
+                    "height": PROXY_HEIGHT,
+                    "gop_frames": gop_frames,
+                    "hls_segment_seconds": HLS_SEGMENT_SECONDS,
+                    "size": os.path.getsize(proxy_path),
+                },
+                f,
+                indent=2,
+            )
+
+        proxy_dir = get_proxy_dir(video_dir)
+        if os.path.exists(proxy_dir):
+            shutil.rmtree(proxy_dir)
+        os.replace(tmp_dir, proxy_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
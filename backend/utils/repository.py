@@ -0,0 +1,94 @@
+"""
+Repository Utilities
+
+Read access to the JSON artifacts of uploaded videos (`metadata.json`,
+`mainview_timestamp.json`, `segmentation.json`, `pose.json`) for the routers.
+
+File system access runs in the threadpool, so handlers never block the event loop. Parsed
+JSON is cached in memory keyed by path and validated against the modification time, size
+and inode of the file on every read: one `stat` replaces the open and parse, and artifacts
+rewritten in place or replaced with `os.replace` are picked up on the next read. Cached
+values are shared between callers and must not be modified.
+"""
+
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+METADATA_FILENAME = "metadata.json"
+MAINVIEW_FILENAME = "mainview_timestamp.json"
+SEGMENTATION_FILENAME = "segmentation.json"
+POSE_FILENAME = "pose.json"
+
+# Number of parsed artifacts kept in memory
+ARTIFACT_CACHE_ENTRIES = int(os.environ.get("ARTIFACT_CACHE_ENTRIES", 512))
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_json(path: str) -> Optional[Any]:
+    """
+    Read a JSON file through the cache
+
+    Returns:
+        Parsed content, or None if the file does not exist
+    """
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        return None
+    version = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+
+    with _cache_lock:
+        entry = _cache.get(path)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(path)
+            return entry[1]
+
+    try:
+        with open(path, "r", encoding="UTF-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    with _cache_lock:
+        _cache[path] = (version, data)
+        _cache.move_to_end(path)
+        while len(_cache) > ARTIFACT_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return data
+
+
+def is_canonical_uuid(value: str) -> bool:
+    """Whether a path parameter is a UUID in canonical form, so it can never leave its folder"""
+    try:
+        return str(uuid.UUID(value)) == value
+    except ValueError:
+        return False
+
+
+def is_video_dir(video_dir: str) -> bool:
+    return is_canonical_uuid(os.path.basename(video_dir)) and os.path.isdir(video_dir)
+
+
+async def video_exists(video_dir: str) -> bool:
+    return await run_in_threadpool(is_video_dir, video_dir)
+
+
+async def read_artifact(video_dir: str, filename: str) -> Optional[Any]:
+    """Read a JSON artifact of a video, None if it does not exist"""
+    return await run_in_threadpool(load_json, os.path.join(video_dir, filename))
+
+
+async def has_artifact(video_dir: str, filename: str) -> bool:
+    return await run_in_threadpool(os.path.exists, os.path.join(video_dir, filename))
+
+
+async def read_metadata(video_dir: str) -> Optional[dict]:
+    return await read_artifact(video_dir, METADATA_FILENAME)
@@ -0,0 +1,258 @@
+"""
+Streaming Utilities
+
+Utility functions for serving video files with HTTP range requests.
+
+Ranges follow RFC 9110: single, multiple (`multipart/byteranges`), open-ended (`500-`) and
+suffix (`-500`) ranges, with `If-Range`. Responses carry an `ETag` and `Last-Modified`, so
+players revalidate with `If-None-Match` / `If-Modified-Since` and get a 304 instead of the
+file. The body is sent with the ASGI zero-copy send extension (sendfile) when the server
+supports it, and with large aligned reads in a worker thread otherwise.
+"""
+
+import os
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# Size of the reads when the server does not support zero-copy send; reads after the
+# first one of a range are aligned to this size
+READ_SIZE = 1024 * 1024
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+CRLF = "\r\n"
+
+ByteRange = Tuple[int, int]
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when none of the requested ranges overlaps the file."""
+
+    def __init__(self, file_size: int):
+        super().__init__(f"Range Not Satisfiable for a file of {file_size} bytes")
+        self.file_size = file_size
+
+
+def parse_range_header(range_header: str, file_size: int) -> Optional[List[ByteRange]]:
+    """
+    Parse a `Range` header into inclusive (start, end) byte ranges
+
+    Overlapping and adjacent ranges are merged. Unsatisfiable ranges are dropped.
+
+    Returns:
+        Sorted list of byte ranges, or None if the header is not a valid bytes range
+        (the header is then ignored and the whole file is served)
+
+    Raises:
+        RangeNotSatisfiable: If no range overlaps the file
+    """
+    unit, _, range_set = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not range_set.strip():
+        return None
+
+    ranges = []
+    for range_spec in range_set.split(","):
+        range_spec = range_spec.strip()
+        if not range_spec:
+            continue
+        start_str, sep, end_str = range_spec.partition("-")
+        start_str, end_str = start_str.strip(), end_str.strip()
+        if not sep or not (start_str.isdigit() or start_str == "") or not (end_str.isdigit() or end_str == ""):
+            return None
+
+        if start_str == "":
+            # suffix range, the last N bytes
+            if end_str == "":
+                return None
+            suffix_length = int(end_str)
+            if suffix_length == 0:
+                continue
+            ranges.append((max(0, file_size - suffix_length), file_size - 1))
+            continue
+
+        start = int(start_str)
+        if end_str and int(end_str) < start:
+            return None
+        if start >= file_size:
+            continue
+        end = int(end_str) if end_str else file_size - 1
+        ranges.append((start, min(end, file_size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable(file_size)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def etag_matches(header_value: str, etag: str, weak: bool) -> bool:
+    for candidate in header_value.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _not_modified_since(header_value: str, stat_result: os.stat_result) -> bool:
+    try:
+        since = parsedate_to_datetime(header_value)
+    except (TypeError, ValueError):
+        return False
+    return int(stat_result.st_mtime) <= since.timestamp()
+
+
+def is_not_modified(headers: Mapping[str, str], stat_result: os.stat_result) -> bool:
+    """Whether a conditional GET can be answered with 304 Not Modified"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-Modified-Since is ignored when If-None-Match is present
+        return etag_matches(if_none_match, make_etag(stat_result), weak=True)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since is not None:
+        return _not_modified_since(if_modified_since, stat_result)
+    return False
+
+
+def range_applies(headers: Mapping[str, str], stat_result: os.stat_result) -> bool:
+    """Whether the `Range` header applies, i.e. `If-Range` is absent or still matches the file"""
+    if_range = headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range requires a strong comparison
+        return etag_matches(if_range, make_etag(stat_result), weak=False)
+    return if_range == formatdate(stat_result.st_mtime, usegmt=True)
+
+
+def cache_headers(stat_result: os.stat_result) -> dict:
+    return {
+        "ETag": make_etag(stat_result),
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+
+
+class FileRangeResponse(Response):
+    """
+    Response with the whole file, one byte range (206), or several byte ranges as
+    `multipart/byteranges` (206)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        file_size: int,
+        ranges: Optional[List[ByteRange]] = None,
+        media_type: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        self.path = path
+        self.file_size = file_size
+        self.media_type = media_type
+        self.background = None
+        self.body = b""
+        self.closing = b""
+        headers = dict(headers or {})
+
+        if not ranges:
+            self.status_code = 200
+            self.parts = [(b"", 0, file_size)]
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            self.status_code = 206
+            self.parts = [(b"", start, end - start + 1)]
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        else:
+            boundary = uuid.uuid4().hex
+            self.status_code = 206
+            self.parts = []
+            for i, (start, end) in enumerate(ranges):
+                part_header = (
+                    f"{'' if i == 0 else CRLF}--{boundary}{CRLF}"
+                    f"Content-Type: {media_type}{CRLF}"
+                    f"Content-Range: bytes {start}-{end}/{file_size}{CRLF}{CRLF}"
+                )
+                self.parts.append((part_header.encode("latin-1"), start, end - start + 1))
+            self.closing = f"{CRLF}--{boundary}--{CRLF}".encode("latin-1")
+            headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+        content_length = sum(len(part_header) + length for part_header, _, length in self.parts)
+        headers["Content-Length"] = str(content_length + len(self.closing))
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        zerocopy = ZEROCOPY_EXTENSION in scope.get("extensions", {})
+        f = await anyio.to_thread.run_sync(open, self.path, "rb")
+        try:
+            for part_header, offset, length in self.parts:
+                if part_header:
+                    await send({"type": "http.response.body", "body": part_header, "more_body": True})
+                if zerocopy:
+                    await send(
+                        {"type": ZEROCOPY_EXTENSION, "file": f, "offset": offset, "count": length, "more_body": True}
+                    )
+                    continue
+                while length > 0:
+                    # Read up to the next READ_SIZE boundary, so later reads are aligned
+                    size = min(length, READ_SIZE - offset % READ_SIZE)
+                    data = await anyio.to_thread.run_sync(os.pread, f.fileno(), size, offset)
+                    if not data:
+                        raise RuntimeError(f"{self.path} is shorter than {self.file_size} bytes")
+                    offset += len(data)
+                    length -= len(data)
+                    await send({"type": "http.response.body", "body": data, "more_body": True})
+            await send({"type": "http.response.body", "body": self.closing, "more_body": False})
+        finally:
+            await anyio.to_thread.run_sync(f.close)
+
+
+def range_file_response(
+    request_headers: Mapping[str, str],
+    path: str,
+    media_type: Optional[str] = None,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """
+    Answer a GET for a file: 304 if the client copy is current, 416 if no requested range
+    is satisfiable, otherwise the requested ranges or the whole file
+    """
+    stat_result = os.stat(path)
+    response_headers = {**cache_headers(stat_result), **(headers or {})}
+    if is_not_modified(request_headers, stat_result):
+        return Response(status_code=304, headers=response_headers)
+
+    ranges = None
+    range_header = request_headers.get("range")
+    if range_header is not None and range_applies(request_headers, stat_result):
+        try:
+            ranges = parse_range_header(range_header, stat_result.st_size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416, headers={**response_headers, "Content-Range": f"bytes */{stat_result.st_size}"}
+            )
+    return FileRangeResponse(path, stat_result.st_size, ranges, media_type=media_type, headers=response_headers)
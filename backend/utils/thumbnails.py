@@ -0,0 +1,185 @@
+"""
+Thumbnail Utilities
+
+Utility functions for the timeline preview thumbnails of uploaded videos.
+
+Thumbnails are taken every `THUMBNAIL_INTERVAL` seconds in a single ffmpeg pass (scaled
+down by the decoder and piped as raw frames) and tiled into JPEG sprite sheets of
+`THUMBNAIL_COLUMNS` x `THUMBNAIL_ROWS` tiles. `<THUMBNAILS_FOLDER>/<uuid>/` holds the
+sprites, a WebVTT index (`thumbnails.vtt`, the `#xywh=` media fragment format used by
+video players) and the same index as JSON (`thumbnails.json`). Sprite file names carry a
+generation id, so clients can cache them indefinitely.
+"""
+
+import json
+import math
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+from utils.progress import advance_progress, start_progress
+from utils.repository import is_canonical_uuid
+
+THUMBNAILS_FOLDER = os.environ.get("THUMBNAILS_FOLDER", "/data/thumbnails")
+THUMBNAIL_INDEX_FILENAME = "thumbnails.json"
+THUMBNAIL_VTT_FILENAME = "thumbnails.vtt"
+
+# Seconds between thumbnails
+THUMBNAIL_INTERVAL = float(os.environ.get("THUMBNAIL_INTERVAL", 1))
+# Width of a thumbnail in pixels, the height follows the aspect ratio of the video
+THUMBNAIL_WIDTH = int(os.environ.get("THUMBNAIL_WIDTH", 160))
+THUMBNAIL_COLUMNS = 10
+THUMBNAIL_ROWS = 10
+
+
+def get_thumbnails_dir(video_uuid: str) -> str:
+    """
+    Raises:
+        FileNotFoundError: If `video_uuid` is not a video UUID, so it can never point outside
+            the thumbnails folder
+    """
+    if not is_canonical_uuid(video_uuid):
+        raise FileNotFoundError(f"Thumbnails not found: {video_uuid}")
+    return os.path.join(THUMBNAILS_FOLDER, video_uuid)
+
+
+def has_thumbnails(video_uuid: str) -> bool:
+    # The index is written last, once every sprite is in place
+    return os.path.exists(os.path.join(get_thumbnails_dir(video_uuid), THUMBNAIL_INDEX_FILENAME))
+
+
+def _format_vtt_time(seconds: float) -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def build_vtt(index: Dict[str, Any]) -> str:
+    """Render a thumbnail index as WebVTT cues pointing into the sprite sheets"""
+    width, height = index["width"], index["height"]
+    tiles_per_sprite = index["columns"] * index["rows"]
+    lines = ["WEBVTT", ""]
+    for i in range(index["count"]):
+        sprite, tile = divmod(i, tiles_per_sprite)
+        row, column = divmod(tile, index["columns"])
+        start_time = i * index["interval"]
+        end_time = min((i + 1) * index["interval"], index["duration"]) if index["duration"] else start_time
+        end_time = max(end_time, start_time + 0.001)
+        lines.append(f"{_format_vtt_time(start_time)} --> {_format_vtt_time(end_time)}")
+        lines.append(f"{index['sprites'][sprite]}#xywh={column * width},{row * height},{width},{height}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_thumbnails(video_file_path: str, video_uuid: str, width: int, height: int, duration: float):
+    """
+    Build the thumbnail sprite sheets and index of a video
+
+    Args:
+        video_file_path: Video to take the thumbnails from (the proxy rendition decodes fastest)
+        video_uuid: UUID of the uploaded video
+        width: Width of the video in pixels
+        height: Height of the video in pixels
+        duration: Duration of the video in seconds
+    """
+    tile_width = THUMBNAIL_WIDTH
+    # Even height, as ffmpeg's `scale=W:-2` would choose
+    tile_height = max(2, int(round(THUMBNAIL_WIDTH * height / width / 2)) * 2) if width > 0 else THUMBNAIL_WIDTH
+    tiles_per_sprite = THUMBNAIL_COLUMNS * THUMBNAIL_ROWS
+    generation = uuid.uuid4().hex[:8]
+
+    os.makedirs(THUMBNAILS_FOLDER, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{video_uuid}-", dir=THUMBNAILS_FOLDER)
+    try:
+        process = subprocess.Popen(
+            [
+                "ffmpeg", "-v", "error", "-i", video_file_path, "-map", "0:v:0",
+                "-vf", f"fps=1/{THUMBNAIL_INTERVAL},scale={tile_width}:{tile_height}",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "pipe:1",
+            ],
+            stdout=subprocess.PIPE,
+        )  # fmt: skip
+
+        start_progress("thumbnails", math.ceil(duration / THUMBNAIL_INTERVAL) if duration else None)
+        frame_bytes = tile_width * tile_height * 3
+        sprites: List[str] = []
+        count = 0
+        sprite = None
+        try:
+            while True:
+                data = process.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                tile = count % tiles_per_sprite
+                if tile == 0:
+                    sprite = np.zeros((THUMBNAIL_ROWS * tile_height, THUMBNAIL_COLUMNS * tile_width, 3), np.uint8)
+                row, column = divmod(tile, THUMBNAIL_COLUMNS)
+                sprite[row * tile_height : (row + 1) * tile_height, column * tile_width : (column + 1) * tile_width] = (
+                    np.frombuffer(data, np.uint8).reshape(tile_height, tile_width, 3)
+                )
+                count += 1
+                advance_progress()
+                if tile == tiles_per_sprite - 1:
+                    sprites.append(_write_sprite(tmp_dir, generation, len(sprites), sprite, tile_height, count))
+                    sprite = None
+            if sprite is not None:
+                sprites.append(_write_sprite(tmp_dir, generation, len(sprites), sprite, tile_height, count))
+        except BaseException:
+            # Stop ffmpeg when reading is interrupted, e.g. by a cancelled job
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            process.stdout.close()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+
+        index = {
+            "interval": THUMBNAIL_INTERVAL,
+            "width": tile_width,
+            "height": tile_height,
+            "columns": THUMBNAIL_COLUMNS,
+            "rows": THUMBNAIL_ROWS,
+            "count": count,
+            "duration": duration,
+            "sprites": sprites,
+        }
+        with open(os.path.join(tmp_dir, THUMBNAIL_VTT_FILENAME), "w", encoding="UTF-8") as f:
+            f.write(build_vtt(index))
+        with open(os.path.join(tmp_dir, THUMBNAIL_INDEX_FILENAME), "w", encoding="UTF-8") as f:
+            json.dump(index, f, indent=2)
+
+        thumbnails_dir = get_thumbnails_dir(video_uuid)
+        if os.path.exists(thumbnails_dir):
+            shutil.rmtree(thumbnails_dir)
+        os.replace(tmp_dir, thumbnails_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _write_sprite(tmp_dir: str, generation: str, sprite_idx: int, sprite: np.ndarray, tile_height: int, count: int):
+    # Crop the unused rows of the last sprite sheet
+    tiles_per_sprite = THUMBNAIL_COLUMNS * THUMBNAIL_ROWS
+    used_tiles = count - sprite_idx * tiles_per_sprite
+    used_rows = -(-used_tiles // THUMBNAIL_COLUMNS)
+    sprite_filename = f"sprite_{generation}_{sprite_idx:04d}.jpg"
+    ok, data = cv2.imencode(".jpg", sprite[: used_rows * tile_height], [cv2.IMWRITE_JPEG_QUALITY, 75])
+    if not ok:
+        raise RuntimeError(f"Could not encode thumbnail sprite {sprite_filename}")
+    with open(os.path.join(tmp_dir, sprite_filename), "wb") as f:
+        f.write(data.tobytes())
+    return sprite_filename
+
+
+def delete_thumbnails(video_uuid: str):
+    thumbnails_dir = get_thumbnails_dir(video_uuid)
+    if os.path.exists(thumbnails_dir):
+        shutil.rmtree(thumbnails_dir)
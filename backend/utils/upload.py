@@ -0,0 +1,323 @@
+"""
+Upload Utilities
+
+Utility functions for resumable, chunked video uploads.
+
+An upload session lives in `<UPLOAD_FOLDER>/.incomplete/<upload_id>/` and holds the
+partially received file (`data.part`) next to its state (`session.json`). Chunks are
+appended at an explicit byte offset and verified against a SHA-256 checksum before the
+new offset is acknowledged, so an interrupted client can ask for the last acknowledged
+offset and continue from there. Appends to a session are serialized by a lock on its
+`session.lock` file, across requests and API processes.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from utils.repository import is_canonical_uuid
+
+INCOMPLETE_FOLDER_NAME = ".incomplete"
+SESSION_FILENAME = "session.json"
+PART_FILENAME = "data.part"
+LOCK_FILENAME = "session.lock"
+
+# Suggested chunk size for clients; the server accepts any chunk size
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# Buffer size used when copying request bodies to disk
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# Running SHA-256 of the acknowledged bytes of each session, keyed by upload_id and stored
+# as (offset, hasher). Hashers cannot be persisted, so after a restart the content hash is
+# recomputed from disk on finalize.
+_content_hashers: Dict[str, Tuple[int, Any]] = {}
+
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+    content_type: str
+
+
+class UploadOffsetError(Exception):
+    """Raised when a chunk does not start at the last acknowledged offset."""
+
+    def __init__(self, expected_offset: int, received_offset: int):
+        super().__init__(f"Expected offset {expected_offset}, received {received_offset}")
+        self.expected_offset = expected_offset
+        self.received_offset = received_offset
+
+
+class UploadChecksumError(Exception):
+    """Raised when a chunk does not match its checksum."""
+
+
+def get_session_dir(upload_folder: str, upload_id: str) -> str:
+    """
+    Raises:
+        FileNotFoundError: If `upload_id` is not a session ID (a UUID), so it can never
+            point outside the sessions folder
+    """
+    if not is_canonical_uuid(upload_id):
+        raise FileNotFoundError(f"Upload session not found: {upload_id}")
+    return os.path.join(upload_folder, INCOMPLETE_FOLDER_NAME, upload_id)
+
+
+async def _lock_session(session_dir: str) -> int:
+    # Poll instead of blocking a thread on the lock, so a cancelled request never leaves a
+    # thread acquiring a lock nobody releases
+    fd = os.open(os.path.join(session_dir, LOCK_FILENAME), os.O_RDWR | os.O_CREAT)
+    try:
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                await asyncio.sleep(0.05)
+    except BaseException:
+        os.close(fd)
+        raise
+
+
+def _write_session(session_dir: str, session: Dict[str, Any]):
+    # Write to a temporary file first so a crash never leaves a truncated session.json
+    session_path = os.path.join(session_dir, SESSION_FILENAME)
+    tmp_path = f"{session_path}.tmp"
+    with open(tmp_path, "w", encoding="UTF-8") as f:
+        json.dump(session, f, indent=2)
+    os.replace(tmp_path, session_path)
+
+
+def read_session(upload_folder: str, upload_id: str) -> Dict[str, Any]:
+    """
+    Read the state of an upload session
+
+    Raises:
+        FileNotFoundError: If the upload session does not exist
+    """
+    session_path = os.path.join(get_session_dir(upload_folder, upload_id), SESSION_FILENAME)
+    if not os.path.exists(session_path):
+        raise FileNotFoundError(f"Upload session not found: {upload_id}")
+
+    with open(session_path, "r", encoding="UTF-8") as f:
+        return json.load(f)
+
+
+def create_session(upload_folder: str, filename: str, size: int, content_type: str) -> Dict[str, Any]:
+    """
+    Create a new upload session
+
+    Args:
+        upload_folder: Root folder of all uploads
+        filename: Original filename of the video
+        size: Total size of the video in bytes
+        content_type: MIME type of the video
+
+    Returns:
+        Dictionary containing the session state
+    """
+    upload_id = str(uuid.uuid4())
+    session_dir = get_session_dir(upload_folder, upload_id)
+    os.makedirs(session_dir, exist_ok=True)
+
+    # Create the empty part file so the offset can always be derived from disk
+    open(os.path.join(session_dir, PART_FILENAME), "wb").close()
+
+    now = time.time()
+    session = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "size": size,
+        "content_type": content_type,
+        "offset": 0,
+        "chunks": [],
+        "created": now,
+        "updated": now,
+        "chunk_size": DEFAULT_CHUNK_SIZE,
+    }
+    _write_session(session_dir, session)
+    return session
+
+
+def _open_part_at(part_path: str, offset: int):
+    # Drop any bytes past the last acknowledged offset (e.g. from a chunk that was
+    # interrupted mid-transfer) before appending
+    f = open(part_path, "r+b")
+    f.truncate(offset)
+    f.seek(offset)
+    return f
+
+
+async def append_chunk(
+    upload_folder: str,
+    upload_id: str,
+    offset: int,
+    stream: AsyncIterator[bytes],
+    checksum: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Append a chunk to an upload session without blocking the event loop
+
+    Args:
+        upload_folder: Root folder of all uploads
+        upload_id: ID of the upload session
+        offset: Byte offset the chunk starts at, must equal the acknowledged offset
+        stream: Async iterator over the chunk body
+        checksum: Optional hex-encoded SHA-256 digest of the chunk
+
+    Returns:
+        Dictionary containing the updated session state
+
+    Raises:
+        FileNotFoundError: If the upload session does not exist
+        UploadOffsetError: If `offset` is not the acknowledged offset
+        UploadChecksumError: If the chunk does not match `checksum`
+    """
+    session_dir = get_session_dir(upload_folder, upload_id)
+    # Concurrent chunks at the same acknowledged offset would both pass the offset check
+    lock_fd = await _lock_session(session_dir)
+    try:
+        return await _append_chunk_locked(upload_folder, upload_id, session_dir, offset, stream, checksum)
+    finally:
+        # Closing the file releases the lock
+        os.close(lock_fd)
+
+
+async def _append_chunk_locked(
+    upload_folder: str,
+    upload_id: str,
+    session_dir: str,
+    offset: int,
+    stream: AsyncIterator[bytes],
+    checksum: Optional[str],
+) -> Dict[str, Any]:
+    session = await run_in_threadpool(read_session, upload_folder, upload_id)
+    if offset != session["offset"]:
+        raise UploadOffsetError(session["offset"], offset)
+
+    part_path = os.path.join(session_dir, PART_FILENAME)
+
+    hasher = hashlib.sha256()
+    content_hasher = None
+    hashed_offset, running_hasher = _content_hashers.get(upload_id, (0, hashlib.sha256()))
+    if hashed_offset == offset:
+        # Update a copy so a failed chunk leaves the running hash untouched
+        content_hasher = running_hasher.copy()
+    length = 0
+    f = await run_in_threadpool(_open_part_at, part_path, offset)
+    try:
+        async for data in stream:
+            if not data:
+                continue
+            hasher.update(data)
+            if content_hasher is not None:
+                content_hasher.update(data)
+            length += len(data)
+            if offset + length > session["size"]:
+                raise ValueError(f"Chunk exceeds the declared upload size of {session['size']} bytes")
+            await run_in_threadpool(f.write, data)
+        await run_in_threadpool(f.flush)
+    except BaseException:
+        # Roll back to the acknowledged offset on any failure or disconnect
+        await run_in_threadpool(f.truncate, offset)
+        raise
+    finally:
+        await run_in_threadpool(f.close)
+
+    digest = hasher.hexdigest()
+    if checksum is not None and checksum.lower() != digest:
+        await run_in_threadpool(_truncate, part_path, offset)
+        raise UploadChecksumError(f"Checksum mismatch at offset {offset}: expected {checksum}, computed {digest}")
+
+    if content_hasher is not None:
+        _content_hashers[upload_id] = (offset + length, content_hasher)
+    session["offset"] = offset + length
+    session["chunks"].append({"offset": offset, "length": length, "sha256": digest})
+    session["updated"] = time.time()
+    await run_in_threadpool(_write_session, session_dir, session)
+    return session
+
+
+def _truncate(path: str, size: int):
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+
+def hash_file(file_path: str) -> str:
+    """Compute the hex-encoded SHA-256 of a file"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while True:
+            data = f.read(COPY_BUFFER_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def finalize_session(upload_folder: str, upload_id: str, video_file_path: str) -> Dict[str, Any]:
+    """
+    Move a completely received upload to its final location and remove the session
+
+    The returned session state carries the SHA-256 of the whole file as `content_hash`.
+
+    Raises:
+        FileNotFoundError: If the upload session does not exist
+        ValueError: If the upload is not complete yet
+    """
+    session = read_session(upload_folder, upload_id)
+    if session["offset"] != session["size"]:
+        raise ValueError(f"Upload incomplete: received {session['offset']} of {session['size']} bytes")
+
+    session_dir = get_session_dir(upload_folder, upload_id)
+    part_path = os.path.join(session_dir, PART_FILENAME)
+    if os.path.getsize(part_path) != session["size"]:
+        raise ValueError(f"Upload data on disk does not match the declared size of {session['size']} bytes")
+
+    hashed_offset, content_hasher = _content_hashers.pop(upload_id, (0, None))
+    if content_hasher is not None and hashed_offset == session["size"]:
+        session["content_hash"] = content_hasher.hexdigest()
+    else:
+        session["content_hash"] = hash_file(part_path)
+
+    os.makedirs(os.path.dirname(video_file_path), exist_ok=True)
+    os.replace(part_path, video_file_path)
+    shutil.rmtree(session_dir, ignore_errors=True)
+    return session
+
+
+def delete_session(upload_folder: str, upload_id: str):
+    _content_hashers.pop(upload_id, None)
+    session_dir = get_session_dir(upload_folder, upload_id)
+    if os.path.exists(session_dir):
+        shutil.rmtree(session_dir)
+
+
+async def save_upload_file(file, destination_path: str) -> str:
+    """
+    Copy an `UploadFile` to disk in blocks without blocking the event loop
+
+    Returns:
+        Hex-encoded SHA-256 of the written content
+    """
+    hasher = hashlib.sha256()
+    f = await run_in_threadpool(open, destination_path, "wb")
+    try:
+        while True:
+            data = await file.read(COPY_BUFFER_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+            await run_in_threadpool(f.write, data)
+    finally:
+        await run_in_threadpool(f.close)
+    return hasher.hexdigest()
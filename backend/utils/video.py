@@ -4,15 +4,38 @@ Video Utilities
 Utility functions for video processing.
 """
 
+import json
 import os
 import subprocess
-from typing import Any, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
 import cv2
 import numpy as np
 
+from utils.framepack import pack_frames_dir
+from utils.progress import advance_progress, start_progress
 
-def extract_frames(video_file_path: str, video_file_dir: str):
+# Written into `frames/` once every frame of the video has been extracted, recording the
+# output options the frames were extracted with
+FRAMES_COMPLETE_MARKER = ".complete"
+# Output options writing every decoded frame as a JPEG numbered in decoding order: timestamps
+# are passed through (no frames duplicated or dropped for variable frame rates) in the time
+# base of the input, since a coarser encoder time base rejects frames closer than a tick
+FRAME_OUTPUT_OPTIONS = ["-vsync", "passthrough", "-enc_time_base", "-1", "-q:v", "10"]
+# Number of concurrent ffmpeg processes used to extract frames (1 disables parallel extraction)
+FRAME_EXTRACTION_WORKERS = int(os.environ.get("FRAME_EXTRACTION_WORKERS", min(8, os.cpu_count() or 1)))
+# "full" extracts every frame at upload time, "lazy" only extracts the frames a stage asks for
+FRAME_EXTRACTION_MODE = os.environ.get("FRAME_EXTRACTION_MODE", "full")
+# "files" keeps fully extracted frames as JPEG files, "pack" moves them into a frame pack
+FRAME_STORAGE = os.environ.get("FRAME_STORAGE", "files")
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def extract_frames(video_file_path: str, video_file_dir: str, workers: Optional[int] = None):
     """Extract frames from video using ffmpeg in background"""
     # Create subdirectory for each frames for future use
     frames_dir = os.path.join(video_file_dir, "frames/")
@@ -22,10 +45,269 @@ def extract_frames(video_file_path: str, video_file_dir: str):
     pose_dir = os.path.join(video_file_dir, "pose/")
     os.makedirs(pose_dir, exist_ok=True)
 
-    subprocess.run(["ffmpeg", "-i", video_file_path, "-q:v", "10", "-start_number", "0", f"{frames_dir}/%06d.jpg", ])  # fmt: skip
+    if FRAME_EXTRACTION_MODE == "lazy":
+        # Frames are extracted on demand by `utils.frames.FrameStore`
+        extracted = False
+    else:
+        extracted = extract_all_frames(video_file_path, frames_dir, workers)
+        if extracted and FRAME_STORAGE == "pack":
+            pack_frames_dir(frames_dir, video_file_dir, remove_frames=True)
+
+    if extracted:
+        write_frames_marker(frames_dir)
     subprocess.run(["ffmpeg", "-i", video_file_path, "-q:a", "10", "-map", "a", f"{video_file_dir}.mp4", ])  # fmt: skip
 
 
+def write_frames_marker(frames_dir: str):
+    """Mark every frame of a video as extracted with the current output options"""
+    with open(os.path.join(frames_dir, FRAMES_COMPLETE_MARKER), "w", encoding="UTF-8") as f:
+        json.dump({"output_options": FRAME_OUTPUT_OPTIONS}, f)
+
+
+def has_current_frames(frames_dir: str) -> bool:
+    """
+    Whether every frame of a video was extracted with the current output options
+
+    Markers written before the options were recorded are empty. Their frames may be numbered
+    differently, since variable frame rate videos used to get frames duplicated and dropped.
+    """
+    marker_path = os.path.join(frames_dir, FRAMES_COMPLETE_MARKER)
+    if not os.path.exists(marker_path):
+        return False
+    try:
+        with open(marker_path, "r", encoding="UTF-8") as f:
+            return json.load(f).get("output_options") == FRAME_OUTPUT_OPTIONS
+    except ValueError:
+        return False
+
+
+def extract_all_frames(video_file_path: str, frames_dir: str, workers: Optional[int] = None) -> bool:
+    """Extract every frame, in parallel if possible"""
+    if workers is None:
+        workers = FRAME_EXTRACTION_WORKERS
+
+    extracted = False
+    if workers > 1:
+        try:
+            extracted = extract_frames_parallel(video_file_path, frames_dir, workers)
+        except (subprocess.CalledProcessError, ValueError) as e:
+            print(f"Parallel frame extraction failed: {e}")
+        if not extracted:
+            print("Falling back to single process frame extraction")
+            _remove_frames(frames_dir)
+    if not extracted:
+        extracted = extract_frames_single(video_file_path, frames_dir)
+    return extracted
+
+
+def extract_frames_single(video_file_path: str, frames_dir: str) -> bool:
+    """Extract all frames with a single ffmpeg process"""
+    start_progress("frames", None)
+    # Same output options as the parallel extraction, so both number the frames of variable
+    # frame rate videos the same way
+    result = subprocess.run(
+        [
+            "ffmpeg", "-i", video_file_path, "-map", "0:v:0", *FRAME_OUTPUT_OPTIONS,
+            "-start_number", "0", f"{frames_dir}/%06d.jpg",
+        ]
+    )  # fmt: skip
+    return result.returncode == 0
+
+
+def extract_frames_parallel(video_file_path: str, frames_dir: str, workers: int) -> bool:
+    """
+    Extract all frames with concurrent ffmpeg processes over keyframe-aligned ranges
+
+    Every worker seeks to a keyframe, decodes an exact number of frames and numbers its
+    output from the global index of that keyframe, so the workers together write the same
+    `%06d.jpg` sequence as a single process.
+
+    Args:
+        video_file_path: Path to the video file
+        frames_dir: Directory to write the frames to
+        workers: Number of concurrent ffmpeg processes
+
+    Returns:
+        True if every frame was extracted without gaps in the numbering
+    """
+    keyframe_times, keyframe_indices, total_frames = probe_keyframes(video_file_path)
+    ranges = split_frame_ranges(keyframe_times, keyframe_indices, total_frames, workers)
+    if len(ranges) < 2:
+        return extract_frames_single(video_file_path, frames_dir)
+
+    # Share the cores between the workers instead of oversubscribing them
+    threads = max(1, (os.cpu_count() or 1) // len(ranges))
+    start_progress("frames", total_frames)
+
+    def run_worker(frame_range: Tuple[float, int, int], processes: "ProcessGroup"):
+        start_time, start_frame, num_frames = frame_range
+        # Seek a millisecond before the keyframe (well under a frame duration), so rounding
+        # of the printed timestamp never drops the keyframe itself
+        seek_time = max(0.0, start_time - 0.001)
+        process = processes.popen(
+            [
+                "ffmpeg", "-v", "error", "-threads", str(threads),
+                "-ss", f"{seek_time:.6f}", "-i", video_file_path,
+                "-map", "0:v:0", "-frames:v", str(num_frames), *FRAME_OUTPUT_OPTIONS,
+                "-start_number", str(start_frame), f"{frames_dir}/%06d.jpg",
+            ]
+        )  # fmt: skip
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+        advance_progress(num_frames)
+
+    run_sharded(run_worker, ranges)
+
+    missing_frames = find_missing_frames(frames_dir, total_frames)
+    if missing_frames:
+        print(f"Parallel frame extraction left {len(missing_frames)} gaps, first missing frame {missing_frames[0]}")
+        return False
+    return True
+
+
+def probe_keyframes(video_file_path: str) -> Tuple[List[float], List[int], int]:
+    """
+    Find the keyframes of the first video stream with ffprobe (demuxing only, no decoding)
+
+    Returns:
+        Tuple of keyframe times in seconds from the start of the file, the index of each
+        keyframe in presentation order, and the total number of frames
+    """
+    start_time_output = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=start_time", "-of", "csv=p=0", video_file_path],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()  # fmt: skip
+    start_time = float(start_time_output) if start_time_output not in ("", "N/A") else 0.0
+
+    packets_output = subprocess.run(
+        [
+            "ffprobe", "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", video_file_path,
+        ],
+        capture_output=True, text=True, check=True,
+    ).stdout  # fmt: skip
+
+    pts_times = []
+    keyframe_pts_times = []
+    for line in packets_output.splitlines():
+        fields = line.strip().split(",")
+        if len(fields) < 2 or fields[0] == "N/A":
+            continue
+        pts_time = float(fields[0])
+        pts_times.append(pts_time)
+        if fields[1].startswith("K"):
+            keyframe_pts_times.append(pts_time)
+    if not pts_times:
+        raise ValueError(f"No video packets found in {video_file_path}")
+
+    # Packets are in decoding order, the frame index of a keyframe is the number of frames
+    # presented before it
+    pts_times = np.sort(np.asarray(pts_times))
+    keyframe_pts_times = np.asarray(keyframe_pts_times)
+    keyframe_indices = np.searchsorted(pts_times, keyframe_pts_times, side="left")
+    keyframe_times = keyframe_pts_times - start_time
+    return keyframe_times.tolist(), keyframe_indices.tolist(), len(pts_times)
+
+
+def split_frame_ranges(
+    keyframe_times: List[float], keyframe_indices: List[int], total_frames: int, workers: int
+) -> List[Tuple[float, int, int]]:
+    """
+    Split a video into at most `workers` keyframe-aligned ranges of similar length
+
+    Returns:
+        List of (start time, start frame, number of frames) per range
+    """
+    keyframes = sorted(set(zip(keyframe_indices, keyframe_times)))
+    if not keyframes or keyframes[0][0] != 0:
+        # The first frame is not a keyframe we know of, extraction must start at the beginning
+        keyframes = [(0, 0.0)] + keyframes
+
+    starts = []
+    for k in range(workers):
+        target_frame = k * total_frames / workers
+        # Keyframe closest to the ideal split point
+        start = min(keyframes, key=lambda keyframe: abs(keyframe[0] - target_frame))
+        if not starts or start[0] > starts[-1][0]:
+            starts.append(start)
+
+    ranges = []
+    for i, (start_frame, start_time) in enumerate(starts):
+        end_frame = starts[i + 1][0] if i + 1 < len(starts) else total_frames
+        if end_frame > start_frame:
+            ranges.append((start_time, start_frame, end_frame - start_frame))
+    return ranges
+
+
+class ProcessGroup:
+    """
+    Child processes started by the threads of a sharded run, see `run_sharded`
+    """
+
+    def __init__(self):
+        self.processes: List[subprocess.Popen] = []
+        self.killed = False
+        self._lock = threading.Lock()
+
+    def popen(self, command: List[str], **kwargs) -> subprocess.Popen:
+        """Start a process of the group, unless the group was killed"""
+        with self._lock:
+            if self.killed:
+                raise RuntimeError("The sharded run was interrupted")
+            process = subprocess.Popen(command, **kwargs)
+            self.processes.append(process)
+        return process
+
+    def kill(self):
+        """Kill the running processes of the group and keep it from starting new ones"""
+        with self._lock:
+            self.killed = True
+            for process in self.processes:
+                if process.poll() is None:
+                    process.kill()
+
+
+def run_sharded(function: Callable[[T, ProcessGroup], R], shards: Sequence[T]) -> List[R]:
+    """
+    Run `function(shard, processes)` over every shard in its own thread, starting its child
+    processes (ffmpeg) through `processes`
+
+    A signal only interrupts the main thread, e.g. the SIGINT of a cancelled job, so when the
+    wait is interrupted or a shard fails, the processes of every shard are killed and the
+    threads are left to finish on their own instead of being waited for.
+
+    Returns:
+        Results of the shards in order
+    """
+    processes = ProcessGroup()
+    executor = ThreadPoolExecutor(max_workers=max(1, len(shards)))
+    try:
+        futures = [executor.submit(function, shard, processes) for shard in shards]
+        results = [future.result() for future in futures]
+    except BaseException:
+        processes.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return results
+
+
+def find_missing_frames(frames_dir: str, total_frames: int) -> List[int]:
+    """Find the frame indices in [0, total_frames) without a `%06d.jpg` file"""
+    extracted = set()
+    for frame_name in os.listdir(frames_dir):
+        name, ext = os.path.splitext(frame_name)
+        if ext == ".jpg" and name.isdigit():
+            extracted.add(int(name))
+    return [frame_idx for frame_idx in range(total_frames) if frame_idx not in extracted]
+
+
+def _remove_frames(frames_dir: str):
+    for frame_name in os.listdir(frames_dir):
+        if os.path.splitext(frame_name)[-1] == ".jpg":
+            os.remove(os.path.join(frames_dir, frame_name))
+
+
 def get_video_info(video_path: str) -> Dict[str, Any]:
     """
     Get video metadata (duration, dimensions, fps, etc.)
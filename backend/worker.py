@@ -0,0 +1,331 @@
+"""
+Job Worker
+
+Worker processes running the processing jobs queued in `utils.jobs`.
+
+A worker claims jobs of the stages it serves and keeps the models of these stages loaded
+between jobs. Unless `JOB_WORKERS` is "external", the API starts a pool with one worker
+process per concurrent job of every stage (`JOB_CONCURRENCY`). Workers can also run on their
+own, on the host of the upload folder (the queue is a SQLite database, which does not work
+over network file systems):
+
+    python worker.py --stages segmentation pose
+"""
+
+import argparse
+import functools
+import multiprocessing
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.catalog import update_video
+from utils.dedup import link_duplicate_artifacts, reuse_mainview, reuse_pose, reuse_segmentation
+from utils.jobs import (
+    JOB_CONCURRENCY,
+    JOB_STAGES,
+    claim_job,
+    complete_job,
+    fail_job,
+    heartbeat_job,
+    release_job,
+    release_worker_jobs,
+    set_job_progress,
+    worker_name,
+)
+from utils.preprocess import generate_mainview_timestamp
+from utils.progress import PeakMemorySampler, current_progress, start_progress, track_progress
+from utils.proxy import generate_proxy, get_proxy_path, has_proxy
+from utils.repository import METADATA_FILENAME, load_json
+from utils.thumbnails import generate_thumbnails
+from utils.video import extract_frames
+
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "/data/uploads")
+# "embedded" runs the workers in processes started by the API, "external" leaves them to
+# `python worker.py`
+JOB_WORKERS = os.environ.get("JOB_WORKERS", "embedded")
+# Seconds between two polls of the queue by an idle worker
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1))
+# Seconds between two heartbeats of a running job, which is also how fast it reacts to a cancellation
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get("JOB_HEARTBEAT_INTERVAL", 5))
+
+
+# MARK: stages
+def prepare_video(upload_folder: str, video_uuid: str, params: Dict[str, Any]):
+    """
+    Reuse the artifacts of an earlier upload of the same content, or extract frames and
+    generate the proxy rendition and thumbnails
+    """
+    video_dir = os.path.join(upload_folder, video_uuid)
+    metadata = load_json(os.path.join(video_dir, METADATA_FILENAME))
+    video_file_path = os.path.join(video_dir, metadata["filename"])
+
+    reused = link_duplicate_artifacts(upload_folder, video_dir)
+    if any(reused.values()):
+        print(f"Reused artifacts of a duplicate upload for {video_dir}: {reused}")
+
+    # Frames come first, segmentation and pose only need them, while playback falls back to
+    # the original video until the proxy exists
+    if not reused["frames"]:
+        start_progress("frames", None)
+        extract_frames(video_file_path, video_dir)
+        update_video(upload_folder, video_uuid)
+
+    if not reused["proxy"]:
+        start_progress("proxy", None)
+        try:
+            generate_proxy(video_file_path, video_dir, metadata["fps"])
+        except (subprocess.CalledProcessError, OSError) as e:
+            # Playback falls back to the original video
+            print(f"Error generating the proxy of {video_dir}: {e}")
+
+    build_thumbnails(upload_folder, video_uuid, params)
+
+    update_video(upload_folder, video_uuid)
+
+
+def build_thumbnails(upload_folder: str, video_uuid: str, params: Dict[str, Any]):
+    """
+    Generate the timeline thumbnails of a video, from the proxy rendition when there is one
+    """
+    video_dir = os.path.join(upload_folder, video_uuid)
+    metadata = load_json(os.path.join(video_dir, METADATA_FILENAME))
+    if metadata is None:
+        print(f"Cannot generate the thumbnails of {video_uuid}: no metadata")
+        return
+    try:
+        video_file_path = os.path.join(video_dir, metadata["filename"])
+        if has_proxy(video_dir):
+            video_file_path = get_proxy_path(video_dir)
+        generate_thumbnails(
+            video_file_path, video_uuid, metadata["width"], metadata["height"], metadata["duration_seconds"]
+        )
+    except (subprocess.CalledProcessError, OSError, RuntimeError) as e:
+        # The timeline works without previews
+        print(f"Error generating the thumbnails of {video_uuid}: {e}")
+
+
+def detect_main_view(upload_folder: str, video_uuid: str, params: Dict[str, Any]):
+    """
+    Generate the main view timestamps of a video, optionally from labelled `reference_frames`
+    """
+    video_dir = os.path.join(upload_folder, video_uuid)
+    reference_frames = params.get("reference_frames")
+    # Reuse the timestamps of a duplicate upload if there is one, unless views are labelled
+    if reference_frames or not reuse_mainview(upload_folder, video_dir):
+        metadata = load_json(os.path.join(video_dir, METADATA_FILENAME))
+        generate_mainview_timestamp(os.path.join(video_dir, metadata["filename"]), video_dir, reference_frames)
+    update_video(upload_folder, video_uuid)
+
+
+def segment_players(upload_folder: str, video_uuid: str, params: Dict[str, Any]):
+    """
+    Segment the players of a video with SAM2 from the `marker_input` of every chunk
+    """
+    # Models are only imported by the workers that run them
+    from models.segmentation_sam2 import run_sam2_segmentation
+
+    video_dir = os.path.join(upload_folder, video_uuid)
+    marker_input = params["marker_input"]
+    # Reuse the segmentation of a duplicate upload with the same markers if there is one
+    if not reuse_segmentation(upload_folder, video_dir, marker_input):
+        run_sam2_segmentation(video_dir, marker_input)
+    update_video(upload_folder, video_uuid)
+
+
+def estimate_poses(upload_folder: str, video_uuid: str, params: Dict[str, Any]):
+    """
+    Detect the poses of the segmented players of a video with YOLO-Pose
+    """
+    from models.pose_yolo_pose import run_yolo_pose_estimation
+
+    video_dir = os.path.join(upload_folder, video_uuid)
+    # Reuse the pose results of a duplicate upload with the same segmentation if there is one
+    if not reuse_pose(upload_folder, video_dir):
+        run_yolo_pose_estimation(video_dir)
+    update_video(upload_folder, video_uuid)
+
+
+STAGE_HANDLERS: Dict[str, Callable[[str, str, Dict[str, Any]], None]] = {
+    "prepare": prepare_video,
+    "thumbnails": build_thumbnails,
+    "mainview": detect_main_view,
+    "segmentation": segment_players,
+    "pose": estimate_poses,
+}
+
+
+# MARK: worker
+class JobHeartbeat:
+    """
+    Send the heartbeats of a running job from a background thread, and interrupt the job
+    with a KeyboardInterrupt in the main thread when it is cancelled
+
+    The interruption is a SIGINT sent to the main thread, which also wakes it from blocking
+    system calls, so a job waiting on ffmpeg (`subprocess.run`) kills it and stops at once.
+    Sharded ffmpeg runs wait in the main thread as well and kill the processes of all their
+    shards when interrupted (see `utils.video.run_sharded`).
+    """
+
+    def __init__(self, upload_folder: str, job_id: int, interval: float = JOB_HEARTBEAT_INTERVAL):
+        self.upload_folder = upload_folder
+        self.job_id = job_id
+        self.interval = interval
+        self.cancelled = False
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stop(self):
+        """Stop the heartbeats, after which the job can no longer be interrupted"""
+        with self._lock:
+            self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                carry_on = heartbeat_job(self.upload_folder, self.job_id, current_progress())
+            except sqlite3.Error as e:
+                print(f"Error sending the heartbeat of job {self.job_id}: {e}")
+                continue
+            with self._lock:
+                if not carry_on and not self._stopped.is_set():
+                    self.cancelled = True
+                    signal.pthread_kill(threading.main_thread().ident, signal.SIGINT)
+                    return
+
+
+def _publish_progress(upload_folder: str, job_id: int, progress: Dict[str, Any]):
+    try:
+        set_job_progress(upload_folder, job_id, progress)
+    except sqlite3.Error as e:
+        # Progress is informative, the next update or heartbeat carries it
+        print(f"Error publishing the progress of job {job_id}: {e}")
+
+
+def run_job(upload_folder: str, job: Dict[str, Any]):
+    """
+    Run a claimed job, tracking its progress and peak memory, and record its outcome
+    """
+    print(f"Running job {job['id']}: {job['stage']} of {job['video_uuid']} (attempt {job['attempts']})")
+    start_time = time.time()
+    heartbeat = JobHeartbeat(upload_folder, job["id"])
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        # The GPU peak of this job, not of the jobs this worker ran before
+        torch.cuda.reset_peak_memory_stats()
+    try:
+        with PeakMemorySampler(interval=0.5) as sampler:
+            publish = functools.partial(_publish_progress, upload_folder, job["id"])
+            with track_progress(publish, lambda: sampler.peak_bytes), heartbeat:
+                STAGE_HANDLERS[job["stage"]](upload_folder, job["video_uuid"], job["params"])
+                # Inside the try, a cancellation may interrupt the job until the heartbeats stop
+                heartbeat.stop()
+    except KeyboardInterrupt:
+        if not heartbeat.cancelled:
+            # The worker is stopping, the job goes back to the queue for another worker
+            release_job(upload_folder, job["id"])
+            raise
+        fail_job(upload_folder, job["id"], "Cancelled")
+        print(f"Cancelled job {job['id']}")
+    except Exception as e:
+        traceback.print_exc()
+        job = fail_job(upload_folder, job["id"], str(e))
+        print(f"Error in job {job['id']}: {e} ({job['status']} after {job['attempts']} attempts)")
+    else:
+        complete_job(upload_folder, job["id"])
+        print(f"Completed job {job['id']} in {time.time() - start_time:.2f} seconds")
+
+
+def run_worker(stages: List[str], upload_folder: str = UPLOAD_FOLDER, poll_interval: float = JOB_POLL_INTERVAL):
+    """
+    Claim and run the jobs of `stages` until the worker is interrupted (SIGINT or SIGTERM)
+    """
+    # Cancellations interrupt the main thread with SIGINT, which a worker process started by
+    # another process may be ignoring
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    worker = worker_name()
+    print(f"Worker {worker} running {', '.join(stages)} jobs")
+    try:
+        while True:
+            job = claim_job(upload_folder, stages, worker)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+            run_job(upload_folder, job)
+    except KeyboardInterrupt:
+        print(f"Worker {worker} stopped")
+
+
+class WorkerPool:
+    """
+    Worker processes started by the API, one per concurrent job of every stage, restarted
+    when they exit
+    """
+
+    def __init__(self, upload_folder: str = UPLOAD_FOLDER, concurrency: Optional[Dict[str, int]] = None):
+        self.upload_folder = upload_folder
+        concurrency = JOB_CONCURRENCY if concurrency is None else concurrency
+        self.slots = [stage for stage, count in concurrency.items() for _ in range(count)]
+        # Models may use CUDA, which does not survive a fork
+        self._context = multiprocessing.get_context("spawn")
+        self._processes: List[multiprocessing.Process] = []
+        self._stopped = threading.Event()
+        self._supervisor = threading.Thread(target=self._supervise, daemon=True)
+
+    def _start_worker(self, stage: str) -> multiprocessing.Process:
+        process = self._context.Process(target=run_worker, args=([stage], self.upload_folder), name=f"{stage}-worker")
+        process.start()
+        return process
+
+    def start(self):
+        self._processes = [self._start_worker(stage) for stage in self.slots]
+        self._supervisor.start()
+
+    def _supervise(self):
+        while not self._stopped.wait(JOB_POLL_INTERVAL):
+            for slot, process in enumerate(self._processes):
+                if process.is_alive() or self._stopped.is_set():
+                    continue
+                print(f"Worker {process.name} exited with code {process.exitcode}, restarting it")
+                release_worker_jobs(self.upload_folder, worker_name(process.pid))
+                self._processes[slot] = self._start_worker(self.slots[slot])
+
+    def stop(self, timeout: float = 10):
+        """Interrupt the workers, their running jobs go back to the queue"""
+        self._stopped.set()
+        if self._supervisor.is_alive():
+            self._supervisor.join()
+        for process in self._processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                # Stuck in native code, its job is queued again without waiting for the heartbeat timeout
+                process.terminate()
+                process.join()
+                release_worker_jobs(self.upload_folder, worker_name(process.pid))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the processing jobs of the job queue")
+    parser.add_argument("--stages", nargs="+", choices=JOB_STAGES, default=JOB_STAGES)
+    parser.add_argument("--upload-folder", default=UPLOAD_FOLDER)
+    args = parser.parse_args()
+    run_worker(args.stages, args.upload_folder)
@@ -1,6 +1,6 @@
 import React, { useState, useRef, useEffect, forwardRef } from 'react';
 import ReactPlayer from 'react-player';
-import { MainviewResponse } from '@/services/api/video';
+import { getThumbnailUrl, MainviewResponse, ThumbnailIndex } from '@/services/api/video';
 import { Play, Pause, SkipBack, SkipForward, Volume2, VolumeX, RotateCcw, RotateCw, Check } from 'lucide-react';
 import SegmentationMarkerOverlay from '@/components/overlays/SegmentationMarkerOverlay';
 
@@ -11,10 +11,12 @@ interface ReactPlayerWrapperProps {
   onPlayerUpdates?: (currentTime: number, duration: number, playing: boolean) => void;
   onSeek?: (frame: number) => void;
   currentStage: string;
+  videoId?: string;
+  thumbnailIndex?: ThumbnailIndex;
 }
 
 const VideoPlayer = forwardRef<ReactPlayer, ReactPlayerWrapperProps>(
-  ({ src, onFrameChange, onPlayerUpdates, mainviewResponse, onSeek, currentStage }, ref) => {
+  ({ src, onFrameChange, onPlayerUpdates, mainviewResponse, onSeek, currentStage, videoId, thumbnailIndex }, ref) => {
     const playerRef = useRef<ReactPlayer>(null);
     const progressBarRef = useRef<HTMLDivElement>(null);
 
@@ -164,6 +166,48 @@ const VideoPlayer = forwardRef<ReactPlayer, ReactPlayerWrapperProps>(
       playerRef.current?.seekTo(percentage);
     };
 
+    // Timeline preview: hovered position on the progress bar, as a fraction of its width
+    const [hoverPosition, setHoverPosition] = useState<number | null>(null);
+
+    const handleProgressBarHover = (e: React.MouseEvent<HTMLDivElement>) => {
+      if (!progressBarRef.current) return;
+
+      const rect = progressBarRef.current.getBoundingClientRect();
+      setHoverPosition(Math.max(0, Math.min(1, (e.clientX - rect.left) / rect.width)));
+    };
+
+    // Sprite sheet tile of the hovered time
+    const renderThumbnailPreview = () => {
+      if (hoverPosition === null || !thumbnailIndex || !videoId || duration <= 0) return null;
+
+      const { interval, width, height, columns, rows, count, sprites } = thumbnailIndex;
+      const hoverTime = hoverPosition * duration;
+      const index = Math.min(count - 1, Math.floor(hoverTime / interval));
+      if (index < 0) return null;
+
+      const tilesPerSprite = columns * rows;
+      const tile = index % tilesPerSprite;
+      const column = tile % columns;
+      const row = Math.floor(tile / columns);
+
+      return (
+        <div
+          className='pointer-events-none absolute bottom-4 z-20 -translate-x-1/2 overflow-hidden rounded border border-gray-300 bg-black shadow'
+          style={{ left: `${hoverPosition * 100}%` }}
+        >
+          <div
+            style={{
+              width,
+              height,
+              backgroundImage: `url(${getThumbnailUrl(videoId, sprites[Math.floor(index / tilesPerSprite)])})`,
+              backgroundPosition: `-${column * width}px -${row * height}px`,
+            }}
+          />
+          <div className='bg-black px-1 text-center text-xs text-white'>{formatTime(hoverTime)}</div>
+        </div>
+      );
+    };
+
     // Update time-related info
     useEffect(() => {
       if (onPlayerUpdates) {
@@ -233,7 +277,12 @@ const VideoPlayer = forwardRef<ReactPlayer, ReactPlayerWrapperProps>(
             className='relative h-2 w-full cursor-pointer rounded-full bg-gray-200'
             ref={progressBarRef}
             onClick={handleProgressBarClick}
+            onMouseMove={handleProgressBarHover}
+            onMouseLeave={() => setHoverPosition(null)}
           >
+            {/* Thumbnail preview */}
+            {renderThumbnailPreview()}
+
             {/* Buffer indicator */}
             <div
               className='absolute top-0 left-0 h-full rounded-full bg-gray-300'
@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef, forwardRef, useImperativeHandle } from 'react';
 import VideoPlayer from './VideoPlayer';
-import { getMainviewData, MainviewResponse } from '@/services/api/video';
+import { getMainviewData, getThumbnailIndex, MainviewResponse, ThumbnailIndex } from '@/services/api/video';
 import ReactPlayer from 'react-player';
 
 interface VideoPlayerSectionProps {
@@ -18,6 +18,7 @@ const VideoPlayerSection = forwardRef<VideoPlayerSectionRef, VideoPlayerSectionP
   ({ videoUrl, videoId, onFrameUpdate, stage }, ref) => {
     const [currentFrame, setCurrentFrame] = useState(0);
     const [mainviewData, setMainviewData] = useState<MainviewResponse | null>(null);
+    const [thumbnailIndex, setThumbnailIndex] = useState<ThumbnailIndex | null>(null);
     const [duration, setDuration] = useState(0);
     const [currentTime, setCurrentTime] = useState(0);
     const [playing, setPlaying] = useState(false);
@@ -61,6 +62,19 @@ const VideoPlayerSection = forwardRef<VideoPlayerSectionRef, VideoPlayerSectionP
       }
     }, [videoId]);
 
+    // Fetch the timeline preview thumbnails when videoId changes
+    useEffect(() => {
+      setThumbnailIndex(null);
+
+      if (videoId) {
+        getThumbnailIndex(videoId)
+          .then((index) => setThumbnailIndex(index))
+          .catch((error) => {
+            console.error('Failed to fetch thumbnail index:', error);
+          });
+      }
+    }, [videoId]);
+
     // Refresh main view data when stage changes to preprocess
     useEffect(() => {
       // Only refresh if we're on the preprocess stage
@@ -114,6 +128,8 @@ const VideoPlayerSection = forwardRef<VideoPlayerSectionRef, VideoPlayerSectionP
             ref={setPlayerRef}
             onSeek={handleSeek}
             currentStage={stage}
+            videoId={videoId}
+            thumbnailIndex={thumbnailIndex || undefined}
           />
         </div>
       </div>
@@ -2,7 +2,7 @@ import { useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import dayjs from 'dayjs';
 
-import { uploadVideo } from '@/services/api/video';
+import { uploadVideoResumable } from '@/services/api/video';
 import useFileUploadStore, { selectUploadedFiles } from '@/store/fileUploadStore';
 
 interface UploadPageProps {
@@ -39,7 +39,7 @@ export default function UploadPage({ setCompletedSteps, completedSteps }: Upload
     setUploadError(null);
 
     try {
-      const response = await uploadVideo(file);
+      const response = await uploadVideoResumable(file);
       console.log('Upload successful:', response);
 
       // Refresh file lists after successful upload
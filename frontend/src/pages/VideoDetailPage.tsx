@@ -3,9 +3,10 @@ import { useParams } from 'react-router-dom';
 import { BASE_API_URL } from '@/services/api/config';
 import VideoPlayerSection, { VideoPlayerSectionRef } from '@/components/video/VideoPlayerSection';
 import { getMainviewData, MainviewResponse, generateMainView, createProcessingEventSource } from '@/services/api/video';
-import { get_sam2_model_result, getSegmentationStatus, runSegmentation } from '@/services/api/segmentation';
+import { get_sam2_model_result, runSegmentation } from '@/services/api/segmentation';
+import { createJobEventSource } from '@/services/api/jobs';
 import useSegmentationStore, { Point } from '@/store/segmentationStore';
-import { run_yolo_pose_v11, get_yolo_pose_v11, get_yolo_pose_v11_status } from '@/services/api/pose';
+import { run_yolo_pose_v11, get_yolo_pose_v11 } from '@/services/api/pose';
 import ProcessSidemenu, { ProcessingStage, StageConfig } from '@/components/processSidemenu';
 import { relocateMarkerDataToCorrectChunk, isValidMarkerInput } from '@/utils/segmentation';
 
@@ -172,9 +173,9 @@ const VideoDetailPage: React.FC = () => {
         }
       });
 
-      // Handle errors
-      eventSource.addEventListener('error', (event) => {
-        console.error('SSE error:', event);
+      // Handle failed and cancelled jobs
+      eventSource.addEventListener('failed', (event) => {
+        console.error('Main view detection failed:', event.data);
         if (eventSource) {
           eventSource.close();
         }
@@ -182,6 +183,15 @@ const VideoDetailPage: React.FC = () => {
         setShowSkipButton(true);
       });
 
+      // The browser reconnects after a dropped connection, unless the server refused the stream
+      eventSource.addEventListener('error', (event) => {
+        console.error('SSE error:', event);
+        if (eventSource?.readyState === EventSource.CLOSED) {
+          setIsProcessing(false);
+          setShowSkipButton(true);
+        }
+      });
+
       // Return the event source for cleanup
       return eventSource;
     } catch (error) {
@@ -190,6 +200,48 @@ const VideoDetailPage: React.FC = () => {
     }
   };
 
+  // Follow a segmentation or pose job with SSE until it completes or fails
+  const listenForJobUpdates = (videoId: string, stage: 'segmentation' | 'pose', label: string) => {
+    const eventSource = createJobEventSource(videoId, stage);
+
+    // e.g. "processing: segmentation 120/480 frames, 3.2 fps, ETA 112.5 s"
+    eventSource.addEventListener('status', (event) => {
+      setProcessingStatus(`${label}: ${event.data}`);
+    });
+
+    eventSource.addEventListener('complete', () => {
+      eventSource.close();
+      setIsProcessing(false);
+
+      // Mark stage as completed
+      setCompletedStages((prev) => new Set([...prev, stage]));
+
+      // Move to next stage after a delay
+      setTimeout(() => moveToNextStage(), 1000);
+    });
+
+    // Sent for failed and cancelled jobs
+    eventSource.addEventListener('failed', (event) => {
+      eventSource.close();
+      const job = JSON.parse(event.data);
+      setProcessingStatus(`${label} failed: ${job.error ?? job.status}`);
+      setIsProcessing(false);
+      setShowSkipButton(true);
+    });
+
+    // The browser reconnects after a dropped connection and the stream resends the current
+    // state of the job, unless the server refused the stream
+    eventSource.addEventListener('error', () => {
+      if (eventSource.readyState === EventSource.CLOSED) {
+        setProcessingStatus(`${label} updates disconnected`);
+        setIsProcessing(false);
+        setShowSkipButton(true);
+      }
+    });
+
+    return eventSource;
+  };
+
   const skipCurrentStage = () => {
     // Reset skip button state
     setShowSkipButton(false);
@@ -308,35 +360,11 @@ const VideoDetailPage: React.FC = () => {
       console.log('Input:', inputToSend);
       await runSegmentation(urlUUID, inputToSend);
 
-      // Poll for status updates
-      const statusCheckInterval = setInterval(async () => {
-        try {
-          const status = await getSegmentationStatus(urlUUID);
-
-          if (status.status === 'completed') {
-            clearInterval(statusCheckInterval);
-            setIsProcessing(false);
-
-            // Mark stage as completed
-            const updatedCompletedStages = new Set(completedStages);
-            updatedCompletedStages.add('segmentation');
-            setCompletedStages(updatedCompletedStages);
-
-            // Move to next stage after a delay
-            setTimeout(() => moveToNextStage(), 1000);
-          } else if (status.status.startsWith('error') || status.status === 'failed') {
-            clearInterval(statusCheckInterval);
-            setProcessingStatus(`Segmentation failed: ${status.status}`);
-            setIsProcessing(false);
-            setShowSkipButton(true);
-          }
-        } catch (error) {
-          console.error('Error checking segmentation status:', error);
-        }
-      }, 60000); // takes a while so every 1 minute
+      // Follow the job instead of polling its status
+      const eventSource = listenForJobUpdates(urlUUID, 'segmentation', 'Segmentation');
 
-      // Clean up interval if component unmounts
-      return () => clearInterval(statusCheckInterval);
+      // Close the connection if component unmounts
+      return () => eventSource.close();
     } catch (error) {
       console.error('Error running segmentation:', error);
       setProcessingStatus('Error running segmentation');
@@ -354,36 +382,11 @@ const VideoDetailPage: React.FC = () => {
     try {
       await run_yolo_pose_v11(urlUUID);
 
-      // Poll for status updates
-      const statusCheckInterval = setInterval(async () => {
-        try {
-          const status = await get_yolo_pose_v11_status(urlUUID);
-          setProcessingStatus(`Pose detection: ${status.message}`);
-
-          if (status.success && status.message === 'completed') {
-            clearInterval(statusCheckInterval);
-            setIsProcessing(false);
-
-            // Mark stage as completed
-            const updatedCompletedStages = new Set(completedStages);
-            updatedCompletedStages.add('pose');
-            setCompletedStages(updatedCompletedStages);
-
-            // Move to next stage after a delay
-            setTimeout(() => moveToNextStage(), 1000);
-          } else if (!status.success || status.message === 'failed') {
-            clearInterval(statusCheckInterval);
-            setProcessingStatus(`Pose detection failed: ${status.message}`);
-            setIsProcessing(false);
-            setShowSkipButton(true);
-          }
-        } catch (error) {
-          console.error('Error checking pose detection status:', error);
-        }
-      }, 2000);
+      // Follow the job instead of polling its status
+      const eventSource = listenForJobUpdates(urlUUID, 'pose', 'Pose detection');
 
-      // Clean up interval if component unmounts
-      return () => clearInterval(statusCheckInterval);
+      // Close the connection if component unmounts
+      return () => eventSource.close();
     } catch (error) {
       console.error('Error starting pose detection:', error);
       setProcessingStatus(`Error: ${error instanceof Error ? error.message : 'Unknown error'}`);
@@ -540,7 +543,7 @@ const VideoDetailPage: React.FC = () => {
           {/* Video player section */}
           <div className='flex-1 overflow-hidden'>
             <VideoPlayerSection
-              videoUrl={`${BASE_API_URL}/video/stream/${urlUUID}`}
+              videoUrl={`${BASE_API_URL}/video/proxy/${urlUUID}`}
               stage={activeStage}
               videoId={urlUUID || ''}
               onFrameUpdate={handleFrameUpdate}
@@ -0,0 +1,48 @@
+import axios from 'axios';
+import { BASE_API_URL } from './config';
+
+// Derive API URL for job endpoints
+const API_URL = `${BASE_API_URL}/jobs`;
+
+export type JobStage = 'prepare' | 'thumbnails' | 'mainview' | 'segmentation' | 'pose';
+
+export interface JobProgress {
+  step: string | null;
+  done: number;
+  total: number | null;
+  fps: number | null;
+  eta_seconds: number | null;
+  elapsed_seconds: number;
+  peak_bytes: number;
+  gpu_peak_bytes: number | null;
+}
+
+export interface Job {
+  id: number;
+  stage: JobStage;
+  video_uuid: string;
+  priority: number;
+  status: 'queued' | 'running' | 'completed' | 'failed' | 'cancelled';
+  attempts: number;
+  max_attempts: number;
+  cancel_requested: boolean;
+  error: string | null;
+  progress: JobProgress | null;
+}
+
+// Live updates of the jobs of a video ('job', 'status', 'complete' and 'failed' events),
+// optionally of a single stage. The browser reconnects on its own when the connection drops
+export const createJobEventSource = (videoUUID: string, stage?: JobStage): EventSource => {
+  const query = stage ? `?stage=${stage}` : '';
+  return new EventSource(`${API_URL}/events/${videoUUID}${query}`);
+};
+
+export const cancelJob = async (jobId: number): Promise<Job> => {
+  try {
+    const response = await axios.delete(`${API_URL}/${jobId}`);
+    return response.data;
+  } catch (error) {
+    console.error('Error cancelling job:', error);
+    throw error;
+  }
+};
@@ -1,5 +1,6 @@
 import axios from 'axios';
 import { BASE_API_URL } from './config';
+import { JobProgress } from './jobs';
 import { MarkerInput, Point } from '@/store/segmentationStore';
 // Derive API URL for segmentation endpoints
 const API_URL = `${BASE_API_URL}/segmentation`;
@@ -38,6 +39,8 @@ interface SAM2ModelStatus {
   is_processing: boolean;
   has_segmentation: boolean;
   status: string;
+  job_id?: number | null;
+  progress?: JobProgress | null;
 }
 
 export const get_sam2_model_result = async (video_uuid: string): Promise<SAM2ModelResult> => {
@@ -1,5 +1,6 @@
 import axios from 'axios';
 import { BASE_API_URL } from './config';
+import { JobProgress } from './jobs';
 
 const API_URL = `${BASE_API_URL}/video`;
 
@@ -7,11 +8,22 @@ const API_URL = `${BASE_API_URL}/video`;
 // Each timestamp is [start, end, start_frame, end_frame]
 type MainviewTimestamp = [number, number, number, number];
 
+// A view (camera angle) found among the scanned frames
+export interface MainviewView {
+  hash: string;
+  support: number; // Number of scanned frames showing the view
+  frame: number; // Representative frame, can be labelled as a reference frame
+  main: boolean;
+}
+
 export interface MainviewResponse {
   fps: number;
   total_frames: number;
   timestamps: MainviewTimestamp[];
   chunks: number[][][];
+  views?: MainviewView[];
+  reference_frames?: number[] | null;
+  chunk_peak_bytes?: number[];
 }
 
 export const getMainviewData = async (videoUUID: string): Promise<MainviewResponse> => {
@@ -29,9 +41,15 @@ export const getMainviewData = async (videoUUID: string): Promise<MainviewRespon
   }
 };
 
-export const generateMainView = async (videoUUID: string): Promise<{ status: string; video_uuid: string }> => {
+export const generateMainView = async (
+  videoUUID: string,
+  referenceFrames?: number[]
+): Promise<{ status: string; video_uuid: string }> => {
   try {
-    const response = await axios.post(`${API_URL}/mainview/${videoUUID}`);
+    const response = await axios.post(
+      `${API_URL}/mainview/${videoUUID}`,
+      referenceFrames ? { reference_frames: referenceFrames } : undefined
+    );
     return response.data;
   } catch (error) {
     if (axios.isAxiosError(error) && error.response) {
@@ -44,6 +62,44 @@ export const generateMainView = async (videoUUID: string): Promise<{ status: str
   }
 };
 
+// URL of a single frame as JPEG, optionally scaled down to `width` pixels
+export const getFrameUrl = (videoUUID: string, frameIndex: number, width?: number, quality?: number): string => {
+  const params = new URLSearchParams();
+  if (width !== undefined) params.set('width', String(width));
+  if (quality !== undefined) params.set('quality', String(quality));
+  const query = params.toString();
+  return `${API_URL}/frame/${videoUUID}/${frameIndex}${query ? `?${query}` : ''}`;
+};
+
+// Timeline preview thumbnails, tiled into sprite sheets of columns x rows tiles
+export interface ThumbnailIndex {
+  interval: number;
+  width: number;
+  height: number;
+  columns: number;
+  rows: number;
+  count: number;
+  duration: number;
+  sprites: string[];
+}
+
+export const getThumbnailUrl = (videoUUID: string, filename: string): string =>
+  `${API_URL}/thumbnails/${videoUUID}/${filename}`;
+
+// Returns null while the thumbnails are not generated yet
+export const getThumbnailIndex = async (videoUUID: string): Promise<ThumbnailIndex | null> => {
+  try {
+    const response = await axios.get<ThumbnailIndex>(getThumbnailUrl(videoUUID, 'thumbnails.json'));
+    return response.data;
+  } catch (error) {
+    if (axios.isAxiosError(error) && error.response?.status === 404) {
+      return null;
+    }
+    console.error('Error fetching thumbnail index:', error);
+    throw error;
+  }
+};
+
 export interface UploadResponse {
   UUID: string;
   original_filename: string;
@@ -74,6 +130,79 @@ export async function uploadVideo(file: File): Promise<UploadResponse> {
   }
 }
 
+interface UploadSession {
+  upload_id: string;
+  offset: number;
+  size: number;
+  chunk_size: number;
+}
+
+const sha256Hex = async (data: ArrayBuffer): Promise<string> => {
+  const digest = await crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, '0'))
+    .join('');
+};
+
+// Resumable uploads are keyed by file identity so an interrupted upload of the same file
+// continues from the last acknowledged byte instead of restarting from zero
+const uploadSessionKey = (file: File) => `upload-session:${file.name}:${file.size}:${file.lastModified}`;
+
+const getOrCreateUploadSession = async (file: File): Promise<UploadSession> => {
+  const storedUploadId = localStorage.getItem(uploadSessionKey(file));
+  if (storedUploadId) {
+    try {
+      const response = await axios.get<UploadSession>(`${API_URL}/upload/sessions/${storedUploadId}`);
+      return response.data;
+    } catch {
+      localStorage.removeItem(uploadSessionKey(file));
+    }
+  }
+
+  const response = await axios.post<UploadSession>(`${API_URL}/upload/sessions`, {
+    filename: file.name,
+    size: file.size,
+    content_type: file.type,
+  });
+  localStorage.setItem(uploadSessionKey(file), response.data.upload_id);
+  return response.data;
+};
+
+export async function uploadVideoResumable(
+  file: File,
+  onProgress?: (uploadedBytes: number, totalBytes: number) => void
+): Promise<UploadResponse> {
+  try {
+    const session = await getOrCreateUploadSession(file);
+    let offset = session.offset;
+
+    while (offset < file.size) {
+      const chunk = await file.slice(offset, offset + session.chunk_size).arrayBuffer();
+      const response = await axios.put(`${API_URL}/upload/sessions/${session.upload_id}`, chunk, {
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          'Upload-Offset': String(offset),
+          'Upload-Checksum': await sha256Hex(chunk),
+        },
+      });
+      offset = response.data.offset;
+      onProgress?.(offset, file.size);
+    }
+
+    const response = await axios.post(`${API_URL}/upload/sessions/${session.upload_id}/finalize`);
+    localStorage.removeItem(uploadSessionKey(file));
+    return response.data;
+  } catch (error) {
+    if (axios.isAxiosError(error) && error.response) {
+      console.error('Error uploading video:', error.response.data);
+      throw new Error(error.response.data.detail || 'Failed to upload video');
+    } else {
+      console.error('Error uploading video:', error);
+      throw error;
+    }
+  }
+}
+
 export interface FileInfo {
   UUID: string;
   original_filename: string;
@@ -87,6 +216,7 @@ export interface FileInfo {
   codec: string;
   size: number;
   created: number; // Unix timestamp
+  stage?: 'uploaded' | 'frames' | 'mainview' | 'segmentation' | 'pose'; // Last completed processing stage
 }
 
 export const getUploadedFiles = async (): Promise<FileInfo[]> => {
@@ -110,6 +240,8 @@ export interface ProcessingStatus {
   is_processing: boolean;
   has_mainview: boolean;
   video_uuid: string;
+  job_id?: number | null;
+  progress?: JobProgress | null;
 }
 
 export const getProcessingStatus = async (videoUUID: string): Promise<ProcessingStatus> => {